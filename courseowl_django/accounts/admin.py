@@ -1,4 +1,11 @@
 from django.contrib import admin
-from accounts.models import UserProfile
+from accounts.models import UserProfile, CourseInteraction
 
 admin.site.register(UserProfile)
+
+
+class CourseInteractionAdmin(admin.ModelAdmin):
+    list_display = ['user_profile', 'course', 'kind', 'created_at']
+    list_filter = ['kind']
+
+admin.site.register(CourseInteraction, CourseInteractionAdmin)
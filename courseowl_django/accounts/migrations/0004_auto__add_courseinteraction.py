@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+# CourseInteraction.kind of each course field of UserProfile
+INTERACTION_FIELDS = ((1, 'enrolled'), (2, 'completed'), (3, 'disliked'))
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'CourseInteraction'
+        db.create_table(u'accounts_courseinteraction', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('user_profile', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['accounts.UserProfile'], db_index=False)),
+            ('course', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['courses.Course'], db_index=False)),
+            ('kind', self.gf('django.db.models.fields.PositiveSmallIntegerField')()),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, db_index=True, blank=True)),
+        ))
+        db.send_create_signal(u'accounts', ['CourseInteraction'])
+
+        # Adding unique constraint on 'CourseInteraction', fields ['user_profile', 'kind', 'course']
+        db.create_unique(u'accounts_courseinteraction', ['user_profile_id', 'kind', 'course_id'])
+
+        # Adding index on 'CourseInteraction', fields ['course', 'kind', 'user_profile']
+        db.create_index(u'accounts_courseinteraction', ['course_id', 'kind', 'user_profile_id'])
+
+        # Filling it in from the course fields of UserProfile, as of now
+        now = datetime.datetime.now()
+        for kind, field in INTERACTION_FIELDS:
+            db.execute('INSERT INTO accounts_courseinteraction (user_profile_id, course_id, kind, created_at) '
+                       'SELECT userprofile_id, course_id, %%s, %%s FROM accounts_userprofile_%s' % field, [kind, now])
+
+    def backwards(self, orm):
+        # Removing index on 'CourseInteraction', fields ['course', 'kind', 'user_profile']
+        db.delete_index(u'accounts_courseinteraction', ['course_id', 'kind', 'user_profile_id'])
+
+        # Removing unique constraint on 'CourseInteraction', fields ['user_profile', 'kind', 'course']
+        db.delete_unique(u'accounts_courseinteraction', ['user_profile_id', 'kind', 'course_id'])
+
+        # Deleting model 'CourseInteraction'
+        db.delete_table(u'accounts_courseinteraction')
+
+
+    models = {
+        u'accounts.courseinteraction': {
+            'Meta': {'unique_together': "(('user_profile', 'kind', 'course'),)", 'object_name': 'CourseInteraction', 'index_together': "[('course', 'kind', 'user_profile')]"},
+            'course': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['courses.Course']", 'db_index': 'False'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kind': ('django.db.models.fields.PositiveSmallIntegerField', [], {}),
+            'user_profile': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['accounts.UserProfile']", 'db_index': 'False'})
+        },
+        u'accounts.userprofile': {
+            'Meta': {'object_name': 'UserProfile'},
+            'completed': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'completed_classes'", 'blank': 'True', 'to': u"orm['courses.Course']"}),
+            'disliked': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'disliked_classes'", 'blank': 'True', 'to': u"orm['courses.Course']"}),
+            'enrolled': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'enrolled_classes'", 'blank': 'True', 'to': u"orm['courses.Course']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'interests': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['courses.Subject']", 'symmetrical': 'False', 'blank': 'True'}),
+            'providers': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['courses.Provider']", 'symmetrical': 'False', 'blank': 'True'}),
+            'user': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['auth.User']", 'unique': 'True'})
+        },
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Group']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Permission']"}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'courses.course': {
+            'Meta': {'object_name': 'Course'},
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '3000'}),
+            'fingerprint': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '40', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instructor': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'db_index': 'True'}),
+            'provider': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['courses.Provider']", 'null': 'True', 'blank': 'True'}),
+            'similarCourses': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'similarCourses_rel_+'", 'to': u"orm['courses.Course']"}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['courses.Source']", 'null': 'True', 'blank': 'True'}),
+            'subjects': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['courses.Subject']", 'symmetrical': 'False'}),
+            'url': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '1000', 'blank': 'True'})
+        },
+        u'courses.provider': {
+            'Meta': {'object_name': 'Provider'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'courses.source': {
+            'Meta': {'object_name': 'Source'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '150'})
+        },
+        u'courses.subject': {
+            'Meta': {'object_name': 'Subject'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['accounts']
\ No newline at end of file
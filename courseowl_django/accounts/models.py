@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.signals import m2m_changed
 from django.contrib.auth.models import User
 
 
@@ -12,3 +13,66 @@ class UserProfile(models.Model):
 
     def __unicode__(self):
         return self.user.email
+
+
+class CourseInteraction(models.Model):
+    """
+    A course a user enrolled in, completed or disliked. The enrolled, completed and disliked fields of
+    UserProfile are mirrored here in one table, so the recommender can read all of them in one scan of
+    the (user_profile, kind, course) index. created_at is when the course was added to the field.
+    """
+    ENROLLED = 1
+    COMPLETED = 2
+    DISLIKED = 3
+    KINDS = (
+        (ENROLLED, 'enrolled'),
+        (COMPLETED, 'completed'),
+        (DISLIKED, 'disliked'),
+    )
+
+    user_profile = models.ForeignKey(UserProfile, db_index=False)
+    course = models.ForeignKey('courses.Course', db_index=False)
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user_profile', 'kind', 'course')
+        index_together = [('course', 'kind', 'user_profile')]
+
+    def __unicode__(self):
+        return u'%s %s %s' % (self.user_profile, self.get_kind_display(), self.course)
+
+
+def sync_interactions(kind, instance, action, reverse, pk_set):
+    """
+    Applies a change to one of the course fields of UserProfile to CourseInteraction. instance is the
+    profile, or the course if the change was made from the course's side.
+    """
+    if reverse:
+        interactions = CourseInteraction.objects.filter(kind=kind, course=instance.pk)
+        pairs = [(pk, instance.pk) for pk in pk_set or ()]
+        other_side = 'user_profile__in'
+    else:
+        interactions = CourseInteraction.objects.filter(kind=kind, user_profile=instance.pk)
+        pairs = [(instance.pk, pk) for pk in pk_set or ()]
+        other_side = 'course__in'
+
+    if action == 'post_add' and pairs:
+        CourseInteraction.objects.bulk_create([CourseInteraction(user_profile_id=user_profile_id, course_id=course_id,
+                                                                 kind=kind) for user_profile_id, course_id in pairs])
+    elif action == 'post_remove' and pk_set:
+        interactions.filter(**{other_side: pk_set}).delete()
+    elif action == 'post_clear':
+        interactions.delete()
+
+
+def interaction_receiver(kind):
+    def receiver(sender, instance, action, reverse, pk_set, **kwargs):
+        sync_interactions(kind, instance, action, reverse, pk_set)
+    return receiver
+
+
+for field_name, kind in (('enrolled', CourseInteraction.ENROLLED), ('completed', CourseInteraction.COMPLETED),
+                         ('disliked', CourseInteraction.DISLIKED)):
+    m2m_changed.connect(interaction_receiver(kind), sender=getattr(UserProfile, field_name).through, weak=False,
+                        dispatch_uid='sync_%s_interactions' % field_name)
@@ -1,7 +1,13 @@
+from django.conf import settings
+from django.contrib.sites.models import Site
 from django.test import TestCase
 from django.test.client import Client
-from accounts.models import UserProfile, User
+from allauth.socialaccount.models import SocialApp
+from accounts.models import UserProfile, User, CourseInteraction
+from courses.models import Course
+from accounts.urls import urlpatterns
 from accounts.views import check_valid_password, valid_email_address, username_md5, unique_user
+from courseowl_django.tests.budgets import PASSWORD, QueryBudgetMixin
 
 
 class AccountsTest(TestCase):
@@ -129,3 +135,66 @@ class AccountsTest(TestCase):
 
         self.assertEqual(response.status_code, 302)
         self.assertFalse(self.client.login(username='demo_user', password='qwerty123'))  # make sure user cannot log in
+
+
+class CourseInteractionTests(TestCase):
+    def setUp(self):
+        self.user_profile = UserProfile.objects.create(user=User.objects.create_user(username='owl', password='x'))
+        self.courses = [Course.objects.create(name='Course %d' % i, description='', url='http://example.com/%d' % i)
+                        for i in range(3)]
+
+    def interactions(self):
+        return sorted(CourseInteraction.objects.values_list('user_profile_id', 'kind', 'course_id'))
+
+    def test_interactions_follow_course_fields(self):
+        """
+        Adding, removing and clearing courses on either side is mirrored in CourseInteraction
+        """
+        profile_id = self.user_profile.id
+        first, second, third = [course.id for course in self.courses]
+        self.user_profile.enrolled.add(*self.courses)
+        self.user_profile.enrolled.add(self.courses[0])  # already there
+        self.user_profile.disliked.add(self.courses[1])
+        self.assertEqual(self.interactions(), [(profile_id, CourseInteraction.ENROLLED, first),
+                                               (profile_id, CourseInteraction.ENROLLED, second),
+                                               (profile_id, CourseInteraction.ENROLLED, third),
+                                               (profile_id, CourseInteraction.DISLIKED, second)])
+
+        self.user_profile.enrolled.remove(self.courses[0])
+        self.courses[1].enrolled_classes.remove(self.user_profile)
+        self.courses[0].completed_classes.add(self.user_profile)
+        self.assertEqual(self.interactions(), [(profile_id, CourseInteraction.ENROLLED, third),
+                                               (profile_id, CourseInteraction.COMPLETED, first),
+                                               (profile_id, CourseInteraction.DISLIKED, second)])
+
+        self.user_profile.enrolled.clear()
+        self.courses[1].disliked_classes.clear()
+        self.assertEqual(self.interactions(), [(profile_id, CourseInteraction.COMPLETED, first)])
+
+
+class AccountsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlpatterns = urlpatterns
+
+    def setUp(self):
+        super(AccountsQueryBudgetTests, self).setUp()
+        # the login and sign up pages need the site and its social login apps
+        site, created = Site.objects.get_or_create(id=settings.SITE_ID, defaults={'domain': 'courseowl.com',
+                                                                                 'name': 'CourseOwl'})
+        for provider in ('facebook', 'google'):
+            SocialApp.objects.create(provider=provider, name=provider, client_id='id', secret='secret').sites.add(site)
+        self.user.username = username_md5(self.user.email)  # as the login view expects
+        self.user.save()
+
+    def get_budgets(self):
+        passwords = {'password': PASSWORD, 'password_confirm': PASSWORD}
+        return [
+            ('login', 'get', None, 6),
+            ('login', 'post', {'email': self.user.email, 'password': PASSWORD}, 9),
+            ('email_signup', 'get', None, 5),
+            ('email_signup', 'post', dict(passwords, email='new@example.com'), 17),
+            ('profile', 'get', None, 31),
+            ('change_password', 'post', passwords, 5),
+            ('change_email', 'post', {'new_email': 'changed@example.com'}, 6),
+            ('logout', 'get', None, 13),
+            ('deactivate_account', 'get', None, 14),
+        ]
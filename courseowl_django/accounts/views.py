@@ -99,7 +99,7 @@ def profile(request):
     """
     current_user = request.user
     user_profile = UserProfile.objects.get(user=current_user)
-    enrolled_list = list(user_profile.enrolled.all())
+    enrolled_list = list(user_profile.enrolled.select_related('provider'))
     recommend_list = get_recommended_courses(user_profile)
     return render(request, 'accounts/profile.html', {'email': current_user.email, 'enrolled_list': enrolled_list,
                                                      'recommend_list': recommend_list})
@@ -134,12 +134,8 @@ def get_random_courses(num):
     """
     Get num random courses
     """
-    random_courses = []
-    random_course_ordered = Course.objects.order_by('?')
-    for i in range(num):
-        # Course.objects.order_by() returns a QuerySet, not a list - do lazy evaluation to avoid getting all Courses
-        random_courses.append(random_course_ordered[i])
-    return random_courses
+    # slicing the QuerySet limits the query, so not all Courses are fetched
+    return list(Course.objects.select_related('provider').order_by('?')[:num])
 
 
 @login_required
@@ -2,7 +2,9 @@ from django.http import HttpRequest
 from django.test import TestCase
 from django.test.client import Client
 import json
+from api.urls import urlpatterns
 from api.views import add_course, drop_course, get_similar_courses
+from courseowl_django.tests.budgets import QueryBudgetMixin
 from courses.models import Provider, Subject, Course
 from accounts.models import UserProfile, User
 from accounts.views import username_md5
@@ -236,6 +238,25 @@ class TestAPI(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual('{"success": false}', response.content)
 
+    def test_cached_responses_follow_edits(self):
+        """
+        Cached course info and course lists are served until the catalog changes
+        """
+        self.client.login(username='bob12345', password='bob123456')
+        course = self.test_course_1
+        self.assertTrue('Pottery 1' in json.loads(self.client.get('/api/courses/').content))
+        self.assertEqual(json.loads(self.client.post('/api/course_info/', {'course_id': course.id}).content)
+                         ['info']['name'], 'Pottery 1')
+
+        with self.assertNumQueries(1):  # the catalog versions
+            self.client.get('/api/courses/')
+
+        course.name = 'Ceramics'
+        course.save()
+        self.assertTrue('Ceramics' in json.loads(self.client.get('/api/courses/').content))
+        self.assertEqual(json.loads(self.client.post('/api/course_info/', {'course_id': course.id}).content)
+                         ['info']['name'], 'Ceramics')
+
     def test_similar_courses(self):
         """
         Test the /api/similar_courses/ endpoint for a logged in user
@@ -244,3 +265,25 @@ class TestAPI(TestCase):
         self.assertEqual(len(similar_courses), 2)
         self.assertIn(self.test_course_2, similar_courses)
         self.assertIn(self.test_course_3, similar_courses)
+
+
+class APIQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlpatterns = urlpatterns
+
+    def get_budgets(self):
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        course = Course.objects.exclude(enrolled_classes=self.profiles[0]).order_by('id')[0]
+        subject = Subject.objects.order_by('-id')[0]
+        return [
+            ('api_subjects', 'get', None, 4),
+            ('api_courses', 'get', None, 4),
+            ('enrolled_courses', 'get', None, 6),
+            ('liked_subjects', 'get', None, 6),
+            ('course_info', 'post', {'course_id': course.id}, 10),
+            ('like_subject', 'post', {'liked_subject': subject.id}, 8),
+            ('dislike_course', 'post', {'disliked_course': course.id}, 9),
+            ('complete_course', 'post', {'completed_course': course.id}, 7),
+            ('enroll', 'post', {'course_to_add': course.id}, 10),
+            ('drop', 'post', {'course_to_drop': course.id}, 10),
+            ('profiling_stats', 'get', None, 4),
+        ]
@@ -12,4 +12,5 @@ urlpatterns = patterns('',
                        url(r'^dislike_course', views.dislike_course, name='dislike_course'),
                        url(r'^complete_course', views.complete_course, name='complete_course'),
                        url(r'^course_info', views.course_info, name='course_info'),
+                       url(r'^profiling_stats', views.profiling_stats, name='profiling_stats'),
                        )
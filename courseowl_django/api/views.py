@@ -1,31 +1,34 @@
 import json
 from django.core.exceptions import ObjectDoesNotExist
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import HttpResponse
 from accounts.models import UserProfile
+from courseowl_django.profiling import get_view_stats
+from courseowl_django.replicas import replica_reads
+from courseowl_django.warmup import startup_times
+from courses.catalog import cached, get_course_names, get_subject_names
+from courses.search_backends import get_search_stats
 from courses.models import Subject, Course
 
 
+@replica_reads
 def json_subjects(request):
     """
     Return a JSON array of all the subjects in the CourseOwl database.
+    Cached until the subjects change.
     Method: GET
     """
-    subject_arr = []
-    for subject in Subject.objects.all():
-        subject_arr.append(subject.name)
-    return HttpResponse(json.dumps(subject_arr), content_type='application/json')
+    return HttpResponse(json.dumps(get_subject_names()), content_type='application/json')
 
 
+@replica_reads
 def json_courses(request):
     """
     Return a JSON array of all the courses in the CourseOwl database.
+    Cached until the courses change.
     Method: GET
     """
-    course_arr = []
-    for course in Course.objects.all():
-        course_arr.append(course.name)
-    return HttpResponse(json.dumps(course_arr), content_type='application/json')
+    return HttpResponse(json.dumps(get_course_names()), content_type='application/json')
 
 
 @login_required
@@ -176,34 +179,56 @@ def get_similar_courses(course):
 def course_info(request):
     """
     Returns a JSON dump of the information of a course given its courseID
+    Cached until the catalog changes.
     Method: POST, {'course_id': courseID#}
     """
     if request.method == "POST":
         try:
             course_id = request.POST.get('course_id')
-            the_course = Course.objects.get(id=course_id)
-            helpout_url = 'https://helpouts.google.com/search?q='
-
-            for word in the_course.name.split(' '):
-                helpout_url += word + '%20OR%20'
-            helpout_url = helpout_url[:-8]  # cutting off the last %20OR%20
-
-            subject_list = [subj.name.capitalize() for subj in the_course.subjects.all()]
-            similar_courses = get_similar_courses(the_course)
-
-            similar_courses_names = [course.name for course in similar_courses]
-            similar_courses_links = [course.url for course in similar_courses]
-
-            course_data = {'description': the_course.description, 'provider': the_course.provider.name,
-                           'subjects': subject_list, 'instructor': the_course.instructor,
-                           'name': the_course.name, 'url': the_course.url,
-                           'similar_courses_names': similar_courses_names,
-                           'similar_courses_links': similar_courses_links,
-                           'helpouturl': helpout_url
-            }
-
+            with replica_reads():
+                course_data = cached('course_info', lambda: get_course_data(course_id), parts=[course_id])
             return HttpResponse(json.dumps({'success': True, 'info': course_data}), content_type='application/json')
         except ObjectDoesNotExist:
             return HttpResponse(json.dumps({'success': False}), content_type='application/json')
     else:
         return HttpResponse(json.dumps({'success': False}), content_type='application/json')
+
+
+def get_course_data(course_id):
+    """
+    Returns the information course_info shows for a course
+    """
+    the_course = Course.objects.get(id=course_id)
+    helpout_url = 'https://helpouts.google.com/search?q='
+
+    for word in the_course.name.split(' '):
+        helpout_url += word + '%20OR%20'
+    helpout_url = helpout_url[:-8]  # cutting off the last %20OR%20
+
+    subject_list = [subj.name.capitalize() for subj in the_course.subjects.all()]
+    similar_courses = get_similar_courses(the_course)
+
+    similar_courses_names = [course.name for course in similar_courses]
+    similar_courses_links = [course.url for course in similar_courses]
+
+    course_data = {'description': the_course.description, 'provider': the_course.provider.name,
+                   'subjects': subject_list, 'instructor': the_course.instructor,
+                   'name': the_course.name, 'url': the_course.url,
+                   'similar_courses_names': similar_courses_names,
+                   'similar_courses_links': similar_courses_links,
+                   'helpouturl': helpout_url
+    }
+    return course_data
+
+
+@user_passes_test(lambda user: user.is_staff)
+def profiling_stats(request):
+    """
+    Returns the request stats of this process per view, see courseowl_django.profiling, the search stats and
+    the time each phase of the warm up took. Staff only.
+    Method: GET
+    """
+    stats = get_view_stats()
+    stats['search'] = get_search_stats()
+    stats['startup'] = startup_times
+    return HttpResponse(json.dumps(stats, sort_keys=True), content_type='application/json')
@@ -0,0 +1,159 @@
+import cProfile
+import pstats
+import random
+import re
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import connections
+
+SQLITE_QUERY = re.compile(r'^QUERY = u?([\'"])(.*)\1 - PARAMS = ', re.S)
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'\(\?(?:, \?)*\)')
+PROFILE_LINES = 20
+
+_stats_lock = threading.Lock()
+view_stats = {}
+started_at = time.time()
+
+
+def query_shape(sql):
+    """
+    Returns sql with its literals replaced by ?, so queries that only differ in their parameters,
+    as the queries of an N+1 loop do, have the same shape
+    """
+    match = SQLITE_QUERY.match(sql)  # SQLite logs the statement and its parameters apart
+    if match:
+        sql = match.group(2)
+    return IN_LISTS.sub('(?)', LITERALS.sub('?', sql))
+
+
+def summarize_queries(queries):
+    """
+    Returns the number of queries, their total time in seconds, how many of them repeat the shape of
+    an earlier one, and the most repeated shape with its count
+    """
+    shapes = Counter(query_shape(query['sql']) for query in queries)
+    db_time = sum(float(query['time']) for query in queries)
+    worst, count = shapes.most_common(1)[0] if shapes else (None, 0)
+    return len(queries), db_time, len(queries) - len(shapes), (worst, count)
+
+
+def format_profile(profile):
+    """
+    Returns the PROFILE_LINES functions that took the most cumulative time, as [function, calls, seconds]
+    """
+    stats = pstats.Stats(profile)
+    lines = []
+    for (filename, line, name), (calls, _, _, cumulative, _) in stats.stats.iteritems():
+        lines.append(['%s:%d(%s)' % (filename, line, name), calls, cumulative])
+    lines.sort(key=lambda entry: entry[2], reverse=True)
+    return lines[:PROFILE_LINES]
+
+
+def record_request(view, elapsed, queries, response_size, profile=None):
+    """
+    Adds one request of a view to view_stats. queries is None when the queries of the request weren't
+    logged, the query stats are then left as they are.
+    """
+    with _stats_lock:
+        stats = view_stats.setdefault(view, {
+            'requests': 0, 'time': 0.0, 'max_time': 0.0, 'query_samples': 0, 'queries': 0, 'max_queries': 0,
+            'db_time': 0.0, 'duplicates': 0, 'bytes': 0, 'worst_duplicate': None, 'worst_duplicate_count': 0,
+            'profiles': 0, 'profile': None,
+        })
+        stats['requests'] += 1
+        stats['time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        stats['bytes'] += response_size
+        if queries is not None:
+            query_count, db_time, duplicates, (worst, worst_count) = summarize_queries(queries)
+            stats['query_samples'] += 1
+            stats['queries'] += query_count
+            stats['max_queries'] = max(stats['max_queries'], query_count)
+            stats['db_time'] += db_time
+            stats['duplicates'] += duplicates
+            if worst_count > 1 and worst_count > stats['worst_duplicate_count']:
+                stats['worst_duplicate'] = worst
+                stats['worst_duplicate_count'] = worst_count
+        if profile is not None:
+            stats['profiles'] += 1
+            stats['profile'] = format_profile(profile)
+
+
+def get_view_stats():
+    """
+    Returns a copy of view_stats, with averages per request, or per request whose queries were logged for
+    the query stats, and the time they were collected since
+    """
+    with _stats_lock:
+        views = dict((view, dict(stats)) for view, stats in view_stats.iteritems())
+    for stats in views.itervalues():
+        for key in ('time', 'bytes'):
+            stats['avg_' + key] = float(stats[key]) / stats['requests']
+        for key in ('queries', 'db_time', 'duplicates'):
+            stats['avg_' + key] = float(stats[key]) / stats['query_samples'] if stats['query_samples'] else 0.0
+    return {'since': started_at, 'views': views}
+
+
+def reset_view_stats():
+    global started_at
+    with _stats_lock:
+        view_stats.clear()
+        started_at = time.time()
+
+
+class ProfilingMiddleware(object):
+    """
+    Records the wall time and the response size of every request, aggregated per url name in view_stats.
+    The queries of a PROFILE_QUERY_SAMPLE_RATE fraction of requests are logged on every database, to
+    count them, their time and the ones repeating an earlier one's shape (a sign of N+1 loops). Logging
+    them has a cost, so it is sampled. A PROFILE_SAMPLE_RATE fraction of requests also runs under
+    cProfile, and the slowest functions of the last one are kept per view. Should come first in
+    MIDDLEWARE_CLASSES, so it sees everything.
+    """
+    def process_request(self, request):
+        request._profiling = {'start': time.time(), 'view': None, 'profile': None, 'connections': None}
+        if random.random() < settings.PROFILE_QUERY_SAMPLE_RATE:
+            request._profiling['connections'] = []
+            for connection in connections.all():
+                request._profiling['connections'].append(
+                    (connection, connection.use_debug_cursor, len(connection.queries)))
+                connection.use_debug_cursor = True
+        if random.random() < settings.PROFILE_SAMPLE_RATE:
+            request._profiling['profile'] = cProfile.Profile()
+            request._profiling['profile'].enable()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_profiling'):
+            request._profiling['view'] = view_name(request, view_func)
+
+    def process_response(self, request, response):
+        profiling = getattr(request, '_profiling', None)
+        if profiling is None:
+            return response
+        profile = profiling['profile']
+        if profile is not None:
+            profile.disable()
+        elapsed = time.time() - profiling['start']
+        queries = None
+        if profiling['connections'] is not None:
+            queries = []
+            for connection, use_debug_cursor, initial in profiling['connections']:
+                queries.extend(connection.queries[initial:])
+                connection.use_debug_cursor = use_debug_cursor
+        size = 0 if response.streaming else len(response.content)
+        record_request(profiling['view'] or 'unresolved', elapsed, queries, size, profile)
+        return response
+
+
+def view_name(request, view_func):
+    """
+    Returns the name of the url a request resolved to, or the dotted path of its view if the url has none.
+    Views such as haystack's search view are shared by several urls, their path wouldn't tell them apart.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is not None and match.url_name:
+        return match.url_name
+    return '%s.%s' % (view_func.__module__, getattr(view_func, '__name__', type(view_func).__name__))
@@ -0,0 +1,148 @@
+import functools
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'owl_primary'
+
+_state = threading.local()
+_lags = {}
+_lags_lock = threading.Lock()
+
+
+def get_state():
+    """
+    Returns the replica state of the current request: how deep in replica_reads it is, whether it is
+    pinned to the primary and whether it wrote, and the replica it reads from with that replica's lag
+    """
+    if not hasattr(_state, 'depth'):
+        reset_state()
+    return _state
+
+
+def reset_state(pinned=False):
+    _state.depth = 0
+    _state.pinned = pinned
+    _state.wrote = False
+    _state.replica = None
+    _state.lag = None
+
+
+class replica_reads(object):
+    """
+    Sends the reads made inside it to a replica, as a context manager or a decorator. Meant for read-only
+    work like catalog listings, search and recommendations. Reads still go to the primary once the
+    request has written anything, or if it came from a user who wrote in the last REPLICA_PIN_SECONDS.
+    """
+    def __init__(self, func=None):
+        self.func = func
+        if func is not None:
+            functools.update_wrapper(self, func)
+
+    def __enter__(self):
+        get_state().depth += 1
+
+    def __exit__(self, *exc_info):
+        get_state().depth -= 1
+
+    def __call__(self, *args, **kwargs):
+        with self:
+            return self.func(*args, **kwargs)
+
+
+def measure_lag(alias):
+    """
+    Returns how many seconds a replica is behind the primary, going by the catalog version: 0 if it
+    has the latest version, or else the time since the primary got the version the replica is missing
+    """
+    from courses.models import CatalogVersion  # routers are loaded along with django.db, before the models
+    primary = CatalogVersion.objects.using('default').filter(name=CatalogVersion.CATALOG) \
+        .values_list('version', 'updated_at').first()
+    replica = CatalogVersion.objects.using(alias).filter(name=CatalogVersion.CATALOG) \
+        .values_list('version', 'updated_at').first()
+    if primary is None or (replica is not None and replica[0] >= primary[0]):
+        return 0.0
+    return max((timezone.now() - primary[1]).total_seconds(), 0.0)
+
+
+def get_lag(alias):
+    """
+    Returns the lag of a replica, measured at most every REPLICA_LAG_CHECK_INTERVAL seconds per process.
+    A replica that can't be reached counts as infinitely far behind.
+    """
+    with _lags_lock:
+        lag, checked_at = _lags.get(alias, (None, 0))
+    if time.time() - checked_at > settings.REPLICA_LAG_CHECK_INTERVAL:
+        try:
+            lag = measure_lag(alias)
+        except Exception:
+            logger.exception('Could not measure the lag of replica %s', alias)
+            lag = float('inf')
+        with _lags_lock:
+            _lags[alias] = (lag, time.time())
+    return lag
+
+
+def choose_replica():
+    """
+    Picks the replica the current request reads from, among those less than REPLICA_MAX_LAG seconds
+    behind. Returns None if there is none.
+    """
+    state = get_state()
+    if state.replica is None:
+        lags = dict((alias, get_lag(alias)) for alias in settings.DATABASE_REPLICAS)
+        usable = [alias for alias, lag in sorted(lags.items()) if lag <= settings.REPLICA_MAX_LAG]
+        if not usable:
+            return None
+        state.replica = random.choice(usable)
+        state.lag = lags[state.replica]
+    return state.replica
+
+
+class ReplicaRouter(object):
+    """
+    Writes go to the primary, 'default'. Reads inside replica_reads go to one of DATABASE_REPLICAS, the
+    same one for the whole request, unless the request is pinned to the primary by a write.
+    """
+    def db_for_read(self, model, **hints):
+        state = get_state()
+        if state.depth and not state.pinned and settings.DATABASE_REPLICAS:
+            return choose_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = get_state()
+        state.pinned = state.wrote = True  # read your own writes
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same rows as the primary
+
+    def allow_syncdb(self, db, model):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware(object):
+    """
+    Starts every request with a fresh replica state, pinned to the primary if the user wrote recently,
+    and pins the next REPLICA_PIN_SECONDS of requests of a user who wrote with a cookie. The replica a
+    request read from and its lag are sent in the X-Replica and X-Replica-Lag headers.
+    """
+    def process_request(self, request):
+        reset_state(pinned=PIN_COOKIE in request.COOKIES)
+
+    def process_response(self, request, response):
+        state = get_state()
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS)
+        if state.replica is not None:
+            response['X-Replica'] = state.replica
+            response['X-Replica-Lag'] = '%.3f' % state.lag
+            logger.debug('%s read from %s, %.3fs behind', request.path, state.replica, state.lag)
+        reset_state()
+        return response
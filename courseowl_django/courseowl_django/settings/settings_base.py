@@ -31,6 +31,8 @@ INSTALLED_APPS = (
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 
 MIDDLEWARE_CLASSES = (
+    'courseowl_django.profiling.ProfilingMiddleware',
+    'courseowl_django.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,7 +93,50 @@ AUTH_PROFILE_MODULE = 'user_management.UserProfile'
 
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        'ENGINE': 'courses.search_backends.PersistentWhooshEngine',
         'PATH': os.path.join(BASE_DIR, 'whoosh_index'),
     },
 }
+
+# On-disk cache of pages downloaded by the scrapers in courses/scripts
+SCRAPER_CACHE_DIR = os.path.join(BASE_DIR, 'scraper_cache')
+
+# Minimum number of seconds between two requests to the same host while scraping
+SCRAPER_HOST_DELAY = 0.25
+
+# Ingest runs append their stats per provider to this file, one JSON object per line
+INGEST_LOG_FILE = os.path.join(BASE_DIR, 'ingest_log.json')
+
+# How often `manage.py scheduler` ingests each provider, in seconds
+INGEST_INTERVALS = {
+    'coursera': 24 * 60 * 60,
+    'edx': 24 * 60 * 60,
+    'iversity': 24 * 60 * 60,
+    'udacity': 24 * 60 * 60,
+}
+
+# OWL_SEARCH="memory" serves searches from an in-memory BM25 index instead of Whoosh
+if os.getenv("OWL_SEARCH", 'whoosh') == 'memory':
+    HAYSTACK_CONNECTIONS['default'] = {
+        'ENGINE': 'courses.search_backends.MemoryEngine',
+        'REBUILD_INTERVAL': 300,
+        'VERSION_CHECK_INTERVAL': 5,
+    }
+
+# Read-only work in replica_reads is sent to these aliases of DATABASES, copies of 'default'.
+# See courseowl_django/replicas.py
+DATABASE_ROUTERS = ['courseowl_django.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+
+# Users who wrote read from the primary for this many seconds, so they see their own writes
+REPLICA_PIN_SECONDS = 10
+
+# Replicas further behind than this many seconds are skipped. Their lag is measured this often.
+REPLICA_MAX_LAG = 30
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+# Fraction of requests whose queries are logged and counted, and fraction of requests that also run
+# under cProfile, see courseowl_django/profiling.py. The stats per view are served to staff on
+# /api/profiling_stats
+PROFILE_QUERY_SAMPLE_RATE = 0.1
+PROFILE_SAMPLE_RATE = 0.0
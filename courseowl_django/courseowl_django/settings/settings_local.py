@@ -1,3 +1,5 @@
+import os
+
 DEBUG = True
 TEMPLATE_DEBUG = True
 ALLOWED_HOSTS = ['*']
@@ -11,3 +13,8 @@ DATABASES = {
         'HOST': 'localhost'
     }
 }
+
+# A copy of the database standing in for a read replica, i.e. made with `createdb -T owl owl_replica`
+if os.getenv('OWL_REPLICA_NAME'):
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=os.getenv('OWL_REPLICA_NAME'), TEST_MIRROR='default')
+    DATABASE_REPLICAS = ['replica']
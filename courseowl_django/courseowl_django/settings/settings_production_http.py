@@ -1,3 +1,5 @@
+import os
+
 DEBUG = False
 TEMPLATE_DEBUG = False
 ALLOWED_HOSTS = ['.courseowl.com', '.courseowl.com.']
@@ -12,3 +14,8 @@ DATABASES = {
         'HOST': '10.128.233.5'
     }
 }
+
+# The streaming replica of the database, if there is one
+if os.getenv('OWL_REPLICA_HOST'):
+    DATABASES['replica'] = dict(DATABASES['default'], HOST=os.getenv('OWL_REPLICA_HOST'), TEST_MIRROR='default')
+    DATABASE_REPLICAS = ['replica']
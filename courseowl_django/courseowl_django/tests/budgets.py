@@ -0,0 +1,104 @@
+import time
+from abc import ABCMeta, abstractmethod
+from collections import Counter
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from accounts.models import User, UserProfile
+from courseowl_django.profiling import query_shape
+from courses.models import Course, Provider, Source, Subject
+
+PASSWORD = 'budget123456'
+
+# Seconds a single request may take. Coarse on purpose, it is there to catch requests that went from
+# milliseconds to seconds, not to benchmark.
+MAX_SECONDS = 2.0
+
+
+def make_catalog(courses=60, subjects=12, providers=3, users=12):
+    """
+    Creates a fixed size synthetic catalog: courses spread over providers and sources, with two subjects
+    each, and users whose profiles have interests and enrolled, completed and disliked courses. Big
+    enough that a query per course, subject or user blows any budget. Returns the user profiles,
+    every user has PASSWORD as password.
+    """
+    provider_list = [Provider.objects.create(name='Provider %d' % i) for i in range(providers)]
+    source_list = [Source.objects.create(name='Source %d' % i) for i in range(providers)]
+    subject_list = [Subject.objects.create(name='subject %d' % i) for i in range(subjects)]
+    course_list = []
+    for i in range(courses):
+        course = Course.objects.create(name='Course %d' % i, description='Description of course %d' % i,
+                                       instructor='Instructor %d' % (i % 7), url='http://example.com/%d' % i,
+                                       provider=provider_list[i % providers], source=source_list[i % providers])
+        course.subjects.add(subject_list[i % subjects], subject_list[(i * 7 + 1) % subjects])
+        course_list.append(course)
+
+    profiles = []
+    for i in range(users):
+        user = User.objects.create_user(username='user%d' % i, email='user%d@example.com' % i, password=PASSWORD)
+        profile = UserProfile.objects.create(user=user)
+        profile.interests.add(*subject_list[i % subjects:i % subjects + 3])
+        profile.enrolled.add(*course_list[i:i + 10])
+        profile.completed.add(*course_list[i + 10:i + 15])
+        profile.disliked.add(*course_list[i + 15:i + 18])
+        profiles.append(profile)
+    return profiles
+
+
+def url_names(urlpatterns):
+    """
+    Returns the names of the urls in urlpatterns
+    """
+    return set(pattern.name for pattern in urlpatterns if getattr(pattern, 'name', None))
+
+
+class QueryBudgetMixin(object):
+    """
+    Pins the number of queries of every url of an urls module, against the catalog of make_catalog().
+    Test cases set urlpatterns and implement get_budgets(). Every named url of urlpatterns needs at least
+    one budget.
+    """
+    __metaclass__ = ABCMeta
+
+    urlpatterns = ()
+
+    def setUp(self):
+        self.profiles = make_catalog()
+        self.user = self.profiles[0].user
+
+    @abstractmethod
+    def get_budgets(self):
+        """
+        Returns what to request, as (url name, method, data, max_queries) tuples in the order to request
+        them in. Called once the catalog is made, so data can refer to its rows. Every request is made
+        logged in as self.user, and data is None for a request without parameters.
+        """
+
+    def assertQueryBudget(self, method, path, max_queries, data=None, max_seconds=MAX_SECONDS):
+        """
+        Requests path and fails if it errors, takes more than max_queries queries or more than max_seconds
+        """
+        start = time.time()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data or {})
+        elapsed = time.time() - start
+        self.assertTrue(response.status_code < 500, '%s %s failed' % (method.upper(), path))
+
+        if len(queries) > max_queries:
+            repeated = ['%dx %s' % (count, shape) for shape, count in
+                        Counter(query_shape(query['sql']) for query in queries).most_common() if count > 1]
+            self.fail('%s %s took %d queries, the budget is %d. Repeated queries:\n%s' % (
+                method.upper(), path, len(queries), max_queries, '\n'.join(repeated) or 'none'))
+        self.assertTrue(elapsed <= max_seconds, '%s %s took %.2fs, the budget is %.2fs' % (
+            method.upper(), path, elapsed, max_seconds))
+        return response
+
+    def test_every_url_has_a_budget(self):
+        budgeted = set(name for name, method, data, max_queries in self.get_budgets())
+        self.assertEqual(url_names(self.urlpatterns) - budgeted, set())
+
+    def test_query_budgets(self):
+        for name, method, data, max_queries in self.get_budgets():
+            # views may have changed the username, as change_email does
+            self.client.login(username=User.objects.get(id=self.user.id).username, password=PASSWORD)
+            self.assertQueryBudget(method, reverse(name), max_queries, data)
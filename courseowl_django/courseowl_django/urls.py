@@ -1,5 +1,6 @@
 from django.conf.urls import patterns, include, url
 from django.contrib import admin
+from haystack.views import search_view_factory
 
 admin.autodiscover()
 
@@ -11,7 +12,8 @@ urlpatterns = patterns('',
                        url(r'^accounts/', include('accounts.urls')),
                        url(r'^api/', include('api.urls')),
                        url(r'^social_accounts/', include('allauth.urls')),
-                       url(r'^search/', include('haystack.urls')),
+                       url(r'^search/$', search_view_factory(view_class=website.views.CourseSearchView),
+                           name='haystack_search'),
                        url(r'^404/$', website.views.error404),
                        url(r'^', include('website.urls')),
                        )
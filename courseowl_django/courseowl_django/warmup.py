@@ -0,0 +1,129 @@
+import gc
+import logging
+import random
+import time
+from django.db import connections
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:  # not running under uWSGI
+    postfork = None
+
+logger = logging.getLogger(__name__)
+
+# (phase, seconds) of the last warm_up() of this process, in the order they ran
+startup_times = []
+
+
+# Every phase imports what it needs itself, so the time of those imports counts towards it
+def load_middleware(application):
+    """
+    Loads the middleware, which Django does on the first request otherwise
+    """
+    if application._request_middleware is None:
+        application.load_middleware()
+
+
+def import_apps(application):
+    """
+    Imports the models of every installed app, every urlconf and view, which runs admin.autodiscover(),
+    the social account providers and the translations
+    """
+    from allauth.socialaccount import providers
+    from django.conf import settings
+    from django.core.urlresolvers import get_resolver
+    from django.db.models import get_models
+    from django.utils import translation
+    get_models()
+    get_resolver(None).reverse_dict  # populating it imports the views of every url
+    providers.registry.get_list()
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+
+
+def open_search_index(application):
+    from courses.search_backends import warm_up_search
+    warm_up_search()
+
+
+def prime_catalog(application):
+    """
+    Caches the catalog listings of the api
+    """
+    from courseowl_django.replicas import replica_reads
+    from courses.catalog import get_course_names, get_subject_names
+    with replica_reads():
+        get_subject_names()
+        get_course_names()
+
+
+def prime_recommender(application):
+    """
+    Imports the recommender and caches the subject names it matches interests against
+    """
+    import courses.recommender  # noqa, loaded ahead of the first recommendation
+    from courseowl_django.replicas import replica_reads
+    from courses.subjects import get_subject_resolver
+    with replica_reads():
+        get_subject_resolver()
+
+
+PHASES = (
+    ('middleware', load_middleware),
+    ('apps', import_apps),
+    ('search', open_search_index),
+    ('catalog', prime_catalog),
+    ('recommender', prime_recommender),
+)
+
+
+def warm_up(application, phases=PHASES):
+    """
+    Does the work a process would otherwise do on its first requests, by running each phase with the
+    WSGI application. A phase that fails is logged and skipped, its work is then left to the first
+    request as before. Keeps the (phase, seconds) of every phase in startup_times and returns them.
+
+    Under uWSGI without lazy-apps this runs once in the master, and the workers forked from it share
+    what it loaded. So it closes its database connections, which the workers must not share, and
+    collects the garbage of the warm up, which every worker would otherwise collect on its own,
+    touching and copying the shared memory.
+    """
+    del startup_times[:]
+    for name, phase in phases:
+        start = time.time()
+        try:
+            phase(application)
+        except Exception:
+            logger.exception('Warming up %s failed', name)
+        startup_times.append((name, time.time() - start))
+    for connection in connections.all():
+        connection.close()
+    gc.collect()
+    return list(startup_times)
+
+
+def after_fork():
+    """
+    Runs in every uWSGI worker once it is forked from the master. Gives the worker its own random state,
+    which the replica choice and the profiling samples use, and its own files and connections.
+    """
+    from courses.search_backends import after_fork_search
+    random.seed()
+    for connection in connections.all():
+        connection.close()
+    try:
+        after_fork_search()
+    except Exception:
+        logger.exception('Reopening the search index after fork failed')
+
+
+if postfork is not None:
+    postfork(after_fork)
+
+
+def format_startup_times():
+    """
+    Returns the total time of the last warm up and the time of each phase, on one line
+    """
+    return 'Warmed up in %.2fs: %s' % (sum(seconds for name, seconds in startup_times),
+                                       ', '.join('%s %.2fs' % phase for phase in startup_times))
@@ -3,12 +3,21 @@ WSGI config for courseowl_django project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+The application is warmed up before it serves anything, see courseowl_django/warmup.py. uWSGI loads
+it in the master and forks the workers from there unless lazy-apps is set, so the workers start warm
+and share the memory of what was loaded. Keep lazy-apps off in the uWSGI config.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/1.6/howto/deployment/wsgi/
 """
 
 import os
+import sys
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "courseowl_django.settings")
 
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
+
+from courseowl_django.warmup import format_startup_times, warm_up
+warm_up(application)
+sys.stderr.write('%s\n' % format_startup_times())  # ends up in the uWSGI log
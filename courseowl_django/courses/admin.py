@@ -1,11 +1,47 @@
 from django.contrib import admin
-from courses.models import Subject, Provider, Source, Course
+from courses.models import Subject, Provider, Source, Course, IngestRun, CatalogVersion
 
 
-class CourseAdmin(admin.ModelAdmin):
+class CatalogAdmin(admin.ModelAdmin):
+    """
+    Admin of a model of the catalog. The versions the changes of a view bump are bumped once, after the
+    view committed them, i.e. saving a course and its subjects is one bump.
+    """
+    def add_view(self, *args, **kwargs):
+        with CatalogVersion.objects.deferred_bumps():
+            return super(CatalogAdmin, self).add_view(*args, **kwargs)
+
+    def change_view(self, *args, **kwargs):
+        with CatalogVersion.objects.deferred_bumps():
+            return super(CatalogAdmin, self).change_view(*args, **kwargs)
+
+    def delete_view(self, *args, **kwargs):
+        with CatalogVersion.objects.deferred_bumps():
+            return super(CatalogAdmin, self).delete_view(*args, **kwargs)
+
+    def changelist_view(self, *args, **kwargs):  # where the delete action runs
+        with CatalogVersion.objects.deferred_bumps():
+            return super(CatalogAdmin, self).changelist_view(*args, **kwargs)
+
+
+class CourseAdmin(CatalogAdmin):
     search_fields = ['name']
 
-admin.site.register(Subject)
-admin.site.register(Provider)
-admin.site.register(Source)
+admin.site.register(Subject, CatalogAdmin)
+admin.site.register(Provider, CatalogAdmin)
+admin.site.register(Source, CatalogAdmin)
 admin.site.register(Course, CourseAdmin)
+
+
+class IngestRunAdmin(admin.ModelAdmin):
+    list_display = ['provider', 'started_at', 'finished_at']
+    list_filter = ['provider']
+
+admin.site.register(IngestRun, IngestRunAdmin)
+
+
+class CatalogVersionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'version', 'updated_at']
+    readonly_fields = ['name', 'version', 'updated_at']
+
+admin.site.register(CatalogVersion, CatalogVersionAdmin)
@@ -0,0 +1,50 @@
+import hashlib
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.encoding import force_bytes
+from courses.models import CatalogVersion, Course, Subject
+
+
+def catalog_version(name=CatalogVersion.CATALOG):
+    """
+    Returns the current token of a catalog version, see CatalogVersionManager.get_tokens()
+    """
+    return CatalogVersion.objects.get_tokens()[name]
+
+
+def versioned_key(prefix, parts=(), names=None):
+    """
+    Returns a cache key for prefix and parts that changes whenever one of the named versions is bumped,
+    the whole catalog by default. Entries under old keys are never read again and just expire.
+    """
+    tokens = CatalogVersion.objects.get_tokens()
+    names = sorted(names or [CatalogVersion.CATALOG])
+    key = '|'.join(['%s=%s' % (name, tokens[name]) for name in names] + [force_bytes(part) for part in parts])
+    return 'catalog:%s:%s' % (prefix, hashlib.md5(key).hexdigest())
+
+
+def cached(prefix, builder, parts=(), names=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the cached value of builder() under versioned_key(prefix, parts, names), building and
+    caching it first if it isn't cached for the current versions
+    """
+    key = versioned_key(prefix, parts, names)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout)
+    return value
+
+
+def get_subject_names():
+    """
+    Returns the names of all subjects, cached until the subjects change
+    """
+    return cached('json_subjects', lambda: [subject.name for subject in Subject.objects.all()], names=['subject'])
+
+
+def get_course_names():
+    """
+    Returns the names of all courses, cached until the courses change
+    """
+    return cached('json_courses', lambda: [course.name for course in Course.objects.all()], names=['course'])
@@ -0,0 +1,30 @@
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.scripts.pipeline import ADAPTERS, Pipeline, format_stats, get_adapters
+
+
+class Command(BaseCommand):
+    help = 'Scrapes courses from the given providers concurrently and saves them to the database.'
+    option_list = BaseCommand.option_list + (
+        make_option('--providers', dest='providers', default=','.join(sorted(ADAPTERS)),
+                    help='Comma separated providers to scrape, out of %s' % ', '.join(sorted(ADAPTERS))),
+        make_option('--batch-size', dest='batch_size', type='int', default=500,
+                    help='Number of courses saved per transaction'),
+        make_option('--no-index', action='store_false', dest='update_index', default=True,
+                    help='Do not update the search index for changed courses'),
+    )
+
+    def handle(self, **options):
+        try:
+            adapters = get_adapters(options['providers'].split(','))
+        except ValueError as e:
+            raise CommandError(e)
+
+        pipeline = Pipeline(adapters, batch_size=options['batch_size'], update_index=options['update_index'],
+                            log_file=settings.INGEST_LOG_FILE)
+        counts = pipeline.run()
+
+        for name, stats in sorted(pipeline.stats.iteritems()):
+            self.stdout.write(format_stats(name, stats))
+        self.stdout.write('%(created)d courses added, %(updated)d updated, %(unchanged)d unchanged' % counts)
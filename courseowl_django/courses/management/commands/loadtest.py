@@ -0,0 +1,67 @@
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.scripts.loadtest import COURSES_PER_USER, MIX, LoadTest, format_report, is_seeded, seed
+
+
+class Command(BaseCommand):
+    args = '[seed|run]'
+    help = ('Seeds a synthetic population of courses and users, or sends a realistic mix of requests to a '
+            'running server and reports the throughput and latency per endpoint:\n\n'
+            '    ./manage.py loadtest seed --courses 20000 --users 1000\n'
+            '    ./manage.py loadtest run --url http://127.0.0.1:8000 --workers 16 --duration 60\n\n'
+            'Both use the database of the settings, so only run it against a local one.')
+    option_list = BaseCommand.option_list + (
+        make_option('--courses', dest='courses', type='int', default=20000, help='Number of courses to seed'),
+        make_option('--users', dest='users', type='int', default=1000, help='Number of users to seed'),
+        make_option('--url', dest='url', default='http://127.0.0.1:8000', help='Server to send requests to'),
+        make_option('--workers', dest='workers', type='int', default=8, help='Number of concurrent clients'),
+        make_option('--duration', dest='duration', type='float', default=60,
+                    help='Seconds to send requests for'),
+        make_option('--requests', dest='requests', type='int', default=None,
+                    help='Number of requests to send, instead of running for --duration'),
+        make_option('--mix', dest='mix', default=None,
+                    help='Comma separated action=weight pairs, out of %s' % ', '.join(sorted(MIX))),
+    )
+
+    def handle(self, action='run', **options):
+        if not settings.DEBUG:
+            raise CommandError('Load tests only run with DEBUG on, against a local database')
+
+        if action == 'seed':
+            if options['courses'] < COURSES_PER_USER:
+                raise CommandError('--courses must be at least %d, the number of courses every user gets'
+                                   % COURSES_PER_USER)
+            if options['users'] < 1:
+                raise CommandError('--users must be at least 1')
+            if is_seeded():
+                raise CommandError('The database already has a load test population')
+            courses, users = seed(options['courses'], options['users'])
+            self.stdout.write('Seeded %d courses and %d users, run ./manage.py rebuild_index to search them'
+                              % (courses, users))
+        elif action == 'run':
+            if options['workers'] < 1:
+                raise CommandError('--workers must be at least 1')
+            loadtest = LoadTest(options['url'], options['workers'], options['duration'], options['requests'],
+                                self.parse_mix(options['mix']))
+            try:
+                stats = loadtest.run()
+            except ValueError as e:
+                raise CommandError(e)
+            self.stdout.write('%d workers for %.1fs against %s' % (options['workers'], loadtest.elapsed,
+                                                                    options['url']))
+            for line in format_report(stats):
+                self.stdout.write(line)
+        else:
+            raise CommandError('Unknown action %s, use seed or run' % action)
+
+    def parse_mix(self, mix):
+        if mix is None:
+            return None
+        weights = {}
+        for pair in mix.split(','):
+            action, weight = pair.split('=')
+            if action not in MIX:
+                raise CommandError('Unknown action %s, choose from %s' % (action, ', '.join(sorted(MIX))))
+            weights[action] = float(weight)
+        return weights
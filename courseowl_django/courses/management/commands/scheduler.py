@@ -0,0 +1,32 @@
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.scripts.pipeline import ADAPTERS
+from courses.scripts.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = ('Keeps ingesting courses from the providers on the intervals in INGEST_INTERVALS, '
+            'resuming runs that were interrupted.')
+    option_list = BaseCommand.option_list + (
+        make_option('--providers', dest='providers', default=','.join(sorted(ADAPTERS)),
+                    help='Comma separated providers to schedule, out of %s' % ', '.join(sorted(ADAPTERS))),
+        make_option('--once', action='store_true', dest='once', default=False,
+                    help='Run the providers that are due, wait for them and exit'),
+        make_option('--retry-delay', dest='retry_delay', type='int', default=600,
+                    help='Seconds to wait before retrying a provider whose run failed'),
+    )
+
+    def handle(self, **options):
+        try:
+            scheduler = Scheduler(options['providers'].split(','), settings.INGEST_INTERVALS,
+                                  retry_delay=options['retry_delay'], log_file=settings.INGEST_LOG_FILE)
+        except ValueError as e:
+            raise CommandError(e)
+
+        if options['once']:
+            started = scheduler.run_due()
+            self.stdout.write('Ingesting %s' % (', '.join(started) or 'nothing, no provider is due'))
+            scheduler.join()
+        else:
+            scheduler.run_forever()
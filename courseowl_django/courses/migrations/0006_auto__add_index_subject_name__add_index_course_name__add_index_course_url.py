@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import connection, models
+
+# The tables that refer to courses, as (table, course column, the columns that are unique along with it,
+# other columns). The rows of a course merged into another are moved over, keeping the earliest of the
+# other columns where both courses had the row.
+COURSE_REFERENCES = (
+    (u'courses_course_subjects', 'course_id', ['subject_id'], []),
+    (u'courses_course_similarCourses', 'from_course_id', ['to_course_id'], []),
+    (u'courses_course_similarCourses', 'to_course_id', ['from_course_id'], []),
+    (u'accounts_userprofile_enrolled', 'course_id', ['userprofile_id'], []),
+    (u'accounts_userprofile_completed', 'course_id', ['userprofile_id'], []),
+    (u'accounts_userprofile_disliked', 'course_id', ['userprofile_id'], []),
+    (u'accounts_courseinteraction', 'course_id', ['user_profile_id', 'kind'], ['created_at']),
+)
+
+
+# Trigram indexes for name__icontains, which Django runs as UPPER(name::text) LIKE UPPER(%s)
+TRIGRAM_INDEXES = (
+    ('courses_course_name_trgm', 'courses_course'),
+    ('courses_subject_name_trgm', 'courses_subject'),
+)
+TRIGRAM_INDEX_SQL = 'CREATE INDEX %s ON %s USING gin ((UPPER(name::text)) gin_trgm_ops)'
+
+
+def has_pg_trgm():
+    """
+    Returns whether the pg_trgm extension is installed, installing it first if it is available and the
+    role is a superuser, which creating it takes before PostgreSQL 13
+    """
+    if db.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"):
+        return True
+    if not db.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"):
+        return False
+    if not db.execute('SELECT 1 FROM pg_roles WHERE rolname = current_user AND rolsuper'):
+        return False
+    db.execute('CREATE EXTENSION pg_trgm')
+    return True
+
+
+def merge_duplicate_courses():
+    """
+    Merges the courses sharing a url into the oldest of them: the rows referring to the others move over
+    to it, then the others are deleted
+    """
+    q = db.quote_name
+    db.execute('CREATE TEMPORARY TABLE course_merges AS '
+               'SELECT course.id AS duplicate_id, kept.kept_id FROM courses_course course JOIN '
+               "(SELECT url, MIN(id) AS kept_id FROM courses_course WHERE url <> '' GROUP BY url) kept "
+               'ON course.url = kept.url WHERE course.id <> kept.kept_id')
+    tables = connection.introspection.table_names()  # the accounts tables may not be there yet
+    for table, column, keys, others in COURSE_REFERENCES:
+        table = db.shorten_name(table)
+        if table not in tables:
+            continue
+        db.execute(
+            'INSERT INTO {table} ({column}, {keys}) SELECT merge.kept_id, {moved} FROM {table} moved '
+            'JOIN course_merges merge ON moved.{column} = merge.duplicate_id WHERE NOT EXISTS '
+            '(SELECT 1 FROM {table} kept WHERE kept.{column} = merge.kept_id AND {same}) '
+            'GROUP BY merge.kept_id, {moved_keys}'.format(
+                table=q(table), column=q(column), keys=', '.join(q(name) for name in keys + others),
+                moved=', '.join(['moved.%s' % q(key) for key in keys] +
+                                ['MIN(moved.%s)' % q(other) for other in others]),
+                same=' AND '.join('kept.%s = moved.%s' % (q(key), q(key)) for key in keys),
+                moved_keys=', '.join('moved.%s' % q(key) for key in keys)))
+        db.execute('DELETE FROM {table} WHERE {column} IN (SELECT duplicate_id FROM course_merges)'.format(
+            table=q(table), column=q(column)))
+    db.execute('DELETE FROM courses_course WHERE id IN (SELECT duplicate_id FROM course_merges)')
+    db.execute('DROP TABLE course_merges')
+
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding index on 'Subject', fields ['name']
+        db.create_index(u'courses_subject', ['name'])
+
+        # Adding index on 'Course', fields ['name']
+        db.create_index(u'courses_course', ['name'])
+
+        # Adding index on 'Course', fields ['url']
+        db.create_index(u'courses_course', ['url'])
+
+        # Adding unique index on 'Course', fields ['url'] where it isn't blank. Planners can't always tell a
+        # lookup like url IN (...) skips blank urls, so lookups go through the index above. Courses saved
+        # twice by the scrapers before ingest() matched them by url are merged into their first copy.
+        if db.backend_name in ('postgres', 'sqlite3'):
+            merge_duplicate_courses()
+            db.execute("CREATE UNIQUE INDEX courses_course_url_uniq ON courses_course (url) WHERE url <> ''")
+
+        # Trigram indexes, if pg_trgm is there or can be installed. Otherwise a DBA can install it, as a
+        # superuser, and create the indexes with the statements of the warning. Searches work without them,
+        # with sequential scans.
+        if db.backend_name == 'postgres':
+            if has_pg_trgm():
+                for index, table in TRIGRAM_INDEXES:
+                    db.execute(TRIGRAM_INDEX_SQL % (index, table))
+            elif not db.dry_run:
+                print(' ! The pg_trgm extension is missing and this role can\'t create it, so the trigram indexes '
+                      'were skipped. To add them, run as a superuser:\n'
+                      '   CREATE EXTENSION pg_trgm;\n%s' % ''.join(
+                          '   %s;\n' % (TRIGRAM_INDEX_SQL % (index, table)) for index, table in TRIGRAM_INDEXES))
+
+    def backwards(self, orm):
+        if db.backend_name == 'postgres':
+            for index, table in TRIGRAM_INDEXES:
+                db.execute('DROP INDEX IF EXISTS %s' % index)
+
+        # Removing unique index on 'Course', fields ['url']
+        if db.backend_name in ('postgres', 'sqlite3'):
+            db.execute('DROP INDEX courses_course_url_uniq')
+
+        # Removing index on 'Course', fields ['url']
+        db.delete_index(u'courses_course', ['url'])
+
+        # Removing index on 'Course', fields ['name']
+        db.delete_index(u'courses_course', ['name'])
+
+        # Removing index on 'Subject', fields ['name']
+        db.delete_index(u'courses_subject', ['name'])
+
+    models = {
+        u'courses.course': {
+            'Meta': {'object_name': 'Course'},
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '3000'}),
+            'fingerprint': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '40', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'instructor': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'db_index': 'True'}),
+            'provider': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['courses.Provider']", 'null': 'True', 'blank': 'True'}),
+            'similarCourses': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'similarCourses_rel_+'", 'to': u"orm['courses.Course']"}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['courses.Source']", 'null': 'True', 'blank': 'True'}),
+            'subjects': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['courses.Subject']", 'symmetrical': 'False'}),
+            'url': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'db_index': 'True', 'blank': 'True'})
+        },
+        u'courses.ingestrun': {
+            'Meta': {'object_name': 'IngestRun'},
+            'completed_tasks': ('django.db.models.fields.TextField', [], {'default': "'[]'"}),
+            'finished_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'provider': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'started_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'stats': ('django.db.models.fields.TextField', [], {'default': "'{}'"})
+        },
+        u'courses.provider': {
+            'Meta': {'object_name': 'Provider'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1000'})
+        },
+        u'courses.source': {
+            'Meta': {'object_name': 'Source'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1000'})
+        },
+        u'courses.subject': {
+            'Meta': {'object_name': 'Subject'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['courses']
\ No newline at end of file
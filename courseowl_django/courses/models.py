@@ -1,11 +1,17 @@
-from django.db import models
+import json
+import threading
+from contextlib import contextmanager
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
 
 
 class Subject(models.Model):
     """
     Subject, i.e. Economics.
     """
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
 
     def __unicode__(self):
         return self.name
@@ -31,18 +37,155 @@ class Source(models.Model):
         return self.name
 
 
+class CourseManager(models.Manager):
+    def get_by_natural_key(self, url):
+        return self.get(url=url)
+
+
 class Course(models.Model):
     """
-    Course model, i.e. Pottery II.
+    Course model, i.e. Pottery II. Courses are matched by url, which is unique unless it is blank.
     """
-    name = models.CharField(max_length=1000)
-    url = models.CharField(max_length=1000, blank=True)
+    name = models.CharField(max_length=1000, db_index=True)
+    url = models.CharField(max_length=1000, blank=True, db_index=True)  # also unique where not blank, see 0006
     subjects = models.ManyToManyField(Subject)
     provider = models.ForeignKey(Provider, null=True, blank=True)
     description = models.CharField(max_length=3000)
     similarCourses = models.ManyToManyField('self')
     instructor = models.CharField(max_length=1000, null=True, blank=True)
     source = models.ForeignKey(Source, null=True, blank=True)
+    fingerprint = models.CharField(max_length=40, blank=True, default='')  # hash of the scraped fields
+
+    objects = CourseManager()
+
+    def natural_key(self):
+        return (self.url,)
 
     def __unicode__(self):
         return self.name
+
+
+class IngestRun(models.Model):
+    """
+    One run of the ingest pipeline for a provider. completed_tasks is a JSON list of the tasks whose
+    courses are saved, so a run that was interrupted can resume where it stopped. stats is a JSON object
+    with the throughput of the run, see Pipeline.
+    """
+    provider = models.CharField(max_length=100)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    completed_tasks = models.TextField(default='[]')
+    stats = models.TextField(default='{}')
+
+    def get_completed_tasks(self):
+        return json.loads(self.completed_tasks)
+
+    def get_stats(self):
+        return json.loads(self.stats)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.provider, self.started_at)
+
+
+# The names to bump when the deferred_bumps() block of the thread ends, None outside of one
+_deferred = threading.local()
+
+
+class CatalogVersionManager(models.Manager):
+    def bump(self, *names):
+        """
+        Increments the catalog version and the versions of the given models, by model name, i.e. 'course'.
+        Happens in the current transaction, unless inside deferred_bumps(), which bumps everything once.
+        """
+        names = set(names)
+        names.add(CatalogVersion.CATALOG)
+        pending = getattr(_deferred, 'names', None)
+        if pending is not None:
+            pending.update(names)
+            return
+        with transaction.atomic():
+            updated = self.filter(name__in=names).update(version=F('version') + 1, updated_at=timezone.now())
+            if updated < len(names):
+                self.create_missing()
+                self.filter(name__in=names).update(version=F('version') + 1, updated_at=timezone.now())
+
+    @contextmanager
+    def deferred_bumps(self):
+        """
+        Collects the bumps made in the with block, and makes them in a single update once it ends without
+        an error. Around a transaction, the versions are bumped after it commits, so the catalog row every
+        bump updates isn't kept locked for the rest of the transaction. Blocks inside one another bump
+        when the outermost ends.
+        """
+        if getattr(_deferred, 'names', None) is not None:
+            yield
+            return
+        _deferred.names = set()
+        try:
+            yield
+            names = _deferred.names
+        finally:
+            _deferred.names = None
+        if names:
+            self.bump(*names)
+
+    def create_missing(self):
+        """
+        Creates the versions that don't exist yet, at 0
+        """
+        existing = set(self.values_list('name', flat=True))
+        for name in CatalogVersion.NAMES:
+            if name not in existing:
+                try:
+                    with transaction.atomic():
+                        self.create(name=name)
+                except IntegrityError:
+                    pass  # created by someone else in the meantime
+
+    def get_tokens(self):
+        """
+        Returns {name: token} for every version, where the token changes whenever the version is bumped.
+        The token has the time of the bump next to the counter, so a version that was rolled back and
+        bumped again doesn't give the same token twice.
+        """
+        tokens = dict((name, '0') for name in CatalogVersion.NAMES)
+        for name, version, updated_at in self.values_list('name', 'version', 'updated_at'):
+            tokens[name] = '%d.%s' % (version, updated_at.strftime('%Y%m%d%H%M%S%f'))
+        return tokens
+
+
+class CatalogVersion(models.Model):
+    """
+    Counts the changes to the catalog as a whole, and to each model in it. Caches of anything derived
+    from the catalog key on these versions, see courses.catalog.
+    """
+    CATALOG = 'catalog'
+    NAMES = (CATALOG, 'course', 'subject', 'provider', 'source')
+
+    name = models.CharField(max_length=20, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CatalogVersionManager()
+
+    def __unicode__(self):
+        return u'%s %d' % (self.name, self.version)
+
+
+def bump_catalog_version(sender, **kwargs):
+    CatalogVersion.objects.bump(sender._meta.model_name)
+
+
+def bump_course_version(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        CatalogVersion.objects.bump('course')
+
+
+# Changes made through the ORM, i.e. in the admin, which defers them to one bump per request. Bulk changes made
+# by ingest() bump the versions themselves.
+for catalog_model in (Course, Subject, Provider, Source):
+    post_save.connect(bump_catalog_version, sender=catalog_model,
+                      dispatch_uid='bump_%s_version_on_save' % catalog_model._meta.model_name)
+    post_delete.connect(bump_catalog_version, sender=catalog_model,
+                        dispatch_uid='bump_%s_version_on_delete' % catalog_model._meta.model_name)
+m2m_changed.connect(bump_course_version, sender=Course.subjects.through, dispatch_uid='bump_course_version_on_subjects')
@@ -1,8 +1,11 @@
+from courseowl_django.replicas import replica_reads
 from courses.models import Subject, Course
-from accounts.models import UserProfile
+from courses.subjects import get_subject_resolver
+from accounts.models import UserProfile, CourseInteraction
 from collections import defaultdict
 
 
+@replica_reads
 def get_all_subject_recommendations(user):
     """
     Entry point to get all subject-based recommendations
@@ -13,6 +16,7 @@ def get_all_subject_recommendations(user):
     return get_recs_from_subjects(all_user_subjects)
 
 
+@replica_reads
 def get_all_user_recommendations(user):
     """
     Entry point to get all user-based recommendations
@@ -21,8 +25,8 @@ def get_all_user_recommendations(user):
     recommended_list = set()
     if not best_user_profile:
         return recommended_list
-    recommended_list.update(set(best_user_profile.enrolled.all()))
-    recommended_list.update(set(best_user_profile.completed.all()))
+    recommended_list.update(set(best_user_profile.enrolled.select_related('provider')))
+    recommended_list.update(set(best_user_profile.completed.select_related('provider')))
     recommended_list.update(get_recs_from_subjects(set(best_user_profile.interests.all())))
 
     return recommended_list
@@ -39,42 +43,38 @@ def get_interest_subjects(user):
     return my_subjects
 
 
-def get_recs_from_subjects(subjects):
+def get_recs_from_subjects(subjects, resolver=None):
     """
-    Retrieves all courses in fuzzy subject matching set
+    Retrieves all courses in fuzzy subject matching set, with their providers
     """
-    subject_course_recs = set()
+    if resolver is None:
+        resolver = get_subject_resolver()
+    related_ids = set()
     for subject in subjects:
-        matching_subs = get_fuzzy_subject_matching(subject)
-        for related_sub in matching_subs:
-            for course in Course.objects.filter(subjects=related_sub):
-                subject_course_recs.add(course)
-    return subject_course_recs
+        related_ids.update(resolver.related(subject.name))
+    if not related_ids:
+        return set()
+    return set(Course.objects.filter(subjects__in=related_ids).select_related('provider').distinct())
 
 
-def get_fuzzy_subject_matching(subject):
+def get_fuzzy_subject_matching(subject, resolver=None):
     """
     Removes dashes in subject name and searches for related subjects
     """
-    sub_set = set()
-    base_sub = str(subject.name).split('-')[0]
-    related_subs = Subject.objects.filter(name__icontains=base_sub)
-    for subject in related_subs:
-        print subject.name
-        sub_set.add(subject)
-    return sub_set
+    if resolver is None:
+        resolver = get_subject_resolver()
+    return set(Subject.objects.filter(id__in=resolver.related(subject.name)))
 
 
 def get_enrolled_subjects(user):
     """
     Gets subjects based off of the subjects of the classes you are enrolled in and completed.
+    A subject is listed once per course it is a subject of.
     """
     prefs = UserProfile.objects.get(user=user)
     subject_set = list()
-    for course in prefs.enrolled.all():
-        subject_set.extend(course.subjects.all())
-    for course in prefs.completed.all():
-        subject_set.extend(course.subjects.all())
+    subject_set.extend(Subject.objects.filter(course__enrolled_classes=prefs))
+    subject_set.extend(Subject.objects.filter(course__completed_classes=prefs))
     return subject_set
 
 
@@ -82,76 +82,78 @@ def get_similar_user_interests(user):
     """
     Returns the most similar user to you based on shared interests
     """
-    max_similar = 0
-    most_similar_user_profle = None
-
     prefs = UserProfile.objects.get(user=user)
-    my_interests = set(prefs.interests.all())
-    for other_user in UserProfile.objects.all():
-        if other_user == prefs:
-            continue
-        similar_subs = my_interests.intersection(set(other_user.interests.all()))
-        if len(similar_subs) > max_similar:
-            max_similar = len(similar_subs)
-            most_similar_user_profle = other_user
-    return most_similar_user_profle, max_similar
+    interests = {}
+    for user_profile_id, subject_id in UserProfile.interests.through.objects.values_list('userprofile_id',
+                                                                                          'subject_id'):
+        interests.setdefault(user_profile_id, set()).add(subject_id)
+    return get_most_similar_profile(prefs, interests)
 
 
-def get_similar_user_dislikes(user):
+def load_interactions(kinds=None, since=None):
     """
-    Returns the most similar user to you based on shared dislikes
+    Reads the course interactions of every user in one ordered scan, and returns the courses of each
+    user profile by kind, as {kind: {user_profile_id: set of course ids}}. With since, only the
+    interactions from that time on are read, to update results incrementally.
+    """
+    if kinds is None:
+        kinds = [kind for kind, name in CourseInteraction.KINDS]
+    interactions = dict((kind, {}) for kind in kinds)
+    rows = CourseInteraction.objects.filter(kind__in=kinds).order_by('user_profile', 'kind', 'course')
+    if since is not None:
+        rows = rows.filter(created_at__gte=since)
+    for user_profile_id, kind, course_id in rows.values_list('user_profile_id', 'kind', 'course_id').iterator():
+        interactions[kind].setdefault(user_profile_id, set()).add(course_id)
+    return interactions
+
+
+def get_most_similar_profile(prefs, courses_by_profile):
+    """
+    Returns the user profile that has the most courses (or subjects) in common with prefs, and how many
     """
+    my_courses = courses_by_profile.get(prefs.id, set())
     max_similar = 0
-    most_similar_user_profile = None
+    most_similar_id = None
+    for other_id in sorted(courses_by_profile):
+        if other_id == prefs.id:
+            continue
+        similar_courses = my_courses.intersection(courses_by_profile[other_id])
+        if len(similar_courses) > max_similar:
+            max_similar = len(similar_courses)
+            most_similar_id = other_id
+    if most_similar_id is None:
+        return None, 0
+    return UserProfile.objects.get(id=most_similar_id), max_similar
+
 
+def get_similar_user_dislikes(user, interactions=None):
+    """
+    Returns the most similar user to you based on shared dislikes
+    """
+    if interactions is None:
+        interactions = load_interactions([CourseInteraction.DISLIKED])
     prefs = UserProfile.objects.get(user=user)
-    my_dislikes = set(prefs.disliked.all())
-    for other_user in UserProfile.objects.all():
-        if other_user == prefs:
-            continue
-        similar_dislikes = my_dislikes.intersection(set(other_user.disliked.all()))
-        if len(similar_dislikes) > max_similar:
-            max_similar = len(similar_dislikes)
-            most_similar_user_profile = other_user
-    return most_similar_user_profile, max_similar
+    return get_most_similar_profile(prefs, interactions[CourseInteraction.DISLIKED])
 
 
-def get_similar_user_enrolled(user):
+def get_similar_user_enrolled(user, interactions=None):
     """
     Returns the most similar user to you based on shared enrolled
     """
-    max_similar = 0
-    most_similar_user_profile = None
-
+    if interactions is None:
+        interactions = load_interactions([CourseInteraction.ENROLLED])
     prefs = UserProfile.objects.get(user=user)
-    my_dislikes = set(prefs.enrolled.all())
-    for other_user in UserProfile.objects.all():
-        if other_user == prefs:
-            continue
-        similar_dislikes = my_dislikes.intersection(set(other_user.enrolled.all()))
-        if len(similar_dislikes) > max_similar:
-            max_similar = len(similar_dislikes)
-            most_similar_user_profile = other_user
-    return most_similar_user_profile, max_similar
+    return get_most_similar_profile(prefs, interactions[CourseInteraction.ENROLLED])
 
 
-def get_similar_user_completed(user):
+def get_similar_user_completed(user, interactions=None):
     """
     Returns the most similar user to you based on shared completed
     """
-    max_similar = 0
-    most_similar_user_profile = None
-
+    if interactions is None:
+        interactions = load_interactions([CourseInteraction.COMPLETED])
     prefs = UserProfile.objects.get(user=user)
-    my_completed = set(prefs.completed.all())
-    for other_user in UserProfile.objects.all():
-        if other_user == prefs:
-            continue
-        similar_completed = my_completed.intersection(set(other_user.completed.all()))
-        if len(similar_completed) > max_similar:
-            max_similar = len(my_completed)
-            most_similar_user_profile = other_user
-    return most_similar_user_profile, max_similar
+    return get_most_similar_profile(prefs, interactions[CourseInteraction.COMPLETED])
 
 
 def get_most_similar_user(user):
@@ -159,13 +161,14 @@ def get_most_similar_user(user):
     Computes scores and returns the user most similar to you
     """
     user_scores = defaultdict(int)
+    interactions = load_interactions()
     similar_user, score = get_similar_user_interests(user)
     user_scores[similar_user] += score
-    similar_user, score = get_similar_user_dislikes(user)
+    similar_user, score = get_similar_user_dislikes(user, interactions)
     user_scores[similar_user] += score
-    similar_user, score = get_similar_user_enrolled(user)
+    similar_user, score = get_similar_user_enrolled(user, interactions)
     user_scores[similar_user] += score
-    similar_user, score = get_similar_user_completed(user)
+    similar_user, score = get_similar_user_completed(user, interactions)
     user_scores[similar_user] += score
     max_score = 0
     best_user_profile = None
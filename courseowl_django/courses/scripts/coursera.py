@@ -1,46 +1,111 @@
-from courses.models import Course, Provider, Subject, Source
+from django.conf import settings
+import codecs
 import json
-import urllib2
+import re
 
-from courses.scripts.utilities import unify_subject_name
+from courses.scripts.fetcher import Fetcher
+from courses.scripts.ingest import ingest
+from courses.scripts.pipeline import ProviderAdapter
 
-def run():
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+topic_list_url = 'https://www.coursera.org/maestro/api/topic/list?full=1%20or%20https://www.coursera.org/maestro/api/topic/list2'
+
+
+def run(fetcher=None):
     """
     Main function of the script. Gets JSON, parses, and adds the information to database
     """
     print('Adding Cousera courses....')
-    coursera_json_url = 'https://www.coursera.org/maestro/api/topic/list?full=1%20or%20https://www.coursera.org/maestro/api/topic/list2'
-    coursera_dict = get_and_parse_json(coursera_json_url)
-    add_courses(coursera_dict)
+    if fetcher is None:
+        fetcher = Fetcher(cache_dir=settings.SCRAPER_CACHE_DIR)
+    topics = get_topics(topic_list_url, fetcher)
+    if topics is None:
+        print('The topic list has not changed since the last run.')
+        return
+    add_courses(topics)
+    fetcher.commit()  # only now, so a run that fails fetches the topic list again
     print("Done!")
 
 
-def get_and_parse_json(url):
+def get_topics(url, fetcher):
+    """
+    Streams the topic list from provider one topic at a time, or returns None if it hasn't changed.
+    Only one topic is held in memory at a time, however big the list gets.
+    """
+    page = fetcher.fetch(url, stream=True)
+    if not page.changed:
+        return None
+    return iter_json_array(page.iter_chunks())
+
+
+def iter_json_array(chunks):
     """
-    Gets JSON of all courses from provider and returns it as a dictionary
+    Yields the items of a JSON array one by one, decoding it from an iterable of UTF-8 chunks
     """
-    coursera_json_list = urllib2.urlopen(url)
-    coursera_json_dict = json.loads(coursera_json_list.read())
-    return coursera_json_dict
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = u''
+    started = False
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        position = 0
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('Expected a JSON array')
+                started = True
+                position += 1
+            elif buffer[position] == ']':
+                return
+            elif buffer[position] == ',':
+                position += 1
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    break  # the item continues in the next chunk
+                if end == len(buffer) and not isinstance(item, (dict, list)):
+                    break  # a number or literal might continue in the next chunk
+                yield item
+                position = end
+        buffer = buffer[position:]
+    raise ValueError('Unexpected end of JSON array')
+
+
+def topic_record(topic):
+    """
+    Keeps only the fields of a topic that are saved to the database
+    """
+    return {
+        'name': topic['name'],
+        'description': topic['short_description'],
+        'instructor': topic['instructor'],
+        'url': 'https://www.coursera.org/course/' + topic['short_name'],
+        'provider': 'Coursera',
+        'source': topic['universities'][0]['name'] if topic['universities'] else None,
+        'subjects': topic['category-ids'],
+    }
+
+
+class CourseraAdapter(ProviderAdapter):
+    name = 'coursera'
+
+    def tasks(self, fetcher):
+        return [topic_list_url]
+
+    def records(self, task, fetcher):
+        for topic in get_topics(task, fetcher) or []:
+            yield topic_record(topic)
 
 
 def add_courses(json_dict):
     """
-    Adds courses from JSON into the database
-    """
-    coursera_provider, created = Provider.objects.get_or_create(name='Coursera')
-
-    for course in json_dict:
-        url = 'https://www.coursera.org/course/' + course['short_name']
-        c, created = Course.objects.get_or_create(name=course['name'], description=course['short_description'], instructor=course['instructor'], url=url)
-        c.provider = coursera_provider
-        c.source, created = Source.objects.get_or_create(name=course['universities'][0]['name'])
-        c.save()
-        for category_id in course['category-ids']:
-            better_subject_name = unify_subject_name(category_id)
-            subject, created = Subject.objects.get_or_create(name=better_subject_name)
-            c.subjects.add(subject)
-        c.save()
+    Adds courses from JSON, or from an iterable of topics, into the database
+    """
+    return ingest(topic_record(topic) for topic in json_dict)
 
 
 if __name__ == '__main__':
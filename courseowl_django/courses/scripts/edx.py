@@ -1,9 +1,9 @@
-from courses.models import Provider, Course, Source, Subject
-import urllib2
 from bs4 import BeautifulSoup
+from django.conf import settings
 import re
 
-from courses.scripts.utilities import unify_subject_name
+from courses.scripts.fetcher import Fetcher
+from courses.scripts.pipeline import Pipeline, ProviderAdapter, format_stats
 
 all_subjects = [
     'business-management',
@@ -32,81 +32,116 @@ all_subjects = [
     'biology-life-sciences',
     'statistics-data-analysis'
 ]
-
-
-int_list = []
-uni_list = []
-title_list = []
-desc_list = []
-sub_list = []
-url_list = []
+pages_per_subject = 5
+COURSE_TITLE_CLASS = 'course-title'
 
 
 def run():
     """
     Main function
     """
-    populate_lists()
-    add_to_django()
+    print('Adding courses from edX (this will take a minute)...')
+    pipeline = Pipeline([EdxAdapter()], log_file=settings.INGEST_LOG_FILE)
+    pipeline.run()
+    print('Done!')
+    print(format_stats('edx', pipeline.stats['edx']))
 
 
-def populate_lists(subject_list=None):
+def course_records(subject_list=None, fetcher=None):
     """
-    Parses data from provider with BeautifulSoup into lists
+    Yields a record for every course of the given subjects, as soon as the crawl of its subject finishes.
+    Subjects are crawled concurrently.
     """
-    print('Adding courses from edX (this will take a minute)...')
-    
     if subject_list is None:
-        subjects = all_subjects
-    else:
-        subjects = subject_list
-
-    for subject in subjects:
-        for i in range(5):
-            url_str = 'https://www.edx.org/course-list/allschools/' + subject + '/allcourses'
-            if i >= 1:
-                url_str = url_str + '?page=' + unicode(i)
-            edx_web = BeautifulSoup(urllib2.urlopen(url_str).read())
-            for child in edx_web.find_all('h2', attrs={'class': 'title course-title'}):
-                course_info = child.parent
-                try:
-                    title_list.append(course_info.a.contents[0].rstrip('\n'))
-                    desc_list.append(course_info.div.contents[0].rstrip('\n'))
-                    sub_list.append(subject)
-                    url_list.append(course_info.a['href'])
-                except:
-                    pass
-
-            for inst_info in edx_web.find_all('ul', attrs={'class': 'clearfix'}):
-                instructor = re.search('(?<=Instructors:</span>)(.*)(?=</li>)', unicode(inst_info))
-                uni = re.search('(?<=<li><strong>)(.*)(?=</strong></li>)', unicode(inst_info))
-                try:
-                    int_list.append(instructor.group(0).rstrip('\n'))
-                    uni_list.append(uni.group(0).rstrip('\n'))
-                except:
-                    pass
-
-
-def add_to_django():
+        subject_list = all_subjects
+    if fetcher is None:
+        fetcher = Fetcher()
+
+    for records in fetcher.map(lambda subject: list(crawl_subject(subject, fetcher)), subject_list):
+        for record in records:
+            yield record
+
+
+def crawl_subject(subject, fetcher):
     """
-    Adds the data from the lists into appropriate fields of the database
+    Fetches and parses the course list pages of a subject, yielding a record per course and stopping at
+    the first page without courses. Pages that haven't changed since the last run are skipped, but only
+    after checking they still have courses.
     """
-    edx_provider, created = Provider.objects.get_or_create(name='edX')
-    for i in range(len(title_list)):
-        try:
-            print('Adding ' + title_list[i] + ' course: ' + str(i))
-        except:
-            pass
-        c, created = Course.objects.get_or_create(name=title_list[i], description=desc_list[i], instructor=int_list[i], url=url_list[i])
-        c.provider = edx_provider
-        c.source, created = Source.objects.get_or_create(name=uni_list[i])
-        c.save()
-        better_subject_name = unify_subject_name(sub_list[i])
-        subject, created = Subject.objects.get_or_create(name=better_subject_name)
-        c.subjects.add(subject)
-        c.save()
-    print('Done!')
-    print(str(len(title_list)) + ' courses added!')
+    for i in range(pages_per_subject):
+        fetched = fetcher.fetch(subject_page_url(subject, i))
+        if not fetched.changed:
+            if not has_courses(fetched.content):
+                break
+            continue
+        records = parse_page(fetched.content, subject)
+        if not records:
+            break
+        for record in records:
+            yield record
+
+
+class EdxAdapter(ProviderAdapter):
+    name = 'edx'
+
+    def tasks(self, fetcher):
+        return all_subjects
+
+    def records(self, task, fetcher):
+        return crawl_subject(task, fetcher)
+
+
+def subject_page_url(subject, page_number):
+    """
+    Returns the url of a page of the course list for a subject
+    """
+    url_str = 'https://www.edx.org/course-list/allschools/' + subject + '/allcourses'
+    if page_number >= 1:
+        url_str = url_str + '?page=' + unicode(page_number)
+    return url_str
+
+
+def has_courses(html):
+    """
+    Tells whether a course list page has courses, without parsing it
+    """
+    return COURSE_TITLE_CLASS in html
+
+
+def parse_page(html, subject):
+    """
+    Parses one course list page into a record per course. Courses missing a title, description or url
+    are left out, and a missing instructor or university is left empty.
+    """
+    records = []
+    edx_web = BeautifulSoup(html)
+    for child in edx_web.find_all('h2', attrs={'class': 'title ' + COURSE_TITLE_CLASS}):
+        course_info = child.parent
+        if course_info.a is None or not course_info.a.contents or course_info.div is None \
+                or not course_info.div.contents:
+            continue
+        record = {
+            'name': course_info.a.contents[0].rstrip('\n'),
+            'description': course_info.div.contents[0].rstrip('\n'),
+            'instructor': None,
+            'url': course_info.a.get('href'),
+            'provider': 'edX',
+            'source': None,
+            'subjects': [subject],
+        }
+        if not record['url']:
+            continue
+
+        inst_info = course_info.find('ul', attrs={'class': 'clearfix'})
+        if inst_info is not None:
+            instructor = re.search('(?<=Instructors:</span>)(.*)(?=</li>)', unicode(inst_info))
+            uni = re.search('(?<=<li><strong>)(.*)(?=</strong></li>)', unicode(inst_info))
+            if instructor:
+                record['instructor'] = instructor.group(0).rstrip('\n')
+            if uni:
+                record['source'] = uni.group(0).rstrip('\n')
+        records.append(record)
+    return records
 
 
 if __name__ == '__main__':
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Page(object):
+    """
+    A downloaded page. changed is False when the server answered 304 Not Modified, or sent the same body
+    as last time, in which case the scrapers don't need to parse it again.
+
+    Streamed pages have no content, their body is read with iter_chunks() from the cache file at path,
+    or straight from the response in chunks.
+    """
+    def __init__(self, url, content=None, changed=True, path=None, chunks=None):
+        self.url = url
+        self.content = content
+        self.changed = changed
+        self.path = path
+        self.chunks = chunks
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Yields the body in pieces of at most chunk_size bytes
+        """
+        if self.chunks is not None:
+            for chunk in self.chunks:
+                yield chunk
+        elif self.path is not None:
+            with open(self.path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), ''):
+                    yield chunk
+        else:
+            for i in range(0, len(self.content), chunk_size):
+                yield self.content[i:i + chunk_size]
+
+
+class Fetcher(object):
+    """
+    Downloads pages for the scrapers. Connections are kept alive and reused, each host gets at most
+    per_host requests at a time and at most one every delay seconds, and failed requests are retried
+    with exponential backoff.
+    With a cache_dir, responses are cached on disk and revalidated with conditional requests. The cache
+    entry of a changed page is only saved by commit(), so a page stays changed for later fetches and
+    runs until what was parsed from it is saved.
+    The clock and sleep functions are those of the time module, unless others are given.
+    """
+    def __init__(self, workers=8, per_host=4, retries=3, backoff=1.0, timeout=30, session=None, cache_dir=None,
+                 delay=0, clock=time.time, sleep=time.sleep):
+        self.workers = workers
+        self.per_host = per_host
+        self.delay = delay
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.session = session or make_session(workers)
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self._host_semaphores = {}
+        self._host_next_request = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def host_semaphore(self, url):
+        """
+        Returns the semaphore limiting concurrent requests to the host of url
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_semaphores[host]
+
+    def wait_for_turn(self, url):
+        """
+        Sleeps until the host of url may get another request, keeping requests delay seconds apart
+        """
+        if not self.delay:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = self.clock()
+            turn = max(now, self._host_next_request.get(host, now))
+            self._host_next_request[host] = turn + self.delay
+        self.sleep(turn - now)
+
+    def request(self, url, headers=None, stream=False):
+        """
+        Returns the response for url. Connection errors and server errors are retried, client errors are not.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.host_semaphore(url):
+                    self.wait_for_turn(url)
+                    response = self.session.get(url, headers=headers or {}, timeout=self.timeout, stream=stream)
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError('%s returned %d' % (url, response.status_code), response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt >= self.retries:
+                raise error
+            self.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def fetch(self, url, stream=False):
+        """
+        Returns the Page for url, revalidating the cached copy if there is one. With stream, the body is
+        never held in memory as a whole: it is written to the cache as it arrives, or read in chunks.
+        """
+        if self.cache is None:
+            response = self.request(url, stream=stream)
+            if stream:
+                return Page(url, chunks=response.iter_content(CHUNK_SIZE))
+            return Page(url, response.content)
+
+        entry = self.cache.lookup(url)
+        response = self.request(url, self.cache.conditional_headers(entry), stream=stream)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            if stream:
+                return Page(url, path=self.cache.body_file(entry['digest']), changed=False)
+            return Page(url, self.cache.body(entry['digest']), changed=False)
+        new_entry = self.cache.store(url, response)
+        with self._lock:
+            self._pending[url] = new_entry
+        changed = entry is None or entry['digest'] != new_entry['digest']
+        if stream:
+            return Page(url, path=self.cache.body_file(new_entry['digest']), changed=changed)
+        return Page(url, response.content, changed=changed)
+
+    def commit(self, urls=None):
+        """
+        Saves the cache entries of the given urls, or of every url fetched since, once what was parsed
+        from them is saved. Until then they are revalidated against the entries of before, and count
+        as changed.
+        """
+        for entry in self._take_pending(urls):
+            self.cache.save(entry)
+
+    def discard(self, urls=None):
+        """
+        Forgets the cache entries of the given urls, or of every url fetched since, for instance after
+        saving what was parsed from them failed
+        """
+        self._take_pending(urls)
+
+    def _take_pending(self, urls):
+        with self._lock:
+            if urls is None:
+                urls = self._pending.keys()
+            return [self._pending.pop(url) for url in urls if url in self._pending]
+
+    def get(self, url):
+        """
+        Returns the body of url
+        """
+        return self.fetch(url).content
+
+    def map(self, func, items):
+        """
+        Calls func on every item in a pool of worker threads, yielding the results as they finish
+        """
+        pool = ThreadPool(self.workers)
+        try:
+            for result in pool.imap_unordered(func, items):
+                yield result
+        finally:
+            pool.terminate()
+
+
+class HttpCache(object):
+    """
+    On-disk cache of responses. Bodies are stored once under the SHA-1 of their content, and each url
+    remembers the digest of its last body along with the ETag and Last-Modified headers that came with it.
+    """
+    def __init__(self, path):
+        self.path = path
+        for directory in ('bodies', 'urls'):
+            if not os.path.isdir(os.path.join(path, directory)):
+                os.makedirs(os.path.join(path, directory))
+
+    def url_file(self, url):
+        return os.path.join(self.path, 'urls', hashlib.sha1(url).hexdigest() + '.json')
+
+    def body_file(self, digest):
+        return os.path.join(self.path, 'bodies', digest)
+
+    def lookup(self, url):
+        """
+        Returns the cache entry for url, or None if it has never been fetched
+        """
+        try:
+            with open(self.url_file(url)) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if not os.path.exists(self.body_file(entry['digest'])):
+            return None
+        return entry
+
+    def conditional_headers(self, entry):
+        """
+        Returns the headers asking the server to only send the page if it changed since entry
+        """
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body(self, digest):
+        with open(self.body_file(digest), 'rb') as f:
+            return f.read()
+
+    def store(self, url, response):
+        """
+        Saves the body of a response, and returns the cache entry for it: the digest of the body and the
+        ETag and Last-Modified headers that came with it. The entry itself is saved by save().
+        The body is written as it is read, so it doesn't have to fit in memory.
+        """
+        sha1 = hashlib.sha1()
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.path, 'bodies'))
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                sha1.update(chunk)
+                f.write(chunk)
+        digest = sha1.hexdigest()
+        if os.path.exists(self.body_file(digest)):
+            os.remove(temp_path)
+        else:
+            os.rename(temp_path, self.body_file(digest))
+        return {'url': url, 'digest': digest, 'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')}
+
+    def save(self, entry):
+        """
+        Makes entry the cache entry of its url, see lookup()
+        """
+        write_atomically(self.url_file(entry['url']), json.dumps(entry))
+
+
+def write_atomically(path, content):
+    """
+    Writes content to path through a temporary file, so readers never see a partial file
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.rename(temp_path, path)
+
+
+def make_session(pool_size):
+    """
+    Returns a requests session that keeps up to pool_size connections per host open
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
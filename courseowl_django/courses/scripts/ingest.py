@@ -0,0 +1,158 @@
+import hashlib
+from collections import OrderedDict
+from django.db import transaction
+from django.utils.encoding import force_text
+from courses.models import CatalogVersion, Course, Provider, Source
+from courses.scripts.utilities import unify_subject_name
+from courses.subjects import NameMap, SubjectResolver
+
+COURSE_FIELDS = ('name', 'description', 'instructor')
+
+
+def ingest(records, batch_size=500, changed_ids=None, subjects=None):
+    """
+    Saves scraped courses to the database in bulk. Each record is a dict with the keys name, description,
+    instructor, url, provider, source (or None) and subjects (a list of raw subject names).
+
+    Courses are matched by url: new ones are inserted, and existing ones are only written when their
+    fingerprint, a hash of everything scraped about them, changed. Subjects are only ever added.
+    Records without a url can't be matched and are skipped. Everything happens in one transaction,
+    with a fixed number of queries per batch. The catalog versions of what changed are bumped once
+    the transaction is committed.
+
+    Returns the number of courses created, updated and left unchanged. If changed_ids is a set, the ids
+    of courses that were created or updated are added to it.
+
+    A SubjectResolver can be passed in to share subject names and ids across calls, for instance by a
+    Pipeline that ingests a run in several batches. Otherwise one is loaded for this call.
+    """
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    if changed_ids is None:
+        changed_ids = set()
+    with CatalogVersion.objects.deferred_bumps(), transaction.atomic():
+        providers = NameMap(Provider)
+        sources = NameMap(Source)
+        if subjects is None:
+            subjects = SubjectResolver()
+        subjects_created = subjects.created
+        batch = []
+        for record in records:
+            if not record.get('url'):
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                ingest_batch(batch, providers, sources, subjects, counts, changed_ids)
+                batch = []
+        if batch:
+            ingest_batch(batch, providers, sources, subjects, counts, changed_ids)
+
+        changed = [name for name, created in (('provider', providers.created), ('source', sources.created),
+                                              ('subject', subjects.created - subjects_created)) if created]
+        if counts['created'] or counts['updated']:
+            changed.append('course')
+        if changed:
+            CatalogVersion.objects.bump(*changed)
+    return counts
+
+
+def ingest_batch(records, providers, sources, subjects, counts, changed_ids):
+    """
+    Inserts and updates one batch of records. A course is only written when its fingerprint changed.
+    """
+    courses = merge_records(records, subjects)
+    providers.resolve(course['provider'] for course in courses.itervalues() if course['provider'])
+    sources.resolve(course['source'] for course in courses.itervalues() if course['source'])
+    subjects.resolve(name for course in courses.itervalues() for name in course['subjects'])
+
+    existing = dict((row['url'], row) for row in
+                    Course.objects.filter(url__in=courses.keys()).values('id', 'url', 'fingerprint'))
+    current_subjects = dict((row['id'], set()) for row in existing.itervalues())
+    through = Course.subjects.through
+    for course_id, subject_id in through.objects.filter(course_id__in=current_subjects.keys()) \
+            .values_list('course_id', 'subject_id'):
+        current_subjects[course_id].add(subjects.name(subject_id))
+
+    new_courses = []
+    links = []
+    for url, course in courses.iteritems():
+        values = dict((field, course[field]) for field in COURSE_FIELDS)
+        values['provider_id'] = providers.get(course['provider'])
+        values['source_id'] = sources.get(course['source'])
+        # subjects are only ever added, so the course ends up with the ones it has and the new ones
+        had_subjects = current_subjects.get(existing[url]['id'], set()) if url in existing else set()
+        values['fingerprint'] = fingerprint(url, course, had_subjects.union(course['subjects']))
+
+        if url not in existing:
+            new_courses.append(Course(url=url, **values))
+            counts['created'] += 1
+        elif existing[url]['fingerprint'] != values['fingerprint']:
+            course_id = existing[url]['id']
+            values['provider'] = values.pop('provider_id')
+            values['source'] = values.pop('source_id')
+            Course.objects.filter(id=course_id).update(**values)
+            links.extend((course_id, subjects.get(name)) for name in course['subjects'] if name not in had_subjects)
+            changed_ids.add(course_id)
+            counts['updated'] += 1
+        else:
+            counts['unchanged'] += 1
+
+    if new_courses:
+        Course.objects.bulk_create(new_courses)
+        new_urls = [new_course.url for new_course in new_courses]
+        new_ids = dict(Course.objects.filter(url__in=new_urls).values_list('url', 'id'))
+        for url in new_urls:
+            links.extend((new_ids[url], subjects.get(name)) for name in courses[url]['subjects'])
+            changed_ids.add(new_ids[url])
+
+    through.objects.bulk_create([through(course_id=course_id, subject_id=subject_id)
+                                 for course_id, subject_id in links])
+
+
+def fingerprint(url, course, subject_names):
+    """
+    Hash of everything scraped about a course, used to tell if it changed since it was last saved
+    """
+    fields = [url, course['name'], course['description'], course['instructor'] or u'',
+              course['provider'] or u'', course['source'] or u''] + sorted(subject_names)
+    return hashlib.sha1(u'\x00'.join(fields).encode('utf-8')).hexdigest()
+
+
+def merge_records(records, subjects=None):
+    """
+    Collapses records with the same url into one course, with their subjects combined
+    """
+    courses = OrderedDict()
+    for record in records:
+        record = normalize_record(record, subjects)
+        url = record.pop('url')
+        if url not in courses:
+            courses[url] = record
+        else:
+            for subject_name in record['subjects']:
+                if subject_name not in courses[url]['subjects']:
+                    courses[url]['subjects'].append(subject_name)
+    return courses
+
+
+def normalize_record(record, subject_resolver=None):
+    """
+    Returns a copy of a record with its text as unicode and its subject names unified, with the
+    resolver if there is one
+    """
+    subjects = []
+    for subject_name in record.get('subjects', []):
+        if subject_resolver is not None:
+            subject_name = subject_resolver.unify(subject_name)
+        else:
+            subject_name = unify_subject_name(force_text(subject_name))
+        if subject_name not in subjects:
+            subjects.append(subject_name)
+    return {
+        'name': force_text(record['name']),
+        'description': force_text(record['description']),
+        'instructor': force_text(record['instructor']) if record.get('instructor') is not None else None,
+        'url': force_text(record['url']),
+        'provider': force_text(record['provider']) if record.get('provider') else None,
+        'source': force_text(record['source']) if record.get('source') else None,
+        'subjects': subjects,
+    }
@@ -0,0 +1,66 @@
+import os
+import time
+from django.conf import settings
+from courses.models import Course, Provider, Source, Subject
+from courses.scripts.fetcher import Fetcher, make_session
+from courses.scripts.pipeline import Pipeline, get_adapters
+from courses.scripts.replay import Archive, RecordingSession, ReplaySession
+from courses.scripts.search_benchmark import test_database
+
+ARCHIVE = os.path.join(settings.BASE_DIR, 'scraper_archive')
+
+
+def run(mode='replay', archive_path=ARCHIVE, providers='coursera,edx,iversity,udacity', latency='0.05',
+        workers='1,4,16', batch_size='500'):
+    """
+    Records full crawls of the providers to an archive once, then benchmarks the ingest pipeline by
+    replaying them with artificial latency, with no network needed. Both run against a throwaway test
+    database, and the search index is left alone:
+
+        ./manage.py runscript ingest_benchmark --script-args record scraper_archive
+        ./manage.py runscript ingest_benchmark --script-args replay scraper_archive edx,coursera 0.05 1,4,16
+
+    A latency of 0 measures parsing and database writes alone.
+    """
+    archive = Archive(archive_path)
+    adapters = get_adapters(providers.split(','))
+    with test_database():
+        if mode == 'record':
+            fetcher = Fetcher(session=RecordingSession(make_session(8), archive))
+            Pipeline(adapters, fetcher, update_index=False).run()
+            print('%d responses recorded in %s' % (len(archive), archive_path))
+            return
+
+        print('%d recorded responses, %sms latency' % (len(archive), float(latency) * 1000))
+        for worker_count in workers.split(','):
+            result = benchmark(adapters, archive, float(latency), int(worker_count), int(batch_size))
+            report(result)
+
+
+def benchmark(adapters, archive, latency, workers, batch_size=500):
+    """
+    Ingests the archive into an empty catalog with the given number of fetch workers, and returns timings
+    """
+    for model in (Course, Provider, Source, Subject):
+        model.objects.all().delete()
+
+    session = ReplaySession(archive, latency)
+    pipeline = Pipeline(adapters, Fetcher(session=session, workers=workers, retries=0), batch_size,
+                        update_index=False)
+    start = time.time()
+    counts = pipeline.run()
+    return {
+        'workers': workers,
+        'elapsed': time.time() - start,
+        'requests': session.requests,
+        'misses': session.misses,
+        'records': sum(stats['records'] for stats in pipeline.stats.itervalues()),
+        'errors': sum(stats['errors'] for stats in pipeline.stats.itervalues()),
+        'created': counts['created'],
+        'write_time': sum(stats['write_time'] for stats in pipeline.stats.itervalues()),
+    }
+
+
+def report(result):
+    print('  %(workers)2d workers: %(elapsed)6.2fs, %(requests)d requests (%(misses)d not recorded), '
+          '%(records)d records, %(created)d courses, %(errors)d errors, %(write_time).2fs writing' % result)
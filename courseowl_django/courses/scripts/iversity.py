@@ -1,35 +1,55 @@
-from courses.models import Provider, Course, Subject
-import urllib2
+from django.conf import settings
 from bs4 import BeautifulSoup
 
-from courses.scripts.utilities import unify_subject_name
+from courses.scripts.ingest import ingest
+from courses.scripts.pipeline import Pipeline, ProviderAdapter, format_stats
+
+course_list_url = 'https://iversity.org/courses'
 
 def run():
     """
     Main function
     """
     print("Adding courses from iversity (this will take a minute)...")
-    scrape()
+    pipeline = Pipeline([IversityAdapter()], log_file=settings.INGEST_LOG_FILE)
+    pipeline.run()
+    print(format_stats('iversity', pipeline.stats['iversity']))
+
+
+class IversityAdapter(ProviderAdapter):
+    name = 'iversity'
+
+    def tasks(self, fetcher):
+        return [course_list_url]
+
+    def records(self, task, fetcher):
+        page = fetcher.fetch(task)
+        if page.changed:
+            for record in parse_course_list(page.content):
+                yield record
 
 
-def scrape():
+def parse_course_list(html):
     """
-    Scrapes information from the provider website
+    Yields a record for every course in the course list
     """
-    provider, created = Provider.objects.get_or_create(name='iversity')
-    iversity_web = BeautifulSoup(urllib2.urlopen('https://iversity.org/courses').read())
-    course_divs = iversity_web.find_all('article', class_='courses-list-item')
-
-    for item in course_divs:
-        create_course(item, provider)
+    iversity_web = BeautifulSoup(html)
+    for item in iversity_web.find_all('article', class_='courses-list-item'):
+        yield parse_course(item, 'iversity')
 
 
 def create_course(item, provider):
     """
     Creates courses in database based on data parsed from provider
     """
+    ingest([parse_course(item, provider.name)])
+
+
+def parse_course(item, provider_name):
+    """
+    Parses a course from its item in the course list
+    """
     subject = item.find('div', class_='ribbon-content').text.strip().lower()  # subjects are stored lowercase in the DB
-    subject = unify_subject_name(subject)
     course_info = item.find('div', class_='course-body')
     title = course_info.a.text
     instructor_description_paragraphs = item.find_all('p')
@@ -37,7 +57,12 @@ def create_course(item, provider):
     description = instructor_description_paragraphs[1].text.strip()
     url = item.a.attrs['href']
 
-    course, created = Course.objects.get_or_create(name=title, url=url, description=description, instructor=instructor, provider=provider)
-    subject, created = Subject.objects.get_or_create(name=subject)
-    course.subjects.add(subject)
-    course.save()
+    return {
+        'name': title,
+        'description': description,
+        'instructor': instructor,
+        'url': url,
+        'provider': provider_name,
+        'source': None,
+        'subjects': [subject],
+    }
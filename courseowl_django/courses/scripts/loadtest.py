@@ -0,0 +1,238 @@
+import random
+import threading
+import time
+import requests
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from accounts.models import CourseInteraction, User, UserProfile
+from accounts.views import username_md5
+from courses.models import CatalogVersion, Course, Provider, Source, Subject
+from courses.scripts.search_benchmark import PROVIDERS, SOURCES, SUBJECTS, WORDS, percentile
+
+URL_PREFIX = 'http://loadtest.example.com/course/'
+EMAIL_DOMAIN = '@loadtest.example.com'
+EMAIL = 'user%d' + EMAIL_DOMAIN
+PASSWORD = 'loadtest123'
+
+# Courses every user is given: 8 enrolled, 4 completed and 3 disliked, so a population needs at least as many
+COURSES_PER_USER = 15
+
+# How often each action is picked, relative to the others
+MIX = {
+    'login': 5,
+    'profile': 20,
+    'course_info': 35,
+    'enroll': 10,
+    'drop': 10,
+    'search': 20,
+}
+
+
+def is_seeded():
+    return Course.objects.filter(url__startswith=URL_PREFIX).exists()
+
+
+def seed(num_courses=20000, num_users=1000, seed=428, batch_size=1000):
+    """
+    Fills the database with a reproducible population for load tests: num_courses synthetic courses
+    with two subjects each, and num_users users with interests and enrolled, completed and disliked
+    courses. Rows are inserted in bulk, batch_size at a time, in one transaction. Every user logs in
+    with EMAIL % i and PASSWORD. There must be at least COURSES_PER_USER courses.
+    """
+    rand = random.Random(seed)
+    with transaction.atomic():
+        subjects = [Subject.objects.get_or_create(name=name)[0].id for name in SUBJECTS]
+        providers = [Provider.objects.get_or_create(name=name)[0].id for name in PROVIDERS]
+        sources = [Source.objects.get_or_create(name=name)[0].id for name in SOURCES]
+
+        for start in range(0, num_courses, batch_size):
+            Course.objects.bulk_create([
+                Course(name=' '.join(rand.sample(WORDS, 3)).title(), url=URL_PREFIX + str(i),
+                       description=' '.join(rand.choice(WORDS) for j in range(40)), instructor='Instructor %d' % i,
+                       provider_id=rand.choice(providers), source_id=rand.choice(sources))
+                for i in range(start, min(start + batch_size, num_courses))])
+        courses = list(Course.objects.filter(url__startswith=URL_PREFIX).values_list('id', flat=True))
+        bulk_create(Course.subjects.through, [
+            Course.subjects.through(course_id=course_id, subject_id=subject_id)
+            for course_id in courses for subject_id in rand.sample(subjects, 2)], batch_size)
+
+        password = make_password(PASSWORD)  # hashing is slow on purpose, so do it once
+        for start in range(0, num_users, batch_size):
+            User.objects.bulk_create([
+                User(username=username_md5(EMAIL % i), email=EMAIL % i, password=password)
+                for i in range(start, min(start + batch_size, num_users))])
+        users = list(User.objects.filter(email__endswith=EMAIL_DOMAIN).values_list('id', flat=True))
+        bulk_create(UserProfile, [UserProfile(user_id=user_id) for user_id in users], batch_size)
+
+        interests, interactions = [], []
+        for profile_id in UserProfile.objects.filter(user__email__endswith=EMAIL_DOMAIN).values_list('id', flat=True):
+            for subject_id in rand.sample(subjects, 3):
+                interests.append(UserProfile.interests.through(userprofile_id=profile_id, subject_id=subject_id))
+            picked = rand.sample(courses, COURSES_PER_USER)
+            for kind, course_ids in ((CourseInteraction.ENROLLED, picked[:8]),
+                                     (CourseInteraction.COMPLETED, picked[8:12]),
+                                     (CourseInteraction.DISLIKED, picked[12:])):
+                interactions.extend((profile_id, kind, course_id) for course_id in course_ids)
+        bulk_create(UserProfile.interests.through, interests, batch_size)
+
+        # bulk inserts don't send m2m_changed, so the interactions are mirrored here
+        for kind, name in CourseInteraction.KINDS:
+            through = getattr(UserProfile, name).through
+            bulk_create(through, [through(userprofile_id=profile_id, course_id=course_id)
+                                  for profile_id, row_kind, course_id in interactions if row_kind == kind],
+                        batch_size)
+        bulk_create(CourseInteraction, [CourseInteraction(user_profile_id=profile_id, kind=kind, course_id=course_id)
+                                        for profile_id, kind, course_id in interactions], batch_size)
+        CatalogVersion.objects.bump('course', 'subject', 'provider', 'source')
+    return len(courses), len(users)
+
+
+def bulk_create(model, objects, batch_size):
+    for start in range(0, len(objects), batch_size):
+        model.objects.bulk_create(objects[start:start + batch_size])
+
+
+class LoadTest(object):
+    """
+    Sends a mix of requests to a running server from workers concurrent clients, each logged in as
+    one of the seeded users, and records the latency of every request per action. Actions are picked
+    at random with the weights in mix. Runs until num_requests requests were sent in total, or for
+    duration seconds.
+    """
+    def __init__(self, base_url, workers=8, duration=60, num_requests=None, mix=None, seed=428):
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.duration = duration
+        self.num_requests = num_requests
+        self.mix = sorted((mix or MIX).items())
+        self.rand = random.Random(seed)
+        self.num_users = User.objects.filter(email__endswith=EMAIL_DOMAIN).count()
+        self.courses = list(Course.objects.filter(url__startswith=URL_PREFIX).values_list('id', flat=True))
+        self.latencies = dict((action, []) for action, weight in self.mix)
+        self.errors = dict((action, 0) for action, weight in self.mix)
+        self.elapsed = 0.0
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        """
+        Runs the workers to the end and returns the stats, see report()
+        """
+        if not self.num_users or not self.courses:
+            raise ValueError('No load test population, seed it first')
+        threads = [threading.Thread(target=self.worker, args=(random.Random(self.rand.random()),))
+                   for i in range(self.workers)]
+        start = time.time()
+        self.deadline = start + self.duration
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.time() - start
+        return self.report()
+
+    def next_request(self):
+        """
+        Counts a request about to be sent, and returns False when the run is over
+        """
+        with self._lock:
+            if self.num_requests is not None and self.sent >= self.num_requests:
+                return False
+            if self.num_requests is None and time.time() >= self.deadline:
+                return False
+            self.sent += 1
+            return True
+
+    def worker(self, rand):
+        session = requests.Session()
+        total = sum(weight for action, weight in self.mix)
+        action = 'login'  # as the user would first
+        while self.next_request():
+            self.send(action, session, rand)
+            pick = rand.uniform(0, total)
+            for action, weight in self.mix:
+                pick -= weight
+                if pick <= 0:
+                    break
+
+    def send(self, action, session, rand):
+        """
+        Runs one action and records how long it took, and whether it failed
+        """
+        start = time.time()
+        try:
+            ok = getattr(self, action)(session, rand)
+        except (requests.RequestException, ValueError):  # ValueError if an API response isn't JSON
+            ok = False
+        latency = time.time() - start
+        with self._lock:
+            self.latencies.setdefault(action, []).append(latency)
+            if not ok:
+                self.errors[action] = self.errors.get(action, 0) + 1
+
+    def post(self, session, path, data):
+        return session.post(self.base_url + path, data, headers={'X-CSRFToken': session.cookies.get('csrftoken', ''),
+                                                                  'Referer': self.base_url + path})
+
+    def login(self, session, rand):
+        session.cookies.clear()
+        session.get(self.base_url + '/accounts/login/')  # for the CSRF cookie
+        response = self.post(session, '/accounts/login/', {'email': EMAIL % rand.randrange(self.num_users),
+                                                           'password': PASSWORD})
+        return response.ok and response.url.endswith('/accounts/profile/')
+
+    def profile(self, session, rand):
+        return session.get(self.base_url + '/accounts/profile/').ok
+
+    def course_info(self, session, rand):
+        response = self.post(session, '/api/course_info/', {'course_id': rand.choice(self.courses)})
+        return response.ok and response.json()['success']
+
+    def enroll(self, session, rand):
+        response = self.post(session, '/api/enroll/', {'course_to_add': rand.choice(self.courses)})
+        return response.ok and response.json()['success']
+
+    def drop(self, session, rand):
+        response = self.post(session, '/api/drop/', {'course_to_drop': rand.choice(self.courses)})
+        return response.ok and response.json()['success']
+
+    def search(self, session, rand):
+        return session.get(self.base_url + '/search/', params={'q': ' '.join(rand.sample(WORDS, 2))}).ok
+
+    def report(self):
+        """
+        Returns {action: stats} with the number of requests, errors, requests per second and latency
+        percentiles in seconds of every action, and the same for all of them under 'total'
+        """
+        stats = {}
+        everything = []
+        for action, latencies in self.latencies.iteritems():
+            everything.extend(latencies)
+            stats[action] = summarize(latencies, self.errors.get(action, 0), self.elapsed)
+        stats['total'] = summarize(everything, sum(self.errors.itervalues()), self.elapsed)
+        return stats
+
+
+def summarize(latencies, errors, elapsed):
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'per_second': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def format_report(stats):
+    """
+    Returns one line per action, and the totals last
+    """
+    lines = []
+    for action in sorted(stats, key=lambda action: (action == 'total', action)):
+        lines.append('%-12s %6d requests %7.1f/s  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms  %d errors' % (
+            action, stats[action]['requests'], stats[action]['per_second'], 1000 * stats[action]['p50'],
+            1000 * stats[action]['p95'], 1000 * stats[action]['p99'], stats[action]['errors']))
+    return lines
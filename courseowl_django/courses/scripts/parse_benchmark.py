@@ -0,0 +1,37 @@
+import os
+import time
+from courses.scripts import udacity
+from courses.scripts.fetcher import Fetcher
+from courses.scripts.replay import ArchivedResponse
+
+COURSE_PAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fixtures', 'udacity_course_page.html')
+
+
+class SamePageSession(object):
+    """
+    Answers every request with the same saved page, without any latency
+    """
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, url, **kwargs):
+        return ArchivedResponse(url, 200, self.content, {'Content-Type': 'text/html'})
+
+
+def run(pages='200', workers='1,8'):
+    """
+    Measures how fast Udacity course pages are fetched and parsed, by serving a saved course page for
+    every url, so the time is spent in the fetcher and the parser alone:
+
+        ./manage.py runscript parse_benchmark --script-args 200 1,8
+    """
+    with open(COURSE_PAGE) as f:
+        content = f.read()
+    urls = ['https://www.udacity.com/course/cs%03d' % i for i in range(int(pages))]
+    for worker_count in workers.split(','):
+        fetcher = Fetcher(session=SamePageSession(content), workers=int(worker_count))
+        start = time.time()
+        udacity.get_all_courses(urls, fetcher)
+        elapsed = time.time() - start
+        print('%2s workers: %d pages in %.2fs, %.0f pages/s' % (worker_count, len(urls), elapsed,
+                                                              len(urls) / elapsed))
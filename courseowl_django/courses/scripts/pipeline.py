@@ -0,0 +1,400 @@
+import Queue
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_by_path
+from haystack import connections
+from courses.models import Course, IngestRun
+from courses.scripts.fetcher import Fetcher
+from courses.scripts.ingest import ingest, normalize_record
+from courses.subjects import SubjectResolver
+
+logger = logging.getLogger(__name__)
+
+ADAPTERS = {
+    'coursera': 'courses.scripts.coursera.CourseraAdapter',
+    'edx': 'courses.scripts.edx.EdxAdapter',
+    'iversity': 'courses.scripts.iversity.IversityAdapter',
+    'udacity': 'courses.scripts.udacity.UdacityAdapter',
+}
+
+
+class ProviderAdapter(object):
+    """
+    Knows how to get course records out of one provider. Subclasses set name to the provider's key in
+    ADAPTERS and implement both methods. tasks() lists independent units of work, i.e. pages or subjects,
+    and records() turns one of them into course records. Fetching, normalizing, saving and indexing the
+    records is left to the Pipeline, which runs tasks of all adapters concurrently.
+    """
+    __metaclass__ = ABCMeta
+
+    name = None
+
+    @abstractmethod
+    def tasks(self, fetcher):
+        """
+        Returns the units of work for a run, which have to be JSON serializable so runs can be checkpointed
+        """
+
+    @abstractmethod
+    def records(self, task, fetcher):
+        """
+        Yields the course records for one unit of work, as dicts in the format ingest() takes. Called in a
+        worker thread, and should only fetch pages through fetcher. Records are saved as they come, so
+        a big task should yield them one by one rather than build a list.
+        """
+
+
+STAT_KEYS = ('records', 'duplicates', 'errors', 'pages', 'bytes', 'fetch_time', 'parse_time', 'write_time',
+             'index_time', 'created', 'updated', 'unchanged', 'queries')
+
+
+def get_adapters(names=None):
+    """
+    Returns adapters for the given provider names, or for all of them
+    """
+    if names is None:
+        names = sorted(ADAPTERS)
+    adapters = []
+    for name in names:
+        if name not in ADAPTERS:
+            raise ValueError('Unknown provider %s, choose from %s' % (name, ', '.join(sorted(ADAPTERS))))
+        adapters.append(import_by_path(ADAPTERS[name])())
+    return adapters
+
+
+class MeteredFetcher(object):
+    """
+    Wraps a Fetcher to count the pages fetched and bytes downloaded for one provider, and the time spent fetching them.
+    The time is also kept per thread in local.fetch_time, so the time a task spent parsing can be told apart,
+    and the urls in local.urls, so their cache entries can be committed once the task is saved.
+    """
+    def __init__(self, fetcher, stats, lock):
+        self.fetcher = fetcher
+        self.stats = stats
+        self.lock = lock
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
+
+    def fetch(self, url, stream=False):
+        start = time.time()
+        page = self.fetcher.fetch(url, stream)
+        elapsed = time.time() - start
+        self.local.fetch_time = getattr(self.local, 'fetch_time', 0.0) + elapsed
+        self.local.urls = getattr(self.local, 'urls', []) + [url]
+        if not page.changed:  # the body came out of the cache, not over the network
+            size = 0
+        elif page.chunks is not None:
+            page.chunks = self.count_chunks(page.chunks)
+            size = 0
+        elif page.path is not None:
+            size = os.path.getsize(page.path)
+        else:
+            size = len(page.content)
+        with self.lock:
+            self.stats['pages'] += 1
+            self.stats['bytes'] += size
+            self.stats['fetch_time'] += elapsed
+        return page
+
+    def get(self, url):
+        return self.fetch(url).content
+
+    def count_chunks(self, chunks):
+        """
+        Counts the bytes of a streamed page as they are read
+        """
+        for chunk in chunks:
+            with self.lock:
+                self.stats['bytes'] += len(chunk)
+            yield chunk
+
+
+class QueryCounter(object):
+    """
+    Counts the queries run on a database connection inside a with block. The connection logs its queries
+    for the while, and what it logged is dropped afterwards, unless it was logging them already.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+
+    def __enter__(self):
+        self.use_debug_cursor = self.connection.use_debug_cursor
+        self.initial = len(self.connection.queries)
+        self.connection.use_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.count = len(self.connection.queries) - self.initial
+        self.connection.use_debug_cursor = self.use_debug_cursor
+        if not (self.use_debug_cursor or settings.DEBUG):
+            del self.connection.queries[self.initial:]
+
+
+def format_stats(name, stats):
+    """
+    Returns a one line summary of the stats of a provider
+    """
+    return ('%s: %d pages (%.1f/s, %.1f kB), %d records, %d duplicates, %d errors, %d created, %d updated, '
+            '%d unchanged, %d queries; %.2fs fetching, %.2fs parsing, %.2fs writing, %.2fs indexing' % (
+                name, stats['pages'], stats.get('pages_per_second', 0), stats['bytes'] / 1024.0, stats['records'],
+                stats['duplicates'], stats['errors'], stats['created'], stats['updated'], stats['unchanged'],
+                stats['queries'], stats['fetch_time'], stats['parse_time'], stats['write_time'],
+                stats['index_time']))
+
+
+class Pipeline(object):
+    """
+    Runs provider adapters: their tasks are fetched concurrently through one Fetcher, the records are
+    normalized, duplicates dropped, and the rest saved in batches. Worker threads hand the records over
+    in chunks of at most batch_size through a bounded queue, so only a few chunks are held in memory
+    however many records a task has. Subject names are resolved by one
+    SubjectResolver for the whole run. Courses that changed are updated in
+    the search index. A task that fails is logged and counted, and doesn't stop the others.
+
+    With checkpoints, every provider's progress is kept in an IngestRun: a task is marked completed once
+    its courses are saved, and a run that didn't finish is resumed by the next pipeline, which skips the
+    tasks that were completed. The cache entries of the pages of a task are only committed once its
+    courses are saved too, so pages whose courses were never saved count as changed on the next run.
+
+    Every run is recorded in an IngestRun along with its stats per provider: pages fetched and how fast,
+    bytes downloaded, time spent fetching, parsing, writing and indexing, courses created, updated and
+    unchanged and queries issued. With a log_file, the stats are also appended to it as JSON lines.
+    """
+    def __init__(self, adapters, fetcher=None, batch_size=500, update_index=True, using='default',
+                 checkpoints=False, log_file=None):
+        self.adapters = adapters
+        self.fetcher = fetcher or Fetcher(cache_dir=settings.SCRAPER_CACHE_DIR, delay=settings.SCRAPER_HOST_DELAY)
+        self.batch_size = batch_size
+        self.update_index = update_index
+        self.using = using
+        self.checkpoints = checkpoints
+        self.log_file = log_file
+        self.stats = dict((adapter.name, dict.fromkeys(STAT_KEYS, 0)) for adapter in adapters)
+        self.counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+        self.changed_ids = dict((adapter.name, set()) for adapter in adapters)
+        self.runs = {}
+        self.subjects = None
+        self._started = {}
+        self._fetchers = {}
+        self._seen = {}
+        self._aborted = False
+        self._lock = threading.Lock()
+
+    def run(self):
+        """
+        Runs every task of every adapter, and returns the number of courses created, updated and unchanged
+        """
+        self.subjects = SubjectResolver()
+        tasks = []
+        for adapter in self.adapters:
+            self._started[adapter.name] = time.time()
+            completed = self.start(adapter)
+            fetcher = self._fetchers[adapter.name]
+            try:
+                adapter_tasks = list(adapter.tasks(fetcher))
+            except Exception:
+                logger.exception('Could not list the tasks of %s', adapter.name)
+                self.stats[adapter.name]['errors'] += 1
+                continue
+            tasks.extend((adapter, task) for task in adapter_tasks if task not in completed)
+
+        chunks = Queue.Queue(maxsize=self.fetcher.workers)
+        producer = threading.Thread(target=self.produce, args=(tasks, chunks))
+        producer.daemon = True
+        producer.start()
+
+        # batches are kept per adapter, so the time spent writing them can be put down to a provider
+        batches = dict((adapter.name, ([], [], [])) for adapter in self.adapters)
+        try:
+            for adapter, task, records, finished, urls in iter(chunks.get, None):
+                if records is None:
+                    self.fetcher.discard(urls)  # failed, so not completed either
+                    continue
+                batch, saved_tasks, saved_urls = batches[adapter.name]
+                for record in records:
+                    record = self.dedupe(adapter, normalize_record(record, self.subjects))
+                    if record is not None:
+                        batch.append(record)
+                if finished:
+                    saved_tasks.append((adapter, task))
+                    saved_urls.extend(urls)
+                if len(batch) >= self.batch_size:
+                    self.save(adapter.name, batch, saved_tasks, saved_urls)
+                    batches[adapter.name] = ([], [], [])
+        except BaseException:
+            # stop the workers, and let those waiting to hand over a chunk finish
+            self._aborted = True
+            for chunk in iter(chunks.get, None):
+                pass
+            raise
+        for adapter in self.adapters:
+            self.save(adapter.name, *batches[adapter.name])
+
+        if self.update_index:
+            for adapter in self.adapters:
+                self.reindex(adapter.name, sorted(self.changed_ids[adapter.name]))
+        self.finish()
+        return self.counts
+
+    def start(self, adapter):
+        """
+        Starts a run of an adapter and returns the tasks it can skip. With checkpoints, that is the
+        unfinished run of the adapter if there is one, and the tasks it completed.
+        """
+        ingest_run = None
+        if self.checkpoints:
+            ingest_run = IngestRun.objects.filter(provider=adapter.name, finished_at=None) \
+                .order_by('-started_at').first()
+        if ingest_run is None:
+            ingest_run = IngestRun.objects.create(provider=adapter.name)
+        self.runs[adapter.name] = ingest_run
+        self._fetchers[adapter.name] = MeteredFetcher(self.fetcher, self.stats[adapter.name], self._lock)
+        return set(ingest_run.get_completed_tasks())
+
+    def produce(self, tasks, chunks):
+        """
+        Collects the records of every (adapter, task) pair in the worker threads of the fetcher, then puts
+        None on the chunks queue to mark the end
+        """
+        try:
+            for result in self.fetcher.map(lambda item: self.collect(item, chunks), tasks):
+                pass
+        finally:
+            chunks.put(None)
+
+    def collect(self, item, chunks):
+        """
+        Gets the records of one (adapter, task) pair, in a worker thread, and puts them on the chunks
+        queue as (adapter, task, records, finished, urls), at most batch_size records at a time. The
+        last chunk of a task is finished and has the urls it fetched. Its records are None if it failed.
+        """
+        adapter, task = item
+        if self._aborted:
+            return
+        fetcher = self._fetchers[adapter.name]
+        fetcher.local.fetch_time = 0.0
+        fetcher.local.urls = []
+        start = time.time()
+        waited = 0.0
+        chunk = []
+        try:
+            for record in adapter.records(task, fetcher):
+                chunk.append(record)
+                if len(chunk) >= self.batch_size:
+                    put_start = time.time()
+                    chunks.put((adapter, task, chunk, False, []))
+                    waited += time.time() - put_start
+                    chunk = []
+                    if self._aborted:
+                        return
+        except Exception:
+            logger.exception('%s failed on %s', adapter.name, task)
+            chunk = None
+        parse_time = time.time() - start - fetcher.local.fetch_time - waited
+        with self._lock:
+            self.stats[adapter.name]['parse_time'] += parse_time
+            if chunk is None:
+                self.stats[adapter.name]['errors'] += 1
+        chunks.put((adapter, task, chunk, True, fetcher.local.urls))
+
+    def dedupe(self, adapter, record):
+        """
+        Returns the record with only the subjects not seen yet for its url, or None if it adds nothing
+        """
+        self.stats[adapter.name]['records'] += 1
+        url = record['url']
+        if not url:
+            return None
+        if url in self._seen:
+            record['subjects'] = [subject for subject in record['subjects'] if subject not in self._seen[url]]
+            if not record['subjects']:
+                self.stats[adapter.name]['duplicates'] += 1
+                return None
+            self._seen[url].update(record['subjects'])
+        else:
+            self._seen[url] = set(record['subjects'])
+        return record
+
+    def save(self, name, batch, tasks=(), urls=()):
+        """
+        Saves a batch of records of an adapter, then checkpoints the tasks they came from and commits the
+        cache entries of the urls they were fetched from
+        """
+        stats = self.stats[name]
+        if batch:
+            start = time.time()
+            with QueryCounter(connection) as queries:
+                counts = ingest(batch, self.batch_size, self.changed_ids[name], self.subjects)
+            stats['write_time'] += time.time() - start
+            stats['queries'] += queries.count
+            for key, value in counts.iteritems():
+                stats[key] += value
+                self.counts[key] += value
+        if self.checkpoints and tasks:
+            self.checkpoint(tasks)
+        if urls:
+            self.fetcher.commit(urls)
+
+    def checkpoint(self, tasks):
+        """
+        Marks (adapter, task) pairs as completed in the runs of their adapters
+        """
+        completed = {}
+        for adapter, task in tasks:
+            completed.setdefault(adapter.name, []).append(task)
+        for name, done in completed.iteritems():
+            ingest_run = self.runs[name]
+            ingest_run.completed_tasks = json.dumps(ingest_run.get_completed_tasks() + done)
+            ingest_run.save(update_fields=['completed_tasks'])
+
+    def finish(self):
+        """
+        Saves the stats of every run, and marks the runs of adapters that had no failures as finished.
+        The others stay open to be resumed.
+        """
+        for name, ingest_run in sorted(self.runs.iteritems()):
+            stats = self.stats[name]
+            stats['elapsed'] = time.time() - self._started[name]
+            stats['pages_per_second'] = stats['pages'] / stats['elapsed'] if stats['elapsed'] else 0.0
+            ingest_run.stats = json.dumps(stats, sort_keys=True)
+            if not stats['errors']:
+                ingest_run.finished_at = timezone.now()
+            ingest_run.save(update_fields=['stats', 'finished_at'])
+            if self.log_file:
+                self.log(ingest_run)
+
+    def log(self, ingest_run):
+        """
+        Appends the stats of a run to the log file, as one line of JSON
+        """
+        entry = {
+            'run': ingest_run.id,
+            'provider': ingest_run.provider,
+            'started_at': ingest_run.started_at.isoformat(),
+            'finished_at': ingest_run.finished_at.isoformat() if ingest_run.finished_at else None,
+            'stats': ingest_run.get_stats(),
+        }
+        with open(self.log_file, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def reindex(self, name, course_ids):
+        """
+        Updates the search index for the given courses of an adapter
+        """
+        start_time = time.time()
+        backend = connections[self.using].get_backend()
+        index = connections[self.using].get_unified_index().get_index(Course)
+        for start in range(0, len(course_ids), self.batch_size):
+            ids = course_ids[start:start + self.batch_size]
+            backend.update(index, index.index_queryset(using=self.using).filter(pk__in=ids))
+        self.stats[name]['index_time'] += time.time() - start_time
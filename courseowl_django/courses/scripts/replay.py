@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import requests
+from courses.scripts.fetcher import CHUNK_SIZE, write_atomically
+
+ARCHIVED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class ArchivedResponse(object):
+    """
+    The parts of a requests response the scrapers use, read back from an archive
+    """
+    def __init__(self, url, status_code, content, headers):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('%s returned %d' % (self.url, self.status_code), response=self)
+
+
+class Archive(object):
+    """
+    A directory of recorded responses, one body and one metadata file per url
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, url):
+        return hashlib.sha1(url).hexdigest()
+
+    def save(self, url, response):
+        key = self.key(url)
+        write_atomically(os.path.join(self.path, key + '.body'), response.content)
+        headers = dict((name, response.headers[name]) for name in ARCHIVED_HEADERS if response.headers.get(name))
+        write_atomically(os.path.join(self.path, key + '.json'),
+                         json.dumps({'url': url, 'status_code': response.status_code, 'headers': headers}))
+
+    def load(self, url):
+        """
+        Returns the recorded response for url, or None if it wasn't recorded
+        """
+        key = self.key(url)
+        try:
+            with open(os.path.join(self.path, key + '.json')) as f:
+                meta = json.load(f)
+            with open(os.path.join(self.path, key + '.body'), 'rb') as f:
+                content = f.read()
+        except IOError:
+            return None
+        return ArchivedResponse(url, meta['status_code'], content, meta['headers'])
+
+    def __len__(self):
+        return len([name for name in os.listdir(self.path) if name.endswith('.json')])
+
+
+class RecordingSession(object):
+    """
+    Passes requests on to a real session and saves every response to an archive
+    """
+    def __init__(self, session, archive):
+        self.session = session
+        self.archive = archive
+
+    def get(self, url, **kwargs):
+        kwargs.pop('headers', None)  # record full responses, never 304s
+        kwargs['stream'] = False
+        response = self.session.get(url, **kwargs)
+        if response.status_code < 500:
+            self.archive.save(url, response)
+        return response
+
+
+class ReplaySession(object):
+    """
+    Serves responses from an archive instead of the network, waiting latency seconds (plus up to jitter
+    seconds more) before each one to stand in for the round trip. Urls that weren't recorded are 404s.
+    Counts the requests it served.
+    """
+    def __init__(self, archive, latency=0.0, jitter=0.0, seed=428):
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.misses = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        time.sleep(delay)
+        response = self.archive.load(url)
+        if response is None:
+            with self._lock:
+                self.misses += 1
+            return ArchivedResponse(url, 404, '', {})
+        return response
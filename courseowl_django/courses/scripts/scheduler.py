@@ -0,0 +1,90 @@
+import calendar
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from courses.models import IngestRun
+from courses.scripts.fetcher import Fetcher
+from courses.scripts.pipeline import Pipeline, get_adapters
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler(object):
+    """
+    Runs the ingest pipeline of each provider in its own thread, every intervals[provider] seconds.
+    All providers share one Fetcher, so the per-host limits hold across them. Runs are checkpointed:
+    a provider whose last run didn't finish is resumed straight away, and one that failed is retried
+    after retry_delay seconds. The stats of every run are appended to log_file, if there is one.
+    """
+    def __init__(self, providers, intervals, fetcher=None, retry_delay=600, log_file=None):
+        self.adapters = dict((adapter.name, adapter) for adapter in get_adapters(providers))
+        self.intervals = intervals
+        self.fetcher = fetcher or Fetcher(cache_dir=settings.SCRAPER_CACHE_DIR, delay=settings.SCRAPER_HOST_DELAY)
+        self.retry_delay = retry_delay
+        self.log_file = log_file
+        self.next_run = dict((name, self.first_run(name)) for name in self.adapters)
+        self.threads = {}
+
+    def first_run(self, name):
+        """
+        Returns when a provider is due, going by its last run
+        """
+        last_run = IngestRun.objects.filter(provider=name).order_by('-started_at').first()
+        if last_run is None or last_run.finished_at is None:
+            return time.time()
+        return calendar.timegm(last_run.finished_at.utctimetuple()) + self.intervals[name]
+
+    def run_due(self, now=None):
+        """
+        Starts every provider that is due and not running already, and returns their names
+        """
+        if now is None:
+            now = time.time()
+        started = []
+        for name, adapter in sorted(self.adapters.iteritems()):
+            if name in self.threads and self.threads[name].is_alive():
+                continue
+            if self.next_run[name] <= now:
+                thread = threading.Thread(target=self.run_in_thread, args=(adapter,), name='ingest-' + name)
+                thread.daemon = True
+                thread.start()
+                self.threads[name] = thread
+                started.append(name)
+        return started
+
+    def run_in_thread(self, adapter):
+        """
+        Runs one provider in a thread of run_due(), then closes the database connection the thread opened
+        """
+        try:
+            self.run_provider(adapter)
+        finally:
+            connection.close()
+
+    def run_provider(self, adapter):
+        """
+        Runs one provider and schedules its next run
+        """
+        try:
+            pipeline = Pipeline([adapter], self.fetcher, checkpoints=True, log_file=self.log_file)
+            pipeline.run()
+            failed = pipeline.stats[adapter.name]['errors'] > 0
+        except Exception:
+            logger.exception('Ingesting %s failed', adapter.name)
+            failed = True
+        if failed:
+            self.next_run[adapter.name] = time.time() + self.retry_delay
+        else:
+            self.next_run[adapter.name] = time.time() + self.intervals[adapter.name]
+
+    def join(self):
+        for thread in self.threads.values():
+            thread.join()
+
+    def run_forever(self, tick=5):
+        while True:
+            for name in self.run_due():
+                logger.info('Started ingesting %s', name)
+            time.sleep(tick)
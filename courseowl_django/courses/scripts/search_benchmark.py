@@ -0,0 +1,182 @@
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import haystack
+from django.core.management import call_command
+from django.db import connection
+from django.test.client import Client
+from south.management.commands import patch_for_test_db_setup
+from courses.models import Course, Provider, Source, Subject
+
+WORDS = [
+    'introduction', 'advanced', 'applied', 'principles', 'foundations', 'data', 'science', 'machine',
+    'learning', 'statistics', 'programming', 'python', 'java', 'algorithms', 'systems', 'networks',
+    'economics', 'finance', 'history', 'philosophy', 'ethics', 'biology', 'chemistry', 'physics',
+    'calculus', 'algebra', 'music', 'writing', 'design', 'law', 'medicine', 'health', 'energy',
+    'climate', 'robotics', 'artificial', 'intelligence', 'psychology', 'marketing', 'management',
+]
+SUBJECTS = ['cs', 'math', 'stats', 'economics', 'history', 'biology', 'physics', 'humanities', 'law', 'music']
+PROVIDERS = ['Coursera', 'edX', 'Udacity', 'iversity']
+SOURCES = ['Stanford University', 'MIT', 'Harvard University', 'UIUC', 'Princeton University']
+
+ENGINES = {
+    'whoosh': 'courses.search_backends.PersistentWhooshEngine',
+    'memory': 'courses.search_backends.MemoryEngine',
+}
+CONCURRENCY_LEVELS = [1, 4, 16]
+QUERY_LOG = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fixtures', 'search_queries.txt')
+
+
+def run(engines='whoosh,memory', num_courses='2000', query_log=QUERY_LOG):
+    """
+    Builds a search index over a reproducible synthetic catalog and replays a query log against /search/
+    with 1, 4 and 16 concurrent clients, for each of the given search engines. Everything runs against
+    a throwaway test database and a temporary index, so no network or production data is needed:
+
+        ./manage.py runscript search_benchmark --script-args whoosh,memory 2000
+
+    The test database has to be reachable from several threads, so on SQLite set TEST_NAME to a file.
+    """
+    queries = load_query_log(query_log)
+    with test_database():
+        create_catalog(int(num_courses))
+        print('%d courses, %d queries' % (Course.objects.count(), len(queries)))
+        for engine in engines.split(','):
+            with search_index(engine) as backend:
+                build_time = time_call(call_command, 'rebuild_index', interactive=False, verbosity=0)
+                print('%s: index built in %.2fs, %.1f KB' % (engine, build_time, index_size(backend) / 1024.0))
+                replay(queries, 1)  # warm up
+                for clients in CONCURRENCY_LEVELS:
+                    latencies, errors, elapsed = replay(queries, clients)
+                    report(clients, latencies, errors, elapsed)
+
+
+@contextmanager
+def test_database():
+    """
+    Creates a test database for the duration of the with block
+    """
+    patch_for_test_db_setup()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def search_index(engine):
+    """
+    Points the default search connection at a temporary index using the given engine, and yields its backend
+    """
+    index_path = tempfile.mkdtemp()
+    old_info = haystack.connections.connections_info['default']
+    haystack.connections.connections_info['default'] = {'ENGINE': ENGINES[engine], 'PATH': index_path}
+    try:
+        yield haystack.connections.reload('default').get_backend()
+    finally:
+        haystack.connections.connections_info['default'] = old_info
+        haystack.connections.reload('default')
+        shutil.rmtree(index_path)
+
+
+def create_catalog(num_courses, seed=428):
+    """
+    Fills the database with a reproducible catalog of num_courses synthetic courses
+    """
+    rand = random.Random(seed)
+    subjects = [Subject.objects.create(name=name) for name in SUBJECTS]
+    providers = [Provider.objects.create(name=name) for name in PROVIDERS]
+    sources = [Source.objects.create(name=name) for name in SOURCES]
+
+    for i in range(num_courses):
+        name = ' '.join(rand.sample(WORDS, 3)).title()
+        description = ' '.join(rand.choice(WORDS) for j in range(40))
+        course = Course.objects.create(name=name, description=description, instructor='Instructor %d' % i,
+                                       url='http://example.com/course/%d' % i, provider=rand.choice(providers),
+                                       source=rand.choice(sources))
+        course.subjects.add(*rand.sample(subjects, 2))
+
+
+def load_query_log(path):
+    """
+    Reads a query log with one query per line
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def replay(queries, clients):
+    """
+    Sends every query to /search/, spread over the given number of concurrent clients.
+    Returns the latency of each successful request, the number of failed ones and the total wall time.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client_loop(my_queries):
+        client = Client()
+        for query in my_queries:
+            try:
+                latency = time_call(client.get, '/search/', {'q': query})
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            else:
+                with lock:
+                    latencies.append(latency)
+        connection.close()
+
+    threads = [threading.Thread(target=client_loop, args=(queries[i::clients],)) for i in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors), time.time() - start
+
+
+def time_call(func, *args, **kwargs):
+    """
+    Returns how long func(*args, **kwargs) took, in seconds
+    """
+    start = time.time()
+    func(*args, **kwargs)
+    return time.time() - start
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a list of numbers, 0 if there are none
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def index_size(backend):
+    """
+    Size in bytes of the on-disk Whoosh index, or of the in-memory index
+    """
+    if hasattr(backend, 'snapshot'):
+        return backend.snapshot.memory_size()
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(backend.path):
+        for file_name in file_names:
+            total += os.path.getsize(os.path.join(dir_path, file_name))
+    return total
+
+
+def report(clients, latencies, errors, elapsed):
+    print('  %2d clients: %6.1f queries/s, p50 %.1fms, p95 %.1fms, p99 %.1fms, %d errors' % (
+        clients, len(latencies) / elapsed, 1000 * percentile(latencies, 50),
+        1000 * percentile(latencies, 95), 1000 * percentile(latencies, 99), errors))
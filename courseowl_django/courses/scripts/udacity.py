@@ -1,14 +1,23 @@
-import urllib2
 from bs4 import BeautifulSoup
-from courses.models import Provider, Course, Subject
-from courses.scripts.utilities import unify_subject_name
+from django.conf import settings
+from courses.scripts.fetcher import Fetcher
+from courses.scripts.pipeline import Pipeline, ProviderAdapter, format_stats
 
+try:
+    import lxml.html as lxml_html  # much faster than building a BeautifulSoup tree, if it is installed
+except ImportError:
+    lxml_html = None
 
-def get_urls():
+ANCHORS = frozenset(['View Trailer', 'Course Summary', 'This Course is a Part Of', 'Course Instructors',
+                     'Instructors & Partners'])
+
+
+def get_urls(fetcher=None):
+    if fetcher is None:
+        fetcher = Fetcher()
     url = 'http://www.udacity.com/wiki/frontpage'
-    request = urllib2.Request(url)
-    response = urllib2.urlopen(request)
-    page = response.read()
+    # always parsed, even if unchanged, since it is where the course urls come from
+    page = fetcher.get(url)
 
     soup = BeautifulSoup(page)
 
@@ -19,120 +28,155 @@ def get_urls():
     for course in list_courses:
         course_str = str(course).lower()
         list_course_urls.append('https://www.udacity.com/course/' + course_str[4:9])
+    fetcher.commit([url])
 
     return list_course_urls
 
 
-def get_page(url):
-    # get the page
-    request = urllib2.Request(url)
-    response = urllib2.urlopen(request)
-    page = response.read()
+def get_page(url, fetcher=None):
+    """
+    Gets the lines of text on a course page, or None if the page hasn't changed since the last run
+    """
+    if fetcher is None:
+        fetcher = Fetcher()
+    fetched = fetcher.fetch(url)
+    if not fetched.changed:
+        return None
+    return page_lines(fetched.content)
 
-    # get the text on the page
-    soup = BeautifulSoup(page)
-    page_text = soup.get_text().encode('UTF-8')
-    page_text = page_text.replace('\t', '')
-    page_text = page_text.split('\n')
 
-    page_text_list = []
+def page_lines(html):
+    """
+    Gets the non empty lines of text on a page
+    """
+    if lxml_html is not None:
+        text = lxml_html.fromstring(html).text_content()
+    else:
+        text = BeautifulSoup(html, 'html.parser').get_text()
+    text = text.encode('UTF-8').replace('\t', '')
+    return [line for line in text.split('\n') if line]
 
-    for item in page_text:
-        if item != '':
-            page_text_list.append(item)
 
-    return page_text_list
+def find_anchors(page):
+    """
+    Finds the lines the fields of a course are next to, in a single pass over the page. Returns the
+    position of the first occurrence of each anchor, and the positions of all 'Instructor' lines.
+    """
+    anchors = {}
+    instructor_lines = []
+    for i, line in enumerate(page):
+        if line == 'Instructor':
+            instructor_lines.append(i)
+        elif line in ANCHORS and line not in anchors:
+            anchors[line] = i
+    return anchors, instructor_lines
 
 
-def get_name(page):
+def get_name(page, anchors=None):
     """
     Gets the name of the course from the page
     """
-    anchor = page.index('View Trailer')
-    return page[anchor+1]
+    anchors, instructor_lines = anchors or find_anchors(page)
+    return page[anchors['View Trailer'] + 1]
 
 
-def get_instr(page):
+def get_instr(page, anchors=None):
     """
     Gets instructor field of the page
     """
-    instr = []
-
-    anchor = page.index('Instructors & Partners')
+    anchors, instructor_lines = anchors or find_anchors(page)
+    anchor = anchors['Instructors & Partners']
+    return ', '.join(page[i - 1] for i in instructor_lines if i > anchor)
 
-    for i in range(anchor, len(page)):
-        if page[i] == 'Instructor':
-            instr.append(page[i-1])
 
-    return ', '.join(instr)
-
-
-def get_desc(page):
+def get_desc(page, anchors=None):
     """
     Gets the description field of the page
     """
-    anchor = page.index('Course Summary')
-    return page[anchor+1]
+    anchors, instructor_lines = anchors or find_anchors(page)
+    return page[anchors['Course Summary'] + 1]
 
 
-def get_subj(page):
-    try:
-        anchor_x = page.index('This Course is a Part Of')
-        anchor_y = page.index('Course Instructors')
-        subj = page[anchor_x+1: anchor_y]
-    except ValueError:
+def get_subj(page, anchors=None):
+    anchors, instructor_lines = anchors or find_anchors(page)
+    if 'This Course is a Part Of' in anchors and 'Course Instructors' in anchors:
+        subj = page[anchors['This Course is a Part Of'] + 1: anchors['Course Instructors']]
+    else:
         subj = []
 
     # remove the word 'Track'
-    good_subj = []
-    for item in subj:
-        good_subj.append(item[:-6])
-
-    return good_subj
+    return [item[:-6] for item in subj]
 
 
-def get_all_courses(urls=None):
+def get_all_courses(urls=None, fetcher=None):
     """
-    Gets all courses from a given url
+    Gets all courses from a given url. Course pages are fetched and parsed concurrently, and the ones
+    that haven't changed since the last run are left out.
     """
+    if fetcher is None:
+        fetcher = Fetcher()
     course_urls = urls
     if urls is None:
-        course_urls = get_urls()
+        course_urls = get_urls(fetcher)
     all_courses = {}
 
-    for url in course_urls:
-        page = get_page(url)
-        name = get_name(page)  # string
-        instr = get_instr(page)  # list of strings
-        desc = get_desc(page)  # string
-        subj = get_subj(page)  # list of strings
+    for url, page in fetcher.map(lambda url: (url, get_page(url, fetcher)), course_urls):
+        if page is None:
+            continue
+        course = parse_course(url, page)
+        all_courses[course['name']] = course
 
-        all_courses[name] = {'name': name, 'instr': instr, 'desc': desc, 'subj': subj, 'url': url}
-
-        print("obtained data for course: " + name)
+        print("obtained data for course: " + course['name'])
 
     return all_courses
 
 
+def parse_course(url, page):
+    """
+    Gets the fields of a course from the lines of text on its page
+    """
+    anchors = find_anchors(page)
+    name = get_name(page, anchors)  # string
+    instr = get_instr(page, anchors)  # string
+    desc = get_desc(page, anchors)  # string
+    subj = get_subj(page, anchors)  # list of strings
+    return {'name': name, 'instr': instr, 'desc': desc, 'subj': subj, 'url': url}
+
+
+def course_record(course):
+    """
+    Turns a parsed course into a record for ingest()
+    """
+    return {
+        'name': course['name'],
+        'description': course['desc'],
+        'instructor': course['instr'],
+        'url': course['url'],
+        'provider': 'Udacity',
+        'source': None,  # source university not easily available in udacity
+        'subjects': course['subj'],
+    }
+
+
+class UdacityAdapter(ProviderAdapter):
+    name = 'udacity'
+
+    def tasks(self, fetcher):
+        return get_urls(fetcher)
+
+    def records(self, task, fetcher):
+        page = get_page(task, fetcher)
+        if page is not None:
+            yield course_record(parse_course(task, page))
+
+
 def run():
     """
     Main function
     """
-    all_courses = get_all_courses()
-
-    udacity_provider, created = Provider.objects.get_or_create(name='Udacity')
-
-    for name, course in all_courses.iteritems():
-        c, created = Course.objects.get_or_create(name=course['name'], description=course['desc'], instructor=course['instr'], url=course['url'])
-        c.provider = udacity_provider
-        # source university not easily available in udacity
-        # c.source, created = ....
-        c.save()
-        for subject_name in course['subj']:
-            better_subject_name = unify_subject_name(subject_name)
-            subject, created = Subject.objects.get_or_create(name=better_subject_name)
-            c.subjects.add(subject)
-        c.save()
+    pipeline = Pipeline([UdacityAdapter()], log_file=settings.INGEST_LOG_FILE)
+    pipeline.run()
+    print(format_stats('udacity', pipeline.stats['udacity']))
 
 if __name__ == '__main__':
     run()
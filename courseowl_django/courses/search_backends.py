@@ -0,0 +1,558 @@
+import math
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import defaultdict
+from django.utils.encoding import force_text
+from haystack import connections
+from haystack.backends import BaseEngine, BaseSearchBackend, SearchNode, log_query
+from haystack.backends.simple_backend import SimpleSearchQuery
+from haystack.backends.whoosh_backend import WhooshEngine, WhooshSearchBackend
+from haystack.constants import FILTER_SEPARATOR
+from haystack.inputs import PythonData
+from haystack.models import SearchResult
+from haystack.utils import get_identifier
+from whoosh.analysis import StemmingAnalyzer
+from whoosh.fields import NGRAMWORDS
+from whoosh.searching import Searcher
+from courses.catalog import catalog_version
+
+
+WORD = re.compile(r'\w+', re.U)
+
+_stats_lock = threading.Lock()
+search_stats = {
+    'searcher_opens': 0,
+    'searcher_reopens': 0,
+    'queries': 0,
+    'query_time': 0.0,
+    'last_query_time': 0.0,
+}
+
+
+def record_search_stat(name, amount=1):
+    """
+    Adds amount to one of the counters in search_stats
+    """
+    with _stats_lock:
+        search_stats[name] += amount
+
+
+def record_query_time(elapsed):
+    """
+    Counts one query that took elapsed seconds
+    """
+    with _stats_lock:
+        search_stats['queries'] += 1
+        search_stats['query_time'] += elapsed
+        search_stats['last_query_time'] = elapsed
+
+
+def get_search_stats():
+    """
+    Returns a copy of the search counters, plus the average latency per query in seconds
+    """
+    with _stats_lock:
+        stats = dict(search_stats)
+    stats['avg_query_time'] = stats['query_time'] / stats['queries'] if stats['queries'] else 0.0
+    return stats
+
+
+class SharedSearcher(Searcher):
+    """
+    A Whoosh searcher that stays open when Haystack is done with it, so the next query can reuse it.
+    """
+    def close(self):
+        pass
+
+    def release(self):
+        """
+        Actually closes the underlying reader
+        """
+        super(SharedSearcher, self).close()
+
+
+class SharedSearcherIndex(object):
+    """
+    Wraps a Whoosh index so searches share one open searcher per thread. The searcher is only
+    reopened when the index generation on disk changes, i.e. after a rebuild or an update.
+    """
+    def __init__(self, index):
+        self._index = index
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+    def refresh(self):
+        # The wrapped FileIndex is stateless, staleness is handled by searcher()
+        return self
+
+    def searcher(self, **kwargs):
+        searcher = getattr(self._local, 'searcher', None)
+        if searcher is None:
+            searcher = SharedSearcher(self._index.reader(), fromindex=self._index)
+            record_search_stat('searcher_opens')
+        elif not searcher.up_to_date():
+            searcher = searcher.refresh()
+            record_search_stat('searcher_reopens')
+        self._local.searcher = searcher
+        return searcher
+
+    def doc_count(self):
+        return self.searcher().doc_count()
+
+    def reopen(self):
+        """
+        Replaces the searcher of this thread with a new one, on files of its own
+        """
+        searcher = getattr(self._local, 'searcher', None)
+        if searcher is not None:
+            searcher.release()
+            self._local.searcher = None
+        self.searcher()
+
+    def close(self):
+        searcher = getattr(self._local, 'searcher', None)
+        if searcher is not None:
+            searcher.release()
+            self._local.searcher = None
+        self._index.close()
+
+
+class PersistentWhooshSearchBackend(WhooshSearchBackend):
+    """
+    Whoosh backend that keeps its searcher open across requests instead of reopening the index
+    directory for every query.
+
+    Whoosh keeps a few caches in plain dicts that every reader, searcher or analyzer of a class shares,
+    so a searcher per thread doesn't keep threads apart: the stored field cache of column readers, the
+    filter cache of searchers and the stem cache of analyzers. Threads evicting entries at the same time
+    raise KeyError, so searches and index changes of this backend take a lock, one for every instance.
+    """
+    _whoosh_lock = threading.RLock()
+
+    def setup(self):
+        super(PersistentWhooshSearchBackend, self).setup()
+        self.index = SharedSearcherIndex(self.index)
+
+    def build_schema(self, fields):
+        """
+        Indexes NgramFields as word trigrams that match if any trigram matches, so they can be used
+        for typo tolerant searches. Results are still ranked by how many trigrams they share.
+        """
+        content_field_name, schema = super(PersistentWhooshSearchBackend, self).build_schema(fields)
+        for field_class in fields.values():
+            if field_class.field_type == 'ngram':
+                schema.remove(field_class.index_fieldname)
+                schema.add(field_class.index_fieldname, NGRAMWORDS(minsize=3, maxsize=3, queryor=True,
+                                                                   stored=field_class.stored,
+                                                                   field_boost=field_class.boost))
+        return content_field_name, schema
+
+    def search(self, query_string, **kwargs):
+        start = time.time()
+        try:
+            with self._whoosh_lock:
+                return super(PersistentWhooshSearchBackend, self).search(query_string, **kwargs)
+        finally:
+            record_query_time(time.time() - start)
+
+    def more_like_this(self, *args, **kwargs):
+        with self._whoosh_lock:
+            return super(PersistentWhooshSearchBackend, self).more_like_this(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        with self._whoosh_lock:
+            return super(PersistentWhooshSearchBackend, self).update(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        with self._whoosh_lock:
+            return super(PersistentWhooshSearchBackend, self).remove(*args, **kwargs)
+
+    def warm_up(self):
+        """
+        Opens the index and its searcher ahead of the first query
+        """
+        if not self.setup_complete:
+            self.setup()
+        self.index.searcher()
+
+    def after_fork(self):
+        """
+        Reopens the searcher in a process forked after warming up, so it doesn't read through the files
+        its parent opened
+        """
+        if self.setup_complete:
+            self.index.reopen()
+
+
+class PersistentWhooshEngine(WhooshEngine):
+    backend = PersistentWhooshSearchBackend
+
+
+def word_trigrams(text):
+    """
+    Returns the three letter pieces of every word of text, lowercased, as Whoosh's NGRAMWORDS fields of
+    the PersistentWhooshSearchBackend index them
+    """
+    trigrams = set()
+    for word in WORD.findall(force_text(text).lower()):
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def ngram_field_names(using):
+    """
+    Returns the names of the NgramFields of every SearchIndex of a connection
+    """
+    fields = connections[using].get_unified_index().all_searchfields()
+    return set(name for name, field in fields.iteritems() if field.field_type == 'ngram')
+
+
+class InvertedIndex(object):
+    """
+    An immutable BM25 index over a set of documents. Postings are stored as pairs of array('I'),
+    one with document numbers and one with term frequencies, so the index stays compact. The NgramFields
+    of the documents are indexed apart, by word trigrams, for typo tolerant searches.
+    Since the index never changes, the results of recent queries are kept, up to max_cached_queries.
+    The result cache is best effort: it is a plain dict filled by the searching threads without a lock,
+    so two threads may both compute a query and one result wins, and it is cleared as a whole once full.
+    Either way a search gets correct results, at worst it computes them again.
+    """
+    k1 = 1.2
+    b = 0.75
+    max_cached_queries = 1000
+
+    def __init__(self, documents, analyzer):
+        """
+        documents maps a Haystack identifier to (app_label, model_name, pk, text, ngrams), where ngrams
+        maps the names of the NgramFields of the document to their text
+        """
+        self.analyzer = analyzer
+        self.doc_keys = []
+        self.doc_lengths = array('I')
+        self.postings = {}
+        self.trigrams = {}
+        self.trigram_counts = {}
+        self.results = {}
+
+        for identifier, (app_label, model_name, pk, text, ngrams) in documents.iteritems():
+            doc_num = len(self.doc_keys)
+            self.doc_keys.append((app_label, model_name, pk))
+            for field_name, ngram_text in ngrams.iteritems():
+                trigrams = word_trigrams(ngram_text)
+                self.trigram_counts[field_name, doc_num] = len(trigrams)
+                for trigram in trigrams:
+                    self.trigrams.setdefault((field_name, trigram), array('I')).append(doc_num)
+            term_counts = defaultdict(int)
+            for token in analyzer(force_text(text)):
+                term_counts[token.text] += 1
+            self.doc_lengths.append(sum(term_counts.itervalues()))
+            for term, count in term_counts.iteritems():
+                if term not in self.postings:
+                    self.postings[term] = (array('I'), array('I'))
+                doc_nums, freqs = self.postings[term]
+                doc_nums.append(doc_num)
+                freqs.append(count)
+
+        self.avg_length = float(sum(self.doc_lengths)) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def __len__(self):
+        return len(self.doc_keys)
+
+    def search(self, query_string, models=None, ngram_query=()):
+        """
+        Returns (score, doc_key) pairs, best first, for documents containing every query term. With an
+        ngram_query, a list of (field name, text) pairs, documents are matched by those instead: they
+        match if one of their trigrams is in the text, and score how alike their trigrams are.
+        """
+        key = (query_string, frozenset(models) if models is not None else None, tuple(ngram_query))
+        matches = self.results.get(key)
+        if matches is None:
+            if ngram_query:
+                matches = self._ngram_search(ngram_query, models)
+            else:
+                matches = self._search(query_string, models)
+            if len(self.results) >= self.max_cached_queries:
+                self.results.clear()
+            self.results[key] = matches
+        return matches
+
+    def _search(self, query_string, models):
+        terms = set(token.text for token in self.analyzer(force_text(query_string)))
+        if not terms:
+            return []
+        postings = []
+        for term in terms:
+            if term not in self.postings:
+                return []
+            postings.append(self.postings[term])
+        postings.sort(key=lambda pair: len(pair[0]))
+
+        candidates = set(postings[0][0])
+        for doc_nums, freqs in postings[1:]:
+            candidates.intersection_update(doc_nums)
+
+        doc_count = len(self.doc_keys)
+        scores = defaultdict(float)
+        for doc_nums, freqs in postings:
+            idf = math.log(1 + (doc_count - len(doc_nums) + 0.5) / (len(doc_nums) + 0.5))
+            for doc_num, freq in zip(doc_nums, freqs):
+                if doc_num in candidates:
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_num] / self.avg_length)
+                    scores[doc_num] += idf * freq * (self.k1 + 1) / (freq + norm)
+
+        return self._matches(scores, models)
+
+    def _ngram_search(self, ngram_query, models):
+        """
+        Scores documents with the Dice coefficient of their trigrams and the query's, summed over fields,
+        so short names sharing most of the query's trigrams beat long ones sharing a few more
+        """
+        scores = defaultdict(float)
+        for field_name, text in ngram_query:
+            query_trigrams = word_trigrams(text)
+            shared = defaultdict(int)
+            for trigram in query_trigrams:
+                for doc_num in self.trigrams.get((field_name, trigram), ()):
+                    shared[doc_num] += 1
+            for doc_num, count in shared.iteritems():
+                scores[doc_num] += 2.0 * count / (len(query_trigrams) + self.trigram_counts[field_name, doc_num])
+        return self._matches(scores, models)
+
+    def _matches(self, scores, models):
+        """
+        Returns the (score, doc_key) pairs of the scored documents of the given models, best first
+        """
+        matches = []
+        for doc_num, score in scores.iteritems():
+            doc_key = self.doc_keys[doc_num]
+            if models is None or '%s.%s' % doc_key[:2] in models:
+                matches.append((score, doc_key))
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return matches
+
+    def memory_size(self):
+        """
+        Approximate size in bytes of the postings, lengths and document keys
+        """
+        size = sys.getsizeof(self.postings) + sys.getsizeof(self.doc_keys) + sys.getsizeof(self.doc_lengths)
+        for term, (doc_nums, freqs) in self.postings.iteritems():
+            size += sys.getsizeof(term) + sys.getsizeof(doc_nums) + sys.getsizeof(freqs)
+        size += sys.getsizeof(self.trigrams) + sys.getsizeof(self.trigram_counts)
+        for key, doc_nums in self.trigrams.iteritems():
+            size += sys.getsizeof(key) + sys.getsizeof(doc_nums)
+        for doc_key in self.doc_keys:
+            size += sys.getsizeof(doc_key)
+        return size
+
+
+class MemorySearchBackend(BaseSearchBackend):
+    """
+    Serves searches from an InvertedIndex held in memory, scored with BM25. The index is built
+    from every registered SearchIndex on first use, and rebuilt and swapped in whole by the first
+    search after documents were updated or removed, so a batch of saves costs one rebuild and
+    searches never see a half built index. It is also rebuilt from the database when it is older
+    than the REBUILD_INTERVAL option (in seconds), or when the catalog version changes, i.e. after an
+    ingest run or an edit in the admin in any process. The version is checked at most every
+    VERSION_CHECK_INTERVAL seconds. Documents only change under the rebuild lock.
+
+    Like the Whoosh backend, every query term must match, and filters on NgramFields match word
+    trigrams, see MemorySearchQuery. Query operators are ignored.
+    """
+    def __init__(self, connection_alias, **connection_options):
+        super(MemorySearchBackend, self).__init__(connection_alias, **connection_options)
+        self.rebuild_interval = connection_options.get('REBUILD_INTERVAL', 300)
+        self.version_check_interval = connection_options.get('VERSION_CHECK_INTERVAL', 5)
+        self.analyzer = StemmingAnalyzer()
+        self.documents = None
+        self.snapshot = None
+        self.built_at = 0
+        self.version = None
+        self.latest_version = None
+        self.checked_at = 0
+        self.dirty = False
+        self._rebuild_lock = threading.Lock()
+
+    def setup(self):
+        """
+        Reads every indexed object from the database and builds the first snapshot
+        """
+        # read before the documents, so a change made while they are read triggers another rebuild
+        self.version = self.latest_version = catalog_version()
+        self.checked_at = time.time()
+        documents = {}
+        unified_index = connections[self.connection_alias].get_unified_index()
+        for model in unified_index.get_indexed_models():
+            index = unified_index.get_index(model)
+            for obj in index.index_queryset(using=self.connection_alias):
+                if index.should_update(obj):
+                    self._add_document(documents, index, obj)
+        self.documents = documents
+        self.swap()
+
+    def _add_document(self, documents, index, obj):
+        prepared = index.full_prepare(obj)
+        ngrams = dict((field.index_fieldname, prepared.get(field.index_fieldname) or '')
+                      for field in index.fields.itervalues() if field.field_type == 'ngram')
+        documents[get_identifier(obj)] = (obj._meta.app_label, obj._meta.model_name, obj.pk,
+                                          prepared[index.get_content_field()], ngrams)
+
+    def swap(self):
+        """
+        Builds a new snapshot from the current documents and replaces the old one. Called with the
+        rebuild lock held.
+        """
+        self.snapshot = InvertedIndex(dict(self.documents), self.analyzer)
+        self.built_at = time.time()
+        self.dirty = False
+
+    def get_snapshot(self):
+        """
+        Returns the current snapshot, rebuilding it first if it is missing, too old or behind the documents
+        """
+        if self.dirty or self._is_stale():
+            # Only one thread rebuilds, the others keep searching the old snapshot
+            if self._rebuild_lock.acquire(self.snapshot is None):
+                try:
+                    if self._is_stale():
+                        self.setup()
+                    elif self.dirty:
+                        self.swap()
+                finally:
+                    self._rebuild_lock.release()
+        return self.snapshot
+
+    def _is_stale(self):
+        now = time.time()
+        if self.snapshot is None or now - self.built_at > self.rebuild_interval:
+            return True
+        if now - self.checked_at > self.version_check_interval:
+            self.checked_at = now
+            self.latest_version = catalog_version()
+        return self.latest_version != self.version
+
+    def _load_documents(self):
+        """
+        Reads the documents if they weren't yet. Called with the rebuild lock held.
+        """
+        if self.documents is None:
+            self.setup()
+
+    def update(self, index, iterable, commit=True):
+        with self._rebuild_lock:
+            self._load_documents()
+            for obj in iterable:
+                self._add_document(self.documents, index, obj)
+            self.dirty = True
+
+    def remove(self, obj_or_string, commit=True):
+        with self._rebuild_lock:
+            self._load_documents()
+            self.documents.pop(get_identifier(obj_or_string), None)
+            self.dirty = True
+
+    def clear(self, models=[], commit=True):
+        with self._rebuild_lock:
+            self._load_documents()
+            if models:
+                labels = set('%s.%s' % (model._meta.app_label, model._meta.model_name) for model in models)
+                for identifier, document in self.documents.items():
+                    if '%s.%s' % document[:2] in labels:
+                        del self.documents[identifier]
+            else:
+                self.documents.clear()
+            self.dirty = True
+
+    @log_query
+    def search(self, query_string, start_offset=0, end_offset=None, models=None, result_class=None,
+               ngram_query=(), **kwargs):
+        start = time.time()
+        if result_class is None:
+            result_class = SearchResult
+        model_labels = None
+        if models:
+            model_labels = set('%s.%s' % (model._meta.app_label, model._meta.model_name) for model in models)
+
+        matches = self.get_snapshot().search(query_string, model_labels, ngram_query)
+        results = []
+        for score, (app_label, model_name, pk) in matches[start_offset:end_offset]:
+            results.append(result_class(app_label, model_name, pk, score))
+
+        record_query_time(time.time() - start)
+        return {
+            'results': results,
+            'hits': len(matches),
+        }
+
+    def more_like_this(self, model_instance, additional_query_string=None, **kwargs):
+        return {
+            'results': [],
+            'hits': 0,
+        }
+
+    def warm_up(self):
+        """
+        Builds the in-memory index ahead of the first query
+        """
+        self.get_snapshot()
+
+
+class MemorySearchQuery(SimpleSearchQuery):
+    """
+    Builds the queries of the MemorySearchBackend. Filters on NgramFields are kept out of the query
+    string and passed to the backend as its ngram_query, so they match by trigrams as they do with the
+    PersistentWhooshSearchBackend. A query with such filters is matched by them alone.
+    """
+    def build_query(self):
+        self.ngram_query = []
+        return super(MemorySearchQuery, self).build_query()
+
+    def _build_sub_query(self, search_node):
+        ngram_fields = ngram_field_names(self._using)
+        term_list = []
+        for child in search_node.children:
+            if isinstance(child, SearchNode):
+                term_list.append(self._build_sub_query(child))
+                continue
+            value = child[1]
+            if not hasattr(value, 'input_type_name'):
+                value = PythonData(value)
+            field_name = child[0].split(FILTER_SEPARATOR)[0]
+            if field_name in ngram_fields:
+                self.ngram_query.append((field_name, value.prepare(self)))
+            else:
+                term_list.append(value.prepare(self))
+        return ' '.join(force_text(term) for term in term_list)
+
+    def build_params(self, spelling_query=None):
+        kwargs = super(MemorySearchQuery, self).build_params(spelling_query)
+        if getattr(self, 'ngram_query', None):
+            kwargs['ngram_query'] = self.ngram_query
+        return kwargs
+
+
+class MemoryEngine(BaseEngine):
+    backend = MemorySearchBackend
+    query = MemorySearchQuery
+
+
+def warm_up_search(using='default'):
+    """
+    Opens the search index for a connection, if its backend supports warming up
+    """
+    backend = connections[using].get_backend()
+    if hasattr(backend, 'warm_up'):
+        backend.warm_up()
+
+
+def after_fork_search(using='default'):
+    """
+    Lets the backend of a connection reopen what a forked process can't share with its parent
+    """
+    backend = connections[using].get_backend()
+    if hasattr(backend, 'after_fork'):
+        backend.after_fork()
@@ -4,9 +4,22 @@ from courses.models import Course
 
 class CourseIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
+    # Trigrams of the course and subject names, used to match misspelled queries
+    name_trigrams = indexes.NgramField(model_attr='name', stored=False)
+    subject_trigrams = indexes.NgramField(stored=False)
 
     def get_model(self):
         return Course
 
     def index_queryset(self, using=None):
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('provider', 'source').prefetch_related('subjects')
+
+    def read_queryset(self, using=None):
+        """
+        Used by load_all() to fetch a whole page of results with one in_bulk query, so rendering
+        the provider and subjects of each result doesn't cost extra queries
+        """
+        return self.get_model().objects.select_related('provider', 'source').prefetch_related('subjects')
+
+    def prepare_subject_trigrams(self, obj):
+        return ' '.join(subject.name for subject in obj.subjects.all())
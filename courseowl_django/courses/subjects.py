@@ -0,0 +1,96 @@
+from django.utils.encoding import force_text
+from courses.catalog import catalog_version
+from courses.models import Subject
+from courses.scripts.utilities import unify_subject_name
+
+
+class NameMap(object):
+    """
+    Maps names to ids for a model with a name field, creating the missing names in bulk. created counts
+    the names it created. Names aren't unique, so a name maps to the ids of every row that has it, and
+    get() returns the oldest one.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.created = 0
+        self.names = dict(model.objects.values_list('id', 'name'))
+        self.ids = {}
+        for id, name in sorted(self.names.iteritems()):
+            self.ids.setdefault(name, []).append(id)
+
+    def resolve(self, names):
+        """
+        Makes sure every name in names exists, in order of first appearance
+        """
+        missing = []
+        for name in names:
+            if name not in self.ids and name not in missing:
+                missing.append(name)
+        if missing:
+            self.model.objects.bulk_create([self.model(name=name) for name in missing])
+            self.created += len(missing)
+            for id, name in self.model.objects.filter(name__in=missing).order_by('id').values_list('id', 'name'):
+                self.ids.setdefault(name, []).append(id)
+                self.names[id] = name
+
+    def get(self, name):
+        ids = self.ids.get(name)
+        return ids[0] if ids else None
+
+    def name(self, id):
+        return self.names.get(id)
+
+
+class SubjectResolver(NameMap):
+    """
+    Looks up subjects by name without a query per subject. All names are loaded once, so a resolver is
+    meant to live for one ingest run or one request. Raw subject names are unified once each.
+    """
+    def __init__(self):
+        super(SubjectResolver, self).__init__(Subject)
+        self._unified = {}
+
+    def unify(self, raw_name):
+        """
+        Returns unify_subject_name() of a raw subject name, remembering the result
+        """
+        if raw_name not in self._unified:
+            self._unified[raw_name] = unify_subject_name(force_text(raw_name))
+        return self._unified[raw_name]
+
+    def related(self, name):
+        """
+        Returns the ids of the subjects whose name contains the part of name before the first dash,
+        ignoring case
+        """
+        base = name.split('-')[0].lower()
+        return [id for id, subject_name in self.names.iteritems() if base in subject_name.lower()]
+
+    def subjects(self, ids=None):
+        """
+        Returns {'id', 'name'} dicts for the given subject ids, or for all subjects, ordered by name
+        """
+        if ids is None:
+            ids = self.names.keys()
+        return sorted(({'id': id, 'name': self.names[id]} for id in ids if id in self.names),
+                      key=lambda subject: subject['name'])
+
+
+# (subject version token, SubjectResolver) of this process
+_resolver = (None, None)
+
+
+def get_subject_resolver():
+    """
+    Returns a SubjectResolver for lookups only, kept by the process until the subjects change, so requests
+    don't each load every subject name. Checking for changes costs a read of the catalog versions. Names
+    resolved with it aren't seen by the kept copy. Threads that find it stale at the same time may each
+    load one, the last one loaded is kept.
+    """
+    global _resolver
+    token = catalog_version('subject')
+    version, resolver = _resolver
+    if version != token:
+        resolver = SubjectResolver()
+        _resolver = (token, resolver)
+    return resolver
@@ -1,19 +1,115 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection, IntegrityError, transaction
+from django.test import LiveServerTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 import json
 import os
+import random
+import re
+import requests
+import shutil
+import tempfile
+import threading
+import time
+from importlib import import_module
+from allauth.socialaccount.models import SocialApp
 from bs4 import BeautifulSoup
+from south.models import MigrationHistory
 from courses.recommender import get_fuzzy_subject_matching, get_enrolled_subjects, get_similar_user_interests, \
-    get_similar_user_dislikes, get_recs_from_subjects, get_similar_user_completed
+    get_similar_user_dislikes, get_recs_from_subjects, get_similar_user_completed, load_interactions
 from courses.scripts.coursera import add_courses as coursera_add_courses
+import courses.scripts.coursera as coursera
 import courses.scripts.udacity as udacity
 import courses.scripts.iversity as iversity
 import courses.scripts.edx as edx
-from courses.models import Subject, Provider, Course
-from accounts.models import UserProfile, User
+from courses.scripts.fetcher import Fetcher
+from courses.scripts.ingest import ingest
+from courses.scripts.ingest_benchmark import benchmark
+from courses.scripts.loadtest import LoadTest, format_report, seed
+from courses.scripts.pipeline import Pipeline, ProviderAdapter, QueryCounter
+from courses.scripts.replay import Archive, RecordingSession, ReplaySession
+from courses.scripts.scheduler import Scheduler
+from courses.scripts.search_benchmark import load_query_log, percentile, search_index, QUERY_LOG
+from courses.catalog import cached, versioned_key
+from courses.models import Subject, Provider, Course, IngestRun, CatalogVersion
+from courses.search_backends import PersistentWhooshSearchBackend, MemorySearchBackend, get_search_stats
+from courses.search_indexes import CourseIndex
+from courses.subjects import SubjectResolver, get_subject_resolver
+from accounts.models import UserProfile, User, CourseInteraction
 
 from courses.scripts.utilities import unify_subject_name
 
 
+def read_fixture(name):
+    """
+    Returns the contents of a file in courses/fixtures
+    """
+    with open(os.path.join(os.path.dirname(__file__), 'fixtures', name)) as f:
+        return f.read()
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('%d error' % self.status_code, response=self)
+
+
+class FakeClock(object):
+    """
+    Stands in for time.time and time.sleep, recording every sleep and passing the time without waiting
+    """
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeSession(object):
+    """
+    Stands in for a requests session, serving canned responses by url and recording every request
+    """
+    def __init__(self, pages, default=None):
+        self.pages = pages
+        self.default = default
+        self.requested = []
+        self.sent_headers = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requested.append(url)
+        self.sent_headers.append(headers or {})
+        response = self.pages.get(url, self.default)
+        if isinstance(response, list):
+            response = response.pop(0)
+        if response is None:
+            return FakeResponse(404, '')
+        if isinstance(response, FakeResponse):
+            return response
+        return FakeResponse(200, response)
+
+
 class SubjectTests(TestCase):
     def test_create_subject(self):
         """
@@ -64,6 +160,41 @@ class CourseraScriptTests(TestCase):
             self.assertEquals(the_course_subjects[1].name, 'cs')
 
 
+class CourseraStreamingTests(TestCase):
+    def setUp(self):
+        self.topic_list = read_fixture('../testCourse.json')
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_iter_json_array_across_chunks(self):
+        """
+        Topics come out whole however the list is split, even in the middle of a multibyte character
+        """
+        text = u'[{"name": "\u00c9conomie"}, {"name": "Caf\u00e9", "ids": [1, 2]}, 3 ]'.encode('utf-8')
+        for size in (1, 2, 5, len(text)):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(list(coursera.iter_json_array(chunks)), json.loads(text))
+
+        chunks = [self.topic_list[i:i + 100] for i in range(0, len(self.topic_list), 100)]
+        self.assertEqual(list(coursera.iter_json_array(chunks)), json.loads(self.topic_list))
+
+    def test_iter_json_array_truncated(self):
+        self.assertRaises(ValueError, list, coursera.iter_json_array(['[{"name": 1}, {"na']))
+        self.assertRaises(ValueError, list, coursera.iter_json_array(['{"name": 1}']))
+
+    def test_run_streams_from_cache(self):
+        """
+        The topic list is streamed through the cache into the database, and skipped when unchanged
+        """
+        session = FakeSession({coursera.topic_list_url: [self.topic_list, FakeResponse(304, '')]})
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+        coursera.run(fetcher)
+        self.assertEqual(Course.objects.get().url, 'https://www.coursera.org/course/ml')
+        self.assertIsNone(coursera.get_topics(coursera.topic_list_url, fetcher))
+
+
 class UdacityScriptTests(TestCase):
     def test_get_urls(self):
         """
@@ -86,25 +217,749 @@ class UdacityScriptTests(TestCase):
         self.assertEquals(len(itp['subj']), 0)
 
 
+class UdacityOfflineScriptTests(TestCase):
+    def setUp(self):
+        self.html = read_fixture('udacity_course_page.html')
+
+    def test_parse_saved_page(self):
+        course = udacity.parse_course('https://www.udacity.com/course/cs046', udacity.page_lines(self.html))
+        self.assertEqual(course['name'], 'Intro to Programming')
+        self.assertEqual(course['instr'], 'Cay Horstmann')
+        self.assertEqual(course['desc'], 'In this class, you will learn basic skills and concepts of computer programming in an object-oriented approach using Java.')
+        self.assertEqual(course['subj'], ['Software Engineering', 'Java Development'])
+
+    def test_parses_pages_concurrently(self):
+        """
+        Fetches and parses 200 saved course pages with 8 workers, see parse_benchmark for their speed
+        """
+        urls = ['https://www.udacity.com/course/cs%03d' % i for i in range(200)]
+        session = FakeSession({}, default=self.html)
+        all_courses = udacity.get_all_courses(urls, Fetcher(session=session, workers=8))
+        self.assertEqual(sorted(session.requested), urls)
+        self.assertEqual(len(all_courses), 1)  # every page is the same course
+
+
 class EdxScriptTests(TestCase):
-    def test_populate_lists(self):
+    def test_course_records(self):
         """
-        Tests if lists are properly populated
+        Tests if course records are properly generated
         """
-        edx.populate_lists(['business-management'])
+        records = list(edx.course_records(['business-management']))
         self.assertEquals(len(edx.all_subjects), 25)
-        self.assertTrue('The Analytics Edge' in edx.title_list)
+        self.assertTrue('The Analytics Edge' in [record['name'] for record in records])
 
     def test_add_to_django(self):
         """
-        Test if data from lists are properly added to Django database
+        Test if course records are properly added to Django database
         """
-        edx.populate_lists(['business-management'])
-        edx.add_to_django()
+        ingest(edx.course_records(['business-management']))
         edge_course = Course.objects.filter(name='The Analytics Edge')
         self.assertTrue(edge_course.exists())
 
 
+class EdxOfflineScriptTests(TestCase):
+    def setUp(self):
+        self.session = FakeSession({
+            edx.subject_page_url('business-management', 0): read_fixture('edx_course_list.html'),
+            edx.subject_page_url('chemistry', 0): read_fixture('edx_course_list.html'),
+        }, default=read_fixture('edx_empty_course_list.html'))
+
+    def test_course_records_from_fixtures(self):
+        """
+        Subjects are crawled from recorded pages, and each stops at its first page without courses
+        """
+        records = list(edx.course_records(['business-management', 'chemistry'],
+                                          Fetcher(session=self.session, backoff=0)))
+        self.assertEqual(len(records), 6)
+        edge = [record for record in records if record['name'] == 'The Analytics Edge'][0]
+        self.assertEqual(edge['instructor'], 'Dimitris Bertsimas')
+        self.assertEqual(edge['source'], 'MITx')
+        self.assertEqual(sorted(self.session.requested), sorted([
+            edx.subject_page_url('business-management', 0), edx.subject_page_url('business-management', 1),
+            edx.subject_page_url('chemistry', 0), edx.subject_page_url('chemistry', 1)]))
+
+    def test_add_to_django_from_fixtures(self):
+        """
+        Test if data parsed from recorded pages is properly added to the database
+        """
+        ingest(edx.course_records(['business-management'], Fetcher(session=self.session, backoff=0)))
+        edge_course = Course.objects.get(name='The Analytics Edge')
+        self.assertEqual(edge_course.source.name, 'MITx')
+        self.assertEqual(edge_course.subjects.all()[0].name, 'business')
+
+    def test_incomplete_courses_do_not_shift_fields(self):
+        """
+        A course missing its instructors doesn't give its neighbour the wrong instructor
+        """
+        html = read_fixture('edx_course_list.html').replace('<li><span>Instructors:</span>Casey Rothschild</li>', '')
+        records = edx.parse_page(html, 'economics-finance')
+        self.assertEqual([record['instructor'] for record in records],
+                         ['Dimitris Bertsimas', None, 'Arno Smets'])
+
+    def test_adapter_records(self):
+        records = list(edx.EdxAdapter().records('business-management', Fetcher(session=self.session, backoff=0)))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['provider'], 'edX')
+        self.assertEqual(records[0]['subjects'], ['business-management'])
+
+
+class FakeAdapter(ProviderAdapter):
+    """
+    Serves canned records, a task mapped to an exception fails
+    """
+    def __init__(self, name, records_by_task):
+        self.name = name
+        self.records_by_task = records_by_task
+
+    def tasks(self, fetcher):
+        return sorted(self.records_by_task)
+
+    def records(self, task, fetcher):
+        if isinstance(self.records_by_task[task], Exception):
+            raise self.records_by_task[task]
+        return self.records_by_task[task]
+
+
+class PipelineTests(TestCase):
+    def setUp(self):
+        self.edx = FakeAdapter('edx', {
+            'math': [make_record(1, subjects=['math']), make_record(2, subjects=['math'])],
+            'physics': [make_record(1, subjects=['physics-mechanics'])],
+            'broken': ValueError('parse error'),
+        })
+        self.coursera = FakeAdapter('coursera', {'topics': [make_record(2, provider='Coursera', subjects=['math']),
+                                                            make_record(3, provider='Coursera')]})
+
+    def test_pipeline_runs_all_adapters(self):
+        """
+        Records from every adapter are saved once, with their subjects merged, and failures are counted
+        """
+        pipeline = Pipeline([self.edx, self.coursera], Fetcher(session=FakeSession({})), batch_size=2,
+                            update_index=False)
+        counts = pipeline.run()
+        self.assertEqual(counts['created'], 3)
+        self.assertEqual(Course.objects.count(), 3)
+        course = Course.objects.get(url='http://example.com/course/1')
+        self.assertEqual(sorted(subject.name for subject in course.subjects.all()), ['math', 'physics'])
+        self.assertEqual((pipeline.stats['edx']['records'], pipeline.stats['edx']['errors']), (3, 1))
+        self.assertEqual((pipeline.stats['coursera']['records'], pipeline.stats['coursera']['errors']), (2, 0))
+        # course 2 is listed by both, whichever comes second is the duplicate
+        self.assertEqual(pipeline.stats['edx']['duplicates'] + pipeline.stats['coursera']['duplicates'], 1)
+        changed_ids = pipeline.changed_ids['edx'] | pipeline.changed_ids['coursera']
+        self.assertEqual(sorted(changed_ids), sorted(Course.objects.values_list('id', flat=True)))
+
+    def test_pipeline_updates_search_index(self):
+        with search_index('whoosh') as backend:
+            Pipeline([self.coursera], Fetcher(session=FakeSession({}))).run()
+            self.assertEqual(backend.search(u'Course')['hits'], 2)
+
+    def test_query_counter_leaves_the_query_log_as_it_was(self):
+        initial = len(connection.queries)
+        with QueryCounter(connection) as queries:
+            Subject.objects.count()
+            list(Subject.objects.all())
+        self.assertEqual(queries.count, 2)
+        self.assertEqual(len(connection.queries), initial)
+        self.assertEqual(connection.use_debug_cursor, None)
+
+    def test_pipeline_records_stats(self):
+        """
+        Pages, bytes, timings, rows and queries of every provider are saved in its IngestRun and logged
+        """
+        course_list = read_fixture('edx_course_list.html')
+        empty_list = read_fixture('edx_empty_course_list.html')
+        session = FakeSession({edx.subject_page_url('business-management', 0): course_list}, default=empty_list)
+        handle, log_file = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, log_file)
+
+        pipeline = Pipeline([edx.EdxAdapter(), self.coursera], Fetcher(session=session), update_index=False,
+                            log_file=log_file)
+        pipeline.run()
+        stats = pipeline.stats['edx']
+        self.assertEqual(stats['pages'], len(edx.all_subjects) + 1)
+        self.assertEqual(stats['bytes'], len(course_list) + len(edx.all_subjects) * len(empty_list))
+        self.assertEqual(stats['created'], Course.objects.filter(provider__name='edX').count())
+        self.assertEqual((stats['updated'], stats['unchanged']), (0, 0))
+        self.assertTrue(stats['queries'] > 0)
+        self.assertEqual(pipeline.stats['coursera']['pages'], 0)
+        self.assertEqual(pipeline.stats['coursera']['created'], 2)
+        for key in ('fetch_time', 'parse_time', 'write_time', 'elapsed', 'pages_per_second'):
+            self.assertTrue(stats[key] >= 0, key)
+
+        ingest_run = IngestRun.objects.get(provider='edx')
+        self.assertEqual(ingest_run.get_stats()['pages'], stats['pages'])
+        self.assertIsNotNone(ingest_run.finished_at)
+        with open(log_file) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(sorted(entry['provider'] for entry in entries), ['coursera', 'edx'])
+        self.assertEqual(entries[1]['stats']['created'], stats['created'])
+        self.assertEqual(entries[1]['run'], ingest_run.id)
+
+    def test_big_tasks_are_saved_as_they_are_parsed(self):
+        """
+        The records of a task are handed over in batches as they are yielded, not once the task is done
+        """
+        pipeline = None
+
+        class StreamingAdapter(FakeAdapter):
+            behind = 0
+
+            def records(self, task, fetcher):
+                for i in range(1000):
+                    # how many records were yielded but not taken by the pipeline yet
+                    self.behind = max(self.behind, i - pipeline.stats['edx']['records'])
+                    yield make_record(i)
+
+        adapter = StreamingAdapter('edx', {'everything': None})
+        pipeline = Pipeline([adapter], Fetcher(session=FakeSession({}), workers=2), batch_size=10,
+                            update_index=False)
+        self.assertEqual(pipeline.run()['created'], 1000)
+        self.assertTrue(adapter.behind < 100, adapter.behind)
+
+    def test_failed_save_stops_the_workers(self):
+        """
+        A run that fails in the main thread lets the workers waiting on it finish, instead of hanging
+        """
+        records = [make_record(i) for i in range(100)]
+        del records[50]['name']
+        adapter = FakeAdapter('edx', dict(('task %d' % i, records) for i in range(10)))
+        pipeline = Pipeline([adapter], Fetcher(session=FakeSession({}), workers=2), batch_size=10,
+                            update_index=False)
+        self.assertRaises(KeyError, pipeline.run)
+
+    def test_ingest_command_rejects_unknown_providers(self):
+        self.assertRaises(CommandError, call_command, 'ingest', providers='edx,nope')
+
+
+class CountingAdapter(FakeAdapter):
+    """
+    FakeAdapter that remembers which tasks it ran
+    """
+    def __init__(self, name, records_by_task):
+        super(CountingAdapter, self).__init__(name, records_by_task)
+        self.ran = []
+
+    def records(self, task, fetcher):
+        self.ran.append(task)
+        return super(CountingAdapter, self).records(task, fetcher)
+
+
+class CheckpointTests(TestCase):
+    def setUp(self):
+        self.fetcher = Fetcher(session=FakeSession({}))
+
+    def test_interrupted_run_resumes(self):
+        """
+        A run with a failed task stays open, and the next one only does what is left
+        """
+        adapter = CountingAdapter('edx', {'math': [make_record(1)], 'physics': [make_record(2)],
+                                          'law': ValueError('connection reset')})
+        Pipeline([adapter], self.fetcher, batch_size=1, update_index=False, checkpoints=True).run()
+        ingest_run = IngestRun.objects.get()
+        self.assertIsNone(ingest_run.finished_at)
+        self.assertEqual(sorted(ingest_run.get_completed_tasks()), ['math', 'physics'])
+
+        adapter = CountingAdapter('edx', {'math': [make_record(1)], 'physics': [make_record(2)],
+                                          'law': [make_record(3)]})
+        Pipeline([adapter], self.fetcher, update_index=False, checkpoints=True).run()
+        self.assertEqual(adapter.ran, ['law'])
+        ingest_run = IngestRun.objects.get()
+        self.assertIsNotNone(ingest_run.finished_at)
+        self.assertEqual(Course.objects.count(), 3)
+
+        # a finished run isn't resumed, the next one starts over
+        adapter = CountingAdapter('edx', {'math': [make_record(1)]})
+        Pipeline([adapter], self.fetcher, update_index=False, checkpoints=True).run()
+        self.assertEqual(adapter.ran, ['math'])
+        self.assertEqual(IngestRun.objects.count(), 2)
+
+    def test_scheduler_intervals(self):
+        scheduler = Scheduler(['edx'], {'edx': 3600}, fetcher=self.fetcher, retry_delay=60)
+        self.assertTrue(scheduler.next_run['edx'] <= time.time())
+
+        scheduler.adapters['edx'] = CountingAdapter('edx', {'math': [make_record(1)]})
+        scheduler.run_provider(scheduler.adapters['edx'])
+        self.assertAlmostEqual(scheduler.next_run['edx'], time.time() + 3600, delta=5)
+        self.assertAlmostEqual(Scheduler(['edx'], {'edx': 3600}, fetcher=self.fetcher).next_run['edx'],
+                               time.time() + 3600, delta=5)
+
+        scheduler.adapters['edx'] = CountingAdapter('edx', {'math': ValueError('timeout')})
+        scheduler.run_provider(scheduler.adapters['edx'])
+        self.assertAlmostEqual(scheduler.next_run['edx'], time.time() + 60, delta=5)
+
+    def test_only_scheduler_threads_close_their_connection(self):
+        """
+        run_provider() can be called with the caller's connection, only the threads of run_due() close theirs
+        """
+        closed = []
+        connection.close = lambda: closed.append(True)
+        self.addCleanup(delattr, connection, 'close')
+        scheduler = Scheduler(['edx'], {'edx': 3600}, fetcher=self.fetcher)
+        scheduler.run_provider(CountingAdapter('edx', {'math': [make_record(1)]}))
+        self.assertEqual(closed, [])
+        scheduler.run_in_thread(CountingAdapter('edx', {'math': [make_record(2)]}))
+        self.assertEqual(closed, [True])
+
+
+class ReplayTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.archive = Archive(self.archive_dir)
+        self.live = FakeSession({
+            edx.subject_page_url('business-management', 0): read_fixture('edx_course_list.html'),
+        }, default=read_fixture('edx_empty_course_list.html'))
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir)
+
+    def record(self):
+        fetcher = Fetcher(session=RecordingSession(self.live, self.archive))
+        Pipeline([edx.EdxAdapter()], fetcher, update_index=False).run()
+        Course.objects.all().delete()
+
+    def test_replay_serves_recorded_crawl(self):
+        """
+        A recorded crawl replays without touching the live session, with the latency added
+        """
+        self.record()
+        recorded = len(self.live.requested)
+        self.assertEqual(len(self.archive), recorded)
+
+        session = ReplaySession(self.archive, latency=0.01)
+        start = time.time()
+        Pipeline([edx.EdxAdapter()], Fetcher(session=session, workers=1), update_index=False).run()
+        self.assertTrue(time.time() - start >= 0.01 * recorded)
+        self.assertEqual(len(self.live.requested), recorded)
+        self.assertEqual((session.requests, session.misses), (recorded, 0))
+        self.assertEqual(Course.objects.count(), 3)
+
+        missing = session.get('http://example.com/not-recorded')
+        self.assertRaises(requests.HTTPError, missing.raise_for_status)
+
+    def test_ingest_benchmark(self):
+        self.record()
+        result = benchmark([edx.EdxAdapter()], self.archive, latency=0, workers=4)
+        self.assertEqual(result['created'], 3)
+        self.assertEqual(result['misses'], 0)
+        self.assertEqual(result['errors'], 0)
+
+
+def make_record(i, **fields):
+    record = {'name': 'Course %d' % i, 'description': 'About course %d' % i, 'instructor': 'Instructor %d' % i,
+              'url': 'http://example.com/course/%d' % i, 'provider': 'edX', 'source': 'MITx',
+              'subjects': ['computer-science', 'math']}
+    record.update(fields)
+    return record
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        CatalogVersion.objects.create_missing()  # as migrated databases have them
+
+    def test_ingest_creates_courses(self):
+        counts = ingest([make_record(1), make_record(2, source=None, subjects=['social science'])])
+        self.assertEqual(counts, {'created': 2, 'updated': 0, 'unchanged': 0})
+        course = Course.objects.get(url='http://example.com/course/1')
+        self.assertEqual(course.provider.name, 'edX')
+        self.assertEqual(course.source.name, 'MITx')
+        self.assertEqual([subject.name for subject in course.subjects.all()], ['computer', 'math'])
+        self.assertEqual(Course.objects.get(name='Course 2').source, None)
+        self.assertEqual(Subject.objects.count(), 3)
+
+    def test_ingest_matches_courses_by_url(self):
+        """
+        Ingesting a course again updates it in place and adds only the subjects it didn't have
+        """
+        ingest([make_record(1)])
+        counts = ingest([make_record(1, description='New description', subjects=['math', 'physics']),
+                         make_record(2)])
+        self.assertEqual(counts, {'created': 1, 'updated': 1, 'unchanged': 0})
+        self.assertEqual(Course.objects.count(), 2)
+        course = Course.objects.get(url='http://example.com/course/1')
+        self.assertEqual(course.description, 'New description')
+        self.assertEqual(sorted(subject.name for subject in course.subjects.all()), ['computer', 'math', 'physics'])
+        self.assertEqual(ingest([make_record(2)])['unchanged'], 1)
+
+    def test_duplicate_records_are_merged(self):
+        """
+        The same course listed under several subjects ends up as one course with all of them
+        """
+        ingest([make_record(1, subjects=['math']), make_record(1, subjects=['physics'])], batch_size=1)
+        course = Course.objects.get()
+        self.assertEqual(sorted(subject.name for subject in course.subjects.all()), ['math', 'physics'])
+
+        counts = ingest([make_record(1, subjects=['math']), make_record(1, subjects=['physics'])], batch_size=1)
+        self.assertEqual(counts['unchanged'], 2)
+
+    def test_only_changed_courses_are_written(self):
+        """
+        Courses whose fingerprint didn't change are neither written nor reported for reindexing
+        """
+        ingest([make_record(i) for i in range(10)])
+        changed_ids = set()
+        with CaptureQueriesContext(connection) as queries:
+            counts = ingest([make_record(i) for i in range(10)], changed_ids=changed_ids)
+        self.assertEqual(counts, {'created': 0, 'updated': 0, 'unchanged': 10})
+        self.assertEqual(changed_ids, set())
+        self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'INSERT'))])
+
+        records = [make_record(i) for i in range(10)]
+        records[3]['instructor'] = 'Someone else'
+        ingest(records, changed_ids=changed_ids)
+        self.assertEqual(changed_ids, set([Course.objects.get(url=records[3]['url']).id]))
+
+    def test_query_count_does_not_grow_with_courses(self):
+        with CaptureQueriesContext(connection) as few:
+            ingest([make_record(i) for i in range(5)])
+        with CaptureQueriesContext(connection) as many:
+            ingest([make_record(i) for i in range(5, 100)])
+        self.assertEqual(len(many), len(few) - 6)  # providers, sources and subjects now exist
+
+
+class CatalogVersionTests(TestCase):
+    def setUp(self):
+        CatalogVersion.objects.create_missing()
+        cache.clear()
+
+    def changed(self, before):
+        """
+        Returns the names of the versions bumped since the tokens in before
+        """
+        tokens = CatalogVersion.objects.get_tokens()
+        return sorted(name for name in tokens if tokens[name] != before[name])
+
+    def test_bump(self):
+        tokens = CatalogVersion.objects.get_tokens()
+        CatalogVersion.objects.bump('course')
+        self.assertEqual(self.changed(tokens), ['catalog', 'course'])
+        self.assertEqual(CatalogVersion.objects.get(name='course').version, 1)
+
+    def test_bump_creates_missing_versions(self):
+        CatalogVersion.objects.all().delete()
+        CatalogVersion.objects.bump('subject')
+        self.assertEqual(dict(CatalogVersion.objects.values_list('name', 'version')),
+                         {'catalog': 1, 'course': 0, 'subject': 1, 'provider': 0, 'source': 0})
+
+    def test_edits_bump_versions(self):
+        tokens = CatalogVersion.objects.get_tokens()
+        subject = Subject.objects.create(name='math')
+        self.assertEqual(self.changed(tokens), ['catalog', 'subject'])
+
+        course = Course.objects.create(name='Algebra')
+        tokens = CatalogVersion.objects.get_tokens()
+        course.subjects.add(subject)
+        self.assertEqual(self.changed(tokens), ['catalog', 'course'])
+
+        tokens = CatalogVersion.objects.get_tokens()
+        course.delete()
+        self.assertEqual(self.changed(tokens), ['catalog', 'course'])
+
+    def test_ingest_bumps_only_what_changed(self):
+        tokens = CatalogVersion.objects.get_tokens()
+        ingest([make_record(1)])
+        self.assertEqual(self.changed(tokens), ['catalog', 'course', 'provider', 'source', 'subject'])
+
+        tokens = CatalogVersion.objects.get_tokens()
+        ingest([make_record(1)])
+        self.assertEqual(self.changed(tokens), [])
+
+        ingest([make_record(1, description='New description')])
+        self.assertEqual(self.changed(tokens), ['catalog', 'course'])
+
+    def test_deferred_bumps_are_made_once(self):
+        tokens = CatalogVersion.objects.get_tokens()
+        with CatalogVersion.objects.deferred_bumps():
+            subject = Subject.objects.create(name='math')
+            Course.objects.create(name='Algebra').subjects.add(subject)
+            self.assertEqual(self.changed(tokens), [])
+        self.assertEqual(self.changed(tokens), ['catalog', 'course', 'subject'])
+        self.assertEqual(CatalogVersion.objects.get(name='catalog').version, 1)
+
+    def test_deferred_bumps_are_dropped_on_errors(self):
+        tokens = CatalogVersion.objects.get_tokens()
+        with self.assertRaises(IntegrityError):
+            with CatalogVersion.objects.deferred_bumps(), transaction.atomic():
+                Subject.objects.create(name='math')
+                raise IntegrityError
+        self.assertEqual(self.changed(tokens), [])
+        Subject.objects.create(name='physics')
+        self.assertEqual(self.changed(tokens), ['catalog', 'subject'])
+
+    def test_ingest_bumps_after_committing(self):
+        with CaptureQueriesContext(connection) as queries:
+            ingest([make_record(1)])
+        statements = [query['sql'] for query in queries.captured_queries]
+        bump = [i for i, sql in enumerate(statements) if 'UPDATE "courses_catalogversion"' in sql]
+        self.assertEqual(len(bump), 1)
+        # the course was saved, and the savepoint standing in for the transaction of ingest() released before
+        self.assertIn('INSERT INTO "courses_course"', ''.join(statements[:bump[0]]))
+        self.assertIn('RELEASE SAVEPOINT', statements[bump[0] - 2])
+
+    def test_admin_bumps_once_per_save(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        subject = Subject.objects.create(name='math')
+        other = Course.objects.create(name='Geometry')
+        version = CatalogVersion.objects.get(name='catalog').version
+        response = self.client.post('/admin/courses/course/add/', {
+            'name': 'Algebra', 'description': 'Algebra', 'subjects': [subject.id], 'similarCourses': [other.id]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Course.objects.get(name='Algebra').subjects.get(), subject)
+        self.assertEqual(CatalogVersion.objects.get(name='catalog').version, version + 1)
+
+    def test_cached_values_follow_versions(self):
+        built = []
+        build = lambda: built.append(1) or len(built)
+        self.assertEqual(cached('test', build, names=['subject']), 1)
+        self.assertEqual(cached('test', build, names=['subject']), 1)
+        self.assertNotEqual(versioned_key('test', [1]), versioned_key('test', [2]))
+
+        CatalogVersion.objects.bump('course')
+        self.assertEqual(cached('test', build, names=['subject']), 1)
+        CatalogVersion.objects.bump('subject')
+        self.assertEqual(cached('test', build, names=['subject']), 2)
+
+
+class IndexTests(TestCase):
+    """
+    The hot lookups use indexes, going by the query plans of SQLite or PostgreSQL. Some indexes are only
+    built by the migrations, their tests are skipped if the test database wasn't migrated.
+    """
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('no query plans for %s' % connection.vendor)
+        if connection.vendor == 'postgresql':
+            # the tables are tiny, so a sequential scan would always win
+            connection.cursor().execute('SET LOCAL enable_seqscan = off')
+        self.math = Subject.objects.create(name='math')
+        self.course = Course.objects.create(name='Calculus', description='', url='http://example.com/calculus')
+        self.course.subjects.add(self.math)
+
+    def skip_unless_migrated(self):
+        if not MigrationHistory.objects.filter(app_name='accounts', migration__startswith='0003').exists():
+            self.skipTest('the test database was not built by the migrations')
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        else:
+            cursor.execute('EXPLAIN ' + sql, params)
+        return '\n'.join(unicode(row[-1]) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, table, index=None):
+        """
+        Asserts the plan of queryset reads table through an index, or through the given index
+        """
+        plan = self.explain(queryset)
+        index = index or table
+        if connection.vendor == 'sqlite':
+            pattern = r'SEARCH (TABLE )?%s USING (COVERING )?INDEX %s' % (table, index)
+        else:
+            pattern = r'Index (Only )?Scan using %s\S* on %s|Bitmap Index Scan on %s' % (index, table, index)
+        self.assertTrue(re.search(pattern, plan), plan)
+
+    def test_course_url_lookup(self):
+        self.assertUsesIndex(Course.objects.filter(url__in=['http://example.com/calculus', 'http://example.com/2']),
+                             'courses_course')
+
+    def test_subject_name_lookup(self):
+        # get_similar_courses() looks up courses by subject name
+        self.assertUsesIndex(Course.objects.filter(subjects__name='math'), 'courses_subject')
+
+    def test_url_is_unique_unless_blank(self):
+        self.skip_unless_migrated()
+        Course.objects.create(name='Untitled', description='')
+        Course.objects.create(name='Untitled', description='')
+        self.assertRaises(IntegrityError, Course.objects.create, name='Calculus', description='',
+                          url='http://example.com/calculus')
+
+    def test_courses_sharing_a_url_are_merged_into_the_first(self):
+        """
+        The url index migration moves what refers to the later copies of a course over to the first one
+        """
+        if MigrationHistory.objects.filter(app_name='courses', migration__startswith='0006').exists():
+            self.skipTest('the unique url index keeps duplicate courses out')
+        migration = import_module('courses.migrations.0006_auto__add_index_subject_name__add_index_course_name__'
+                                  'add_index_course_url')
+        physics = Subject.objects.create(name='physics')
+        copies = [Course.objects.create(name='Calculus', description='', url=self.course.url) for i in range(2)]
+        copies[0].subjects.add(self.math, physics)
+        copies[1].similarCourses.add(copies[0])
+        profile = UserProfile.objects.create(user=User.objects.create_user(username='owl', password='owl'))
+        profile.enrolled.add(self.course, *copies)
+        profile.disliked.add(copies[1])
+
+        migration.merge_duplicate_courses()
+        self.assertEqual(list(Course.objects.values_list('id', flat=True)), [self.course.id])
+        self.assertEqual(sorted(self.course.subjects.values_list('name', flat=True)), ['math', 'physics'])
+        self.assertEqual(list(profile.enrolled.all()), [self.course])
+        self.assertEqual(list(profile.disliked.all()), [self.course])
+        self.assertEqual(sorted(CourseInteraction.objects.values_list('kind', 'course_id')),
+                         [(CourseInteraction.ENROLLED, self.course.id), (CourseInteraction.DISLIKED, self.course.id)])
+
+    def test_enrolled_users_lookup(self):
+        self.skip_unless_migrated()
+        index = 'accounts_userprofile_enrolled_course_id_' if connection.vendor == 'sqlite' else None
+        self.assertUsesIndex(UserProfile.enrolled.through.objects.filter(course=self.course)
+                             .values_list('userprofile_id', flat=True), 'accounts_userprofile_enrolled', index)
+
+    def test_name_substring_lookup(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('trigram indexes are only built on PostgreSQL')
+        self.skip_unless_migrated()
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if not cursor.fetchall():
+            self.skipTest('pg_trgm is not installed, so the migration skipped the trigram indexes')
+        self.assertUsesIndex(Course.objects.filter(name__icontains='alcul'), 'courses_course',
+                             'courses_course_name_trgm')
+
+
+class FetcherTests(TestCase):
+    def test_retries_server_errors(self):
+        """
+        Server errors are retried until the page comes back
+        """
+        session = FakeSession({'http://example.com/': [FakeResponse(503, ''), FakeResponse(500, ''), 'ok']})
+        fetcher = Fetcher(session=session, retries=3, backoff=0)
+        self.assertEqual(fetcher.get('http://example.com/'), 'ok')
+        self.assertEqual(len(session.requested), 3)
+
+    def test_client_errors_are_not_retried(self):
+        """
+        A missing page fails straight away
+        """
+        session = FakeSession({})
+        fetcher = Fetcher(session=session, retries=3, backoff=0)
+        self.assertRaises(requests.HTTPError, fetcher.get, 'http://example.com/missing')
+        self.assertEqual(len(session.requested), 1)
+
+    def test_requests_to_a_host_are_spaced_out(self):
+        clock = FakeClock()
+        fetcher = Fetcher(session=FakeSession({}, default='ok'), delay=0.05, clock=clock.time, sleep=clock.sleep)
+        fetcher.get('http://example.com/0')
+        clock.now += 0.01
+        for i in range(1, 3):
+            fetcher.get('http://example.com/%d' % i)
+        fetcher.get('http://example.org/')
+        self.assertEqual([round(seconds, 6) for seconds in clock.slept], [0, 0.04, 0.05, 0])
+
+    def test_retries_back_off_exponentially(self):
+        clock = FakeClock()
+        session = FakeSession({'http://example.com/': [FakeResponse(503, ''), FakeResponse(503, ''), 'ok']})
+        fetcher = Fetcher(session=session, retries=3, backoff=1.0, clock=clock.time, sleep=clock.sleep)
+        self.assertEqual(fetcher.get('http://example.com/'), 'ok')
+        self.assertEqual(clock.slept, [1.0, 2.0])
+
+    def test_map_runs_every_item(self):
+        fetcher = Fetcher(session=FakeSession({}), workers=4)
+        self.assertEqual(sorted(fetcher.map(lambda x: x * 2, range(10))), range(0, 20, 2))
+
+
+class HttpCacheTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_not_modified_uses_cached_body(self):
+        """
+        The second fetch sends the validators from the first one, and a 304 serves the cached body
+        """
+        headers = {'ETag': '"v1"', 'Last-Modified': 'Mon, 07 Apr 2014 10:00:00 GMT'}
+        session = FakeSession({'http://example.com/': [FakeResponse(200, 'courses', headers),
+                                                       FakeResponse(304, '')]})
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+
+        first = fetcher.fetch('http://example.com/')
+        self.assertTrue(first.changed)
+        self.assertEqual(session.sent_headers[0], {})
+        fetcher.commit()
+
+        not_modified = session.pages['http://example.com/'][0]
+        second = fetcher.fetch('http://example.com/')
+        self.assertFalse(second.changed)
+        self.assertEqual(second.content, 'courses')
+        self.assertEqual(session.sent_headers[1], {'If-None-Match': '"v1"',
+                                                   'If-Modified-Since': 'Mon, 07 Apr 2014 10:00:00 GMT'})
+        self.assertTrue(not_modified.closed)
+
+    def test_entries_are_only_saved_on_commit(self):
+        """
+        Until what was parsed from a page is saved, the page stays changed, even for a later run
+        """
+        session = FakeSession({}, default='courses')
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+        self.assertTrue(fetcher.fetch('http://example.com/').changed)
+        self.assertTrue(fetcher.fetch('http://example.com/').changed)
+        fetcher.discard()
+        self.assertTrue(Fetcher(session=session, cache_dir=self.cache_dir).fetch('http://example.com/').changed)
+
+        fetcher.fetch('http://example.com/')
+        fetcher.commit()
+        self.assertFalse(fetcher.fetch('http://example.com/').changed)
+
+    def test_failed_run_fetches_pages_again(self):
+        """
+        A Coursera run that fails while saving the topic list doesn't leave it cached as unchanged
+        """
+        session = FakeSession({}, default=read_fixture('../testCourse.json')[:-10])  # cut off
+        self.assertRaises(ValueError, coursera.run, Fetcher(session=session, cache_dir=self.cache_dir))
+        self.assertEqual(Course.objects.count(), 0)
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+        self.assertTrue(fetcher.fetch(coursera.topic_list_url).changed)
+
+    def test_same_body_is_unchanged(self):
+        """
+        Servers that ignore conditional requests still get detected by the hash of the body
+        """
+        session = FakeSession({'http://example.com/': ['courses', 'courses', 'new courses']})
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+        self.assertTrue(fetcher.fetch('http://example.com/').changed)
+        fetcher.commit()
+        self.assertFalse(fetcher.fetch('http://example.com/').changed)
+        fetcher.commit()
+
+        page = fetcher.fetch('http://example.com/')
+        self.assertTrue(page.changed)
+        self.assertEqual(page.content, 'new courses')
+
+    def test_unchanged_edx_pages_are_skipped(self):
+        """
+        A second crawl of the same pages doesn't parse anything again, and still stops at the empty page
+        """
+        session = FakeSession({edx.subject_page_url('economics-finance', 0): read_fixture('edx_course_list.html')},
+                              default=read_fixture('edx_empty_course_list.html'))
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+        self.assertEqual(len(list(edx.crawl_subject('economics-finance', fetcher))), 3)
+        fetcher.commit()
+        self.assertEqual(list(edx.crawl_subject('economics-finance', fetcher)), [])
+        self.assertEqual(len(session.requested), 4)
+
+    def test_pipeline_commits_pages_once_saved(self):
+        session = FakeSession({edx.subject_page_url('economics-finance', 0): read_fixture('edx_course_list.html')},
+                              default=read_fixture('edx_empty_course_list.html'))
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+        Pipeline([edx.EdxAdapter()], fetcher, update_index=False).run()
+        self.assertEqual(Course.objects.count(), 3)
+        self.assertFalse(fetcher.fetch(edx.subject_page_url('economics-finance', 0)).changed)
+
+    def test_unchanged_pages_are_not_counted_as_downloaded(self):
+        session = FakeSession({edx.subject_page_url('economics-finance', 0): read_fixture('edx_course_list.html')},
+                              default=read_fixture('edx_empty_course_list.html'))
+        fetcher = Fetcher(session=session, cache_dir=self.cache_dir)
+        Pipeline([edx.EdxAdapter()], fetcher, update_index=False).run()
+        session.pages, session.default = {}, FakeResponse(304, '')
+        pipeline = Pipeline([edx.EdxAdapter()], fetcher, update_index=False)
+        pipeline.run()
+        self.assertTrue(pipeline.stats['edx']['pages'] > 0)
+        self.assertEqual(pipeline.stats['edx']['bytes'], 0)
+
+
 class RecommenderTestsNormalCase(TestCase):
     def setUp(self):
         # Create three fake users and two fake courses
@@ -195,6 +1050,18 @@ class RecommenderTestsNormalCase(TestCase):
         self.assertEqual(similar_user, self.user_profile_3)
         self.assertEqual(numb, 2)
 
+    def test_load_interactions(self):
+        interactions = load_interactions()
+        self.assertEqual(interactions[CourseInteraction.DISLIKED][self.user_profile_2.id],
+                         set([self.course_math.id, self.course_english.id]))
+        self.assertNotIn(self.user_profile_2.id, interactions[CourseInteraction.COMPLETED])
+        self.assertEqual(load_interactions([CourseInteraction.ENROLLED]), {CourseInteraction.ENROLLED: {}})
+
+        since = timezone.now()
+        self.user_profile_2.completed.add(self.course_math)
+        self.assertEqual(load_interactions(since=since)[CourseInteraction.COMPLETED],
+                         {self.user_profile_2.id: set([self.course_math.id])})
+
 
 class IversityScriptTests(TestCase):
     def test_add_to_django(self):
@@ -242,3 +1109,243 @@ class UnifySubjectNameTests(TestCase):
         self.assertEqual(unify_subject_name(name_3), 'physical')
         self.assertEqual(unify_subject_name(name_4), 'beatles')
 
+
+class SubjectResolverTests(TestCase):
+    def setUp(self):
+        for name in ('math', 'Mathematics', 'physics'):
+            Subject.objects.create(name=name)
+
+    def test_resolve_creates_missing_subjects_in_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            resolver = SubjectResolver()
+            resolver.resolve([resolver.unify(name) for name in ('math-algebra', 'cs-ai', 'cs', 'law school')])
+        # one query to load the names, one insert and one to read the new ids back
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(resolver.get('math'), Subject.objects.get(name='math').id)
+        self.assertEqual(resolver.name(resolver.get('law')), 'law')
+        self.assertEqual(Subject.objects.count(), 5)
+
+    def test_unify_is_remembered(self):
+        resolver = SubjectResolver()
+        self.assertEqual(resolver.unify('cs-ai'), 'cs')
+        self.assertEqual(resolver._unified, {'cs-ai': 'cs'})
+
+    def test_related(self):
+        resolver = SubjectResolver()
+        related = sorted(resolver.name(id) for id in resolver.related('math-calculus'))
+        self.assertEqual(related, ['Mathematics', 'math'])
+        self.assertEqual([subject['name'] for subject in resolver.subjects()], ['Mathematics', 'math', 'physics'])
+
+    def test_process_keeps_one_resolver_until_subjects_change(self):
+        resolver = get_subject_resolver()
+        with self.assertNumQueries(1):  # the catalog versions
+            self.assertIs(get_subject_resolver(), resolver)
+        Subject.objects.create(name='law')
+        self.assertIsNot(get_subject_resolver(), resolver)
+        self.assertIsNotNone(get_subject_resolver().get('law'))
+
+    def test_subjects_sharing_a_name_are_all_kept(self):
+        duplicate = Subject.objects.create(name='math')
+        resolver = SubjectResolver()
+        self.assertEqual(resolver.get('math'), Subject.objects.filter(name='math').order_by('id')[0].id)
+        self.assertIn(duplicate.id, resolver.related('math'))
+        self.assertEqual([subject['name'] for subject in resolver.subjects()],
+                         ['Mathematics', 'math', 'math', 'physics'])
+
+    def test_ingest_resolves_subjects_once_per_run(self):
+        """
+        A pipeline loads the subjects once, not once per batch
+        """
+        adapter = FakeAdapter('edx', {'math': [make_record(i, subjects=['math']) for i in range(10)]})
+        with CaptureQueriesContext(connection) as queries:
+            Pipeline([adapter], Fetcher(session=FakeSession({})), batch_size=2, update_index=False).run()
+        subject_loads = [query for query in queries.captured_queries
+                         if 'FROM "courses_subject"' in query['sql'] and 'INSERT' not in query['sql']]
+        self.assertEqual(len(subject_loads), 1)
+
+
+class PersistentWhooshSearchBackendTests(TestCase):
+    def setUp(self):
+        self.index_path = tempfile.mkdtemp()
+        self.backend = PersistentWhooshSearchBackend('default', PATH=self.index_path)
+        self.course = Course.objects.create(name='Intro to Pottery', description='Learn to make pots')
+
+    def tearDown(self):
+        self.backend.index.close()
+        shutil.rmtree(self.index_path)
+
+    def test_searcher_is_reused_until_index_changes(self):
+        """
+        Repeated searches share one searcher, and an index update causes exactly one reopen
+        """
+        self.backend.warm_up()
+        self.backend.update(CourseIndex(), [self.course])
+        before = get_search_stats()
+
+        self.assertEqual(self.backend.search(u'pottery')['hits'], 1)
+        self.assertEqual(self.backend.search(u'pots')['hits'], 1)
+        after = get_search_stats()
+        self.assertEqual(after['searcher_opens'], before['searcher_opens'])
+        self.assertEqual(after['searcher_reopens'], before['searcher_reopens'] + 1)
+        self.assertEqual(after['queries'], before['queries'] + 2)
+
+        self.backend.search(u'pottery')
+        self.assertEqual(get_search_stats()['searcher_reopens'], after['searcher_reopens'])
+
+    def test_after_fork_opens_a_new_searcher(self):
+        self.backend.update(CourseIndex(), [self.course])
+        self.backend.warm_up()
+        before = get_search_stats()
+        self.backend.after_fork()
+        self.assertEqual(get_search_stats()['searcher_opens'], before['searcher_opens'] + 1)
+        self.assertEqual(self.backend.search(u'pottery')['hits'], 1)
+
+
+class WhooshThreadSafetyTests(TestCase):
+    def setUp(self):
+        self.index_path = tempfile.mkdtemp()
+        self.backend = PersistentWhooshSearchBackend('default', PATH=self.index_path)
+
+    def tearDown(self):
+        self.backend.index.close()
+        shutil.rmtree(self.index_path)
+
+    def test_searches_from_threads(self):
+        """
+        Whoosh caches stored fields in one dict for every reader. Threads searching at the same time must
+        not evict each other's entries, which raised KeyError.
+        """
+        words = ['pottery', 'painting', 'poetry', 'physics']
+        Course.objects.bulk_create([Course(name='%s %d' % (words[i % 4], i), description='course %d' % i)
+                                    for i in range(400)])
+        self.backend.update(CourseIndex(), Course.objects.all())
+        errors = []
+
+        def search(seed):
+            rand = random.Random(seed)
+            try:
+                for i in range(20):
+                    self.assertEqual(self.backend.search(rand.choice(words))['hits'], 100)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=search, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class MemorySearchBackendTests(TestCase):
+    def setUp(self):
+        self.pottery = Course.objects.create(name='Intro to Pottery', description='Learn to make pots')
+        self.advanced = Course.objects.create(name='Advanced Pottery', description='Pottery for people who love pottery')
+        self.backend = MemorySearchBackend('default')
+        self.backend.setup()
+
+    def test_search_ranks_with_bm25(self):
+        """
+        Every query term has to match, and the course mentioning pottery most often comes first
+        """
+        results = self.backend.search(u'pottery')
+        self.assertEqual(results['hits'], 2)
+        self.assertEqual(results['results'][0].pk, self.advanced.pk)
+
+        results = self.backend.search(u'intro pottery')
+        self.assertEqual(results['hits'], 1)
+        self.assertEqual(results['results'][0].pk, self.pottery.pk)
+        self.assertEqual(self.backend.search(u'painting')['hits'], 0)
+
+    def test_ngram_query_matches_trigrams(self):
+        """
+        Misspelled names still match by their trigrams, the closest name first
+        """
+        results = self.backend.search(u'', ngram_query=[('name_trigrams', u'potery intro')])
+        self.assertEqual(results['hits'], 2)
+        self.assertEqual(results['results'][0].pk, self.pottery.pk)
+        self.assertEqual(self.backend.search(u'', ngram_query=[('name_trigrams', u'xyz')])['hits'], 0)
+
+    def test_update_and_remove_swap_snapshot(self):
+        """
+        Updating and removing documents replaces the snapshot instead of changing it in place, once,
+        on the next search
+        """
+        old_snapshot = self.backend.snapshot
+        painting = Course.objects.create(name='Painting', description='Learn to paint')
+        drawing = Course.objects.create(name='Drawing', description='Learn to draw')
+        self.backend.update(CourseIndex(), [painting])
+        self.backend.update(CourseIndex(), [drawing])
+        self.assertTrue(self.backend.snapshot is old_snapshot)
+        self.assertEqual(self.backend.search(u'painting')['hits'], 1)
+        self.assertEqual(self.backend.search(u'drawing')['hits'], 1)
+        self.assertEqual(len(old_snapshot), 2)
+        self.assertEqual(len(self.backend.snapshot), 4)
+
+        self.backend.remove(self.pottery)
+        self.assertEqual(self.backend.search(u'pottery')['hits'], 1)
+
+    def test_rebuilds_when_catalog_changes(self):
+        """
+        Courses saved elsewhere, without updating this backend, show up once the catalog version is checked
+        """
+        self.assertEqual(self.backend.search(u'painting')['hits'], 0)
+        Course.objects.create(name='Painting', description='Learn to paint')
+        self.assertEqual(self.backend.search(u'painting')['hits'], 0)  # results of the snapshot are kept
+
+        self.backend.checked_at = 0
+        self.assertEqual(self.backend.search(u'painting')['hits'], 1)
+        with self.assertNumQueries(0):
+            self.backend.search(u'painting')
+
+
+class LoadTestTests(LiveServerTestCase):
+    def setUp(self):
+        # the login page needs the site and its social login apps
+        site, created = Site.objects.get_or_create(id=settings.SITE_ID, defaults={'domain': 'courseowl.com',
+                                                                                 'name': 'CourseOwl'})
+        for provider in ('facebook', 'google'):
+            SocialApp.objects.create(provider=provider, name=provider, client_id='id', secret='secret').sites.add(site)
+
+    def test_seed(self):
+        self.assertEqual(seed(40, 5, batch_size=16), (40, 5))
+        self.assertEqual(Course.objects.filter(subjects__isnull=False).count(), 80)
+        profile = UserProfile.objects.get(user__email='user0@loadtest.example.com')
+        self.assertEqual((profile.enrolled.count(), profile.completed.count(), profile.disliked.count()), (8, 4, 3))
+        self.assertEqual(CourseInteraction.objects.count(), 5 * 15)
+
+    def test_seed_options_are_checked(self):
+        with self.settings(DEBUG=True):
+            self.assertRaises(CommandError, call_command, 'loadtest', 'seed', courses=10, users=5)
+            self.assertRaises(CommandError, call_command, 'loadtest', 'seed', courses=40, users=0)
+        self.assertEqual(Course.objects.count(), 0)
+
+    def test_run(self):
+        seed(40, 5)
+        loadtest = LoadTest(self.live_server_url, workers=2, num_requests=30,
+                            mix={'login': 1, 'profile': 1, 'course_info': 1, 'enroll': 1, 'drop': 1})
+        stats = loadtest.run()
+        self.assertEqual(stats['total']['requests'], 30)
+        self.assertEqual(stats['total']['errors'], 0)
+        self.assertEqual(len(format_report(stats)), 6)
+
+
+class SearchBenchmarkTests(TestCase):
+    def test_percentile(self):
+        """
+        Percentiles use the nearest rank, so they are always one of the measured values
+        """
+        latencies = range(1, 101)
+        self.assertEqual(percentile(latencies, 50), 50)
+        self.assertEqual(percentile(latencies, 95), 95)
+        self.assertEqual(percentile(latencies, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 99), 0)  # a run where every query failed
+
+    def test_query_log(self):
+        """
+        The recorded query log has no blank lines
+        """
+        queries = load_query_log(QUERY_LOG)
+        self.assertTrue(len(queries) > 0)
+        self.assertNotIn('', queries)
@@ -12,6 +12,9 @@ RSYNC_EXCLUDE = (
     '*.example',
     'media/',
     'whoosh_index/',
+    'scraper_cache/',
+    'scraper_archive/',
+    'ingest_log.json',
     '.idea/',
     '*.so',
     '*.o'
@@ -49,7 +52,8 @@ def deploy():
 
 def uwsgi_supervisord_restart():
     """
-    Restart uWSGI on remote host.
+    Restart uWSGI on remote host. The master warms the application up before it forks the workers,
+    see courseowl_django/wsgi.py, and logs how long each phase took.
     """
     require('root', provided_by='courseowl_http')
     run('sudo /usr/bin/supervisorctl restart courseowl_uwsgi')
@@ -1,14 +1,29 @@
 import os
 from django.core.management import call_command
-from django.test import TestCase, Client
-from django.test.utils import override_settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import TestCase, TransactionTestCase, Client
+from django.db import connection
+from django.test.utils import override_settings, CaptureQueriesContext
 from django.conf import settings
 import haystack
+import json
+import time
+from accounts.models import UserProfile, User
+from courseowl_django import replicas
+from courseowl_django.tests.budgets import QueryBudgetMixin
+from courseowl_django.profiling import get_view_stats, query_shape, reset_view_stats, summarize_queries
+from courseowl_django.replicas import ReplicaRouter, PIN_COOKIE, measure_lag, replica_reads, reset_state
+from courseowl_django.warmup import PHASES, prime_catalog, startup_times, warm_up
+from courses.catalog import get_subject_names
+from courses.models import Course, Subject
+from courses.scripts.search_benchmark import search_index
+from courses.subjects import get_subject_resolver
+from website.urls import urlpatterns
 
 
 TEST_INDEX = {
     'default': {
-        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        'ENGINE': 'courses.search_backends.PersistentWhooshEngine',
         'TIMEOUT': 60 * 10,
         'INDEX_NAME': 'test_index',
         'PATH': os.path.join(settings.BASE_DIR, 'test_index'),
@@ -73,3 +88,253 @@ class SearchTests(TestCase):
         response = self.c.get('/search/', {'q': 'udacity'})
         self.assertEquals(response.status_code, 200)
         self.assertTrue('Artificial Intelligence for Robotics' in response.content)
+
+    def test_search_misspelled(self):
+        """
+        Search for the misspelled phrase 'machne lerning':
+        there are no exact matches, so 'Machine Learning' should be suggested and shown
+        """
+        response = self.c.get('/search/', {'q': 'machne lerning'})
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.context['fuzzy'])
+        self.assertEquals(response.context['did_you_mean'], 'Machine Learning')
+        self.assertTrue('Did you mean' in response.content)
+
+    def test_search_no_fuzzy_when_matched(self):
+        """
+        Queries with exact matches shouldn't fall back to fuzzy matching
+        """
+        response = self.c.get('/search/', {'q': 'computer'})
+        self.assertFalse(response.context['fuzzy'])
+        self.assertIsNone(response.context['did_you_mean'])
+
+    def count_search_queries(self, q):
+        """
+        Returns how many database queries a search for q makes
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.c.get('/search/', {'q': q})
+        self.assertEquals(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_search_query_count_is_constant(self):
+        """
+        A full page of results should cost the same number of queries as a single result
+        """
+        self.count_search_queries('andrew ng')  # the first request opens the session
+        self.assertEquals(self.count_search_queries('andrew ng'), self.count_search_queries('learning'))
+
+
+class MemorySearchTests(TestCase):
+    fixtures = ['website/fixtures/courses.json']
+
+    def setUp(self):
+        self.c = Client()
+        index = search_index('memory')
+        index.__enter__()
+        self.addCleanup(index.__exit__, None, None, None)
+        call_command('rebuild_index', interactive=False, verbosity=0)
+
+    def test_search_misspelled(self):
+        """
+        The in-memory engine matches the trigram fields too, so misspelled searches still suggest a course
+        """
+        response = self.c.get('/search/', {'q': 'machne lerning'})
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.context['fuzzy'])
+        self.assertEquals(response.context['did_you_mean'], 'Machine Learning')
+
+    def test_search_no_fuzzy_when_matched(self):
+        """
+        Queries with exact matches still go through the plain term index
+        """
+        response = self.c.get('/search/', {'q': 'computer'})
+        self.assertFalse(response.context['fuzzy'])
+        self.assertTrue('Intro to Computer Science' in response.content)
+
+
+class SubjectPreferencesTests(TestCase):
+    def setUp(self):
+        self.c = Client()
+        self.user = User.objects.create_user(username='owl', password='owl123456')
+        self.user_profile = UserProfile.objects.create(user=self.user)
+        self.physics = Subject.objects.create(name='physics')
+        self.math = Subject.objects.create(name='math')
+        self.c.login(username='owl', password='owl123456')
+
+    def test_save_preferences(self):
+        """
+        Posted subjects replace the user's interests, ids of subjects that don't exist are dropped
+        """
+        self.user_profile.interests.add(self.physics)
+        response = self.c.post('/subject_preferences', {'subject_ids': json.dumps([self.math.id, 1000])})
+        self.assertEquals(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith('/course_preferences'))
+        self.assertEquals(list(self.user_profile.interests.all()), [self.math])
+
+    def test_show_preferences(self):
+        self.user_profile.interests.add(self.physics)
+        response = self.c.get('/subject_preferences')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.context['liked_subjects'], [{'id': self.physics.id, 'name': 'physics'}])
+        self.assertEquals(response.context['subjects'], [{'id': self.math.id, 'name': 'math'}])
+
+    def test_subjects_sharing_a_name_can_all_be_chosen(self):
+        other_math = Subject.objects.create(name='math')
+        self.c.post('/subject_preferences', {'subject_ids': json.dumps([self.math.id, other_math.id])})
+        self.assertEquals(sorted(self.user_profile.interests.values_list('id', flat=True)),
+                          [self.math.id, other_math.id])
+        response = self.c.get('/subject_preferences')
+        self.assertEquals(len(response.context['liked_subjects']), 2)
+
+
+class ReplicaTests(TestCase):
+    def setUp(self):
+        self.c = Client()
+        self.router = ReplicaRouter()
+        replicas._lags.clear()
+        reset_state()
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_reads_go_to_replica_until_a_write(self):
+        replicas._lags['replica'] = (0.0, time.time())
+        self.assertEquals(self.router.db_for_read(Course), None)
+        with replica_reads():
+            self.assertEquals(self.router.db_for_read(Course), 'replica')
+            self.assertEquals(self.router.db_for_write(Course), 'default')
+            self.assertEquals(self.router.db_for_read(Course), None)
+
+    @override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG=30)
+    def test_lagging_replicas_are_skipped(self):
+        replicas._lags['replica'] = (60.0, time.time())
+        with replica_reads():
+            self.assertEquals(self.router.db_for_read(Course), None)
+
+    def test_measure_lag(self):
+        self.assertEquals(measure_lag('default'), 0.0)
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_requests_report_replica_and_lag(self):
+        """
+        The primary listed as its own replica is never behind
+        """
+        response = self.c.get('/api/subjects/')
+        self.assertEquals(response['X-Replica'], 'default')
+        self.assertEquals(response['X-Replica-Lag'], '0.000')
+        self.assertFalse(PIN_COOKIE in response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_writes_pin_to_primary(self):
+        user = User.objects.create_user(username='owl', password='owl123456')
+        UserProfile.objects.create(user=user)
+        subject = Subject.objects.create(name='math')
+        self.c.login(username='owl', password='owl123456')
+        response = self.c.post('/api/like_subject/', {'liked_subject': subject.id})
+        self.assertTrue(PIN_COOKIE in response.cookies)
+
+        response = self.c.get('/api/subjects/')
+        self.assertFalse(response.has_header('X-Replica'))
+
+
+@override_settings(PROFILE_QUERY_SAMPLE_RATE=1.0)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.c = Client()
+        reset_view_stats()
+        Course.objects.create(name='Pottery')
+
+    def test_query_shape(self):
+        self.assertEquals(query_shape("SELECT * FROM t WHERE id = 12 AND name = 'it''s' AND x IN (1, 2, 3)"),
+                          'SELECT * FROM t WHERE id = ? AND name = ? AND x IN (?)')
+
+    def test_duplicate_queries_are_counted(self):
+        queries = [{'sql': 'SELECT * FROM t WHERE id = %d' % i, 'time': '0.010'} for i in range(3)]
+        queries.append({'sql': 'SELECT * FROM u', 'time': '0.020'})
+        count, db_time, duplicates, worst = summarize_queries(queries)
+        self.assertEquals((count, duplicates), (4, 2))
+        self.assertAlmostEquals(db_time, 0.05)
+        self.assertEquals(worst, ('SELECT * FROM t WHERE id = ?', 3))
+        self.assertEquals(query_shape("QUERY = u'SELECT * FROM t WHERE id = %s' - PARAMS = (3,)"),
+                          'SELECT * FROM t WHERE id = %s')
+
+    def test_requests_are_recorded_per_view(self):
+        first = self.c.get('/api/courses/')
+        self.c.get('/api/courses/')
+        stats = get_view_stats()['views']['api_courses']
+        self.assertEquals(stats['requests'], 2)
+        self.assertTrue(stats['queries'] >= 1)
+        self.assertEquals(stats['avg_bytes'], len(first.content))
+        self.assertEquals(stats['profile'], None)
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.c.get('/search/')
+        self.assertEquals(get_view_stats()['views']['haystack_search']['requests'], 1)
+
+    @override_settings(PROFILE_QUERY_SAMPLE_RATE=0.0)
+    def test_queries_are_only_logged_for_sampled_requests(self):
+        self.c.get('/api/courses/')
+        stats = get_view_stats()['views']['api_courses']
+        self.assertEquals((stats['requests'], stats['query_samples'], stats['queries']), (1, 0, 0))
+        self.assertEquals(stats['avg_queries'], 0)
+        self.assertEquals(connection.use_debug_cursor, None)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_profiled(self):
+        self.c.get('/api/courses/')
+        stats = get_view_stats()['views']['api_courses']
+        self.assertEquals(stats['profiles'], 1)
+        self.assertTrue(any('json_courses' in line[0] for line in stats['profile']))
+
+    def test_stats_are_for_staff_only(self):
+        User.objects.create_user(username='owl', password='owl123456')
+        self.c.login(username='owl', password='owl123456')
+        self.assertEquals(self.c.get('/api/profiling_stats/').status_code, 302)
+
+        User.objects.filter(username='owl').update(is_staff=True)
+        self.c.get('/api/courses/')
+        response = self.c.get('/api/profiling_stats/')
+        stats = json.loads(response.content)
+        self.assertEquals(stats['views']['api_courses']['requests'], 1)
+        self.assertTrue('queries' in stats['search'])
+
+
+class WarmupTests(TransactionTestCase):
+    def setUp(self):
+        Subject.objects.create(name='Pottery')
+
+    def test_every_phase_is_timed(self):
+        application = WSGIHandler()
+        times = warm_up(application)
+        self.assertEquals([name for name, seconds in times], [name for name, phase in PHASES])
+        self.assertEquals(times, startup_times)
+        self.assertTrue(application._request_middleware is not None)
+
+        # only the catalog versions are read, the rest was cached by the warm up
+        with self.assertNumQueries(1):
+            self.assertEquals(get_subject_names(), ['Pottery'])
+        with self.assertNumQueries(1):
+            self.assertEquals(get_subject_resolver().subjects()[0]['name'], 'Pottery')
+
+    def test_failed_phase_is_skipped(self):
+        def broken(application):
+            raise ValueError('broken')
+        times = warm_up(WSGIHandler(), phases=(('broken', broken), ('catalog', prime_catalog)))
+        self.assertEquals([name for name, seconds in times], ['broken', 'catalog'])
+        with self.assertNumQueries(1):
+            get_subject_names()
+
+
+class WebsiteQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlpatterns = urlpatterns
+
+    def get_budgets(self):
+        subject_ids = list(Subject.objects.values_list('id', flat=True)[:5])
+        course_ids = list(Course.objects.values_list('id', flat=True)[:20])
+        return [
+            ('website_index', 'get', None, 4),
+            ('website_personalize', 'get', None, 7),
+            ('website_subject_preferences', 'get', None, 7),
+            ('website_subject_preferences', 'post', {'subject_ids': json.dumps(subject_ids)}, 10),
+            ('website_course_preferences', 'get', None, 8),
+            ('website_course_preferences', 'post', {'course_ids': json.dumps(course_ids)}, 13),
+        ]
@@ -1,7 +1,11 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from courses.models import Subject, Course
+from haystack.query import SearchQuerySet, SQ
+from haystack.views import SearchView
+from courses.models import Course
+from courses.subjects import get_subject_resolver
 from accounts.models import UserProfile
+from courseowl_django.replicas import replica_reads
 import json
 
 
@@ -25,25 +29,24 @@ def subject_preferences(request):
     On POST, save a user's subject preferences. On GET, generate all liked subjects and render the personalize page.
     """
     user_profile = UserProfile.objects.get(user=request.user)
+    resolver = get_subject_resolver()
 
     if request.method == 'POST':
-        subject_ids = json.loads(request.POST.get('subject_ids'))
+        # Ids of subjects that don't exist are dropped
+        subject_ids = [int(sub_id) for sub_id in json.loads(request.POST.get('subject_ids'))
+                       if resolver.name(int(sub_id)) is not None]
         if user_profile.interests:
             # The subject preferences that we get from this page are definitive and not additive
             user_profile.interests.clear()
         # Save subjects to user's profile
-        for sub_id in subject_ids:
-            subject = Subject.objects.get(id=sub_id)
-            user_profile.interests.add(subject)
+        user_profile.interests.add(*subject_ids)
         user_profile.save()
         return redirect('/course_preferences')
 
-    liked_subjects = user_profile.interests.all()
-    # Construct a flat list of ids to exclude from all subjects
-    unliked = Subject.objects.exclude(id__in=liked_subjects.values_list('id', flat=True))
+    liked_ids = set(user_profile.interests.values_list('id', flat=True))
     context = {
-        'liked_subjects': liked_subjects.order_by('name'),
-        'subjects': unliked.order_by('name')
+        'liked_subjects': resolver.subjects(liked_ids),
+        'subjects': resolver.subjects(set(resolver.names) - liked_ids)
     }
     return render(request, 'website/personalize_subjects.html', context)
 
@@ -59,8 +62,8 @@ def course_preferences(request):
         course_ids = json.loads(request.POST.get('course_ids'))
         if user_profile.enrolled:
             user_profile.enrolled.clear()
-        for course in course_ids:
-            user_profile.enrolled.add(Course.objects.get(id=course))
+        # Ids of courses that don't exist are dropped
+        user_profile.enrolled.add(*Course.objects.filter(id__in=course_ids))
         user_profile.save()
         return redirect('/accounts/profile/')
 
@@ -70,3 +73,38 @@ def course_preferences(request):
         'enrolled': user_profile.enrolled.all().order_by('name')
     }
     return render(request, 'website/personalize_courses.html', context)
+
+
+class CourseSearchView(SearchView):
+    """
+    Course search that falls back to matching course and subject names by trigrams when a query has
+    no results, so misspelled queries still find something. The best fuzzy match is suggested as
+    "did you mean".
+    """
+    fuzzy = False
+
+    def __call__(self, request):
+        with replica_reads():  # including loading the courses of the results
+            return super(CourseSearchView, self).__call__(request)
+
+    def build_page(self):
+        paginator, page = super(CourseSearchView, self).build_page()
+        self.fuzzy = False
+        if self.query and paginator.count == 0:
+            self.fuzzy = True
+            self.results = fuzzy_search(self.query)
+            paginator, page = super(CourseSearchView, self).build_page()
+        return paginator, page
+
+    def extra_context(self):
+        suggestion = None
+        if self.fuzzy and self.results:
+            suggestion = self.results[0].object.name
+        return {'fuzzy': self.fuzzy, 'did_you_mean': suggestion}
+
+
+def fuzzy_search(query):
+    """
+    Returns courses whose name or subjects share trigrams with each word of the query, best match first
+    """
+    return SearchQuerySet().load_all().filter(SQ(name_trigrams=query) | SQ(subject_trigrams=query))